@@ -1,15 +1,119 @@
+import os
+import json
 import time
+import random
 import datetime
-import requests
-import numpy as np
-from support import logger
+import threading
+import contextvars
+from os.path import exists
+from concurrent.futures import ThreadPoolExecutor
+import client
+import tracing
+from support import logger, to_epoch
 from bs4 import BeautifulSoup
 
-def date_convert(time_str:str)->datetime:
+def date_convert(time_str:str)->int:
     dateOb = datetime.datetime.strptime(time_str, "%a, %d %b %Y %H:%M:%S %Z")
-    return dateOb
+    #Stored as UTC epoch seconds
+    return to_epoch(dateOb)
 
-def get_articles(result:BeautifulSoup, cat:str, source:str, NewArticle)->list:
+def is_publish_day(dt:datetime.datetime)->bool:
+    """AILA only posts the daily news clips on weekdays"""
+    return dt.weekday() < 5
+
+################################# Backfill ####################################
+#Each weekday has its own clips page, so a day the job didn't run (or the page
+#wasn't up yet) is fetched on a later run.  Weekdays in the last BACKFILL_DAYS
+#without a stored AILA article are fetched along with today's page.  The day
+#pages go out on a small pool, the politeness scheduler still spaces out when
+#each request starts so the pool only overlaps response time.  Days are local
+#dates, the same calendar the job runs on.  A page can go up late, so a 404 only
+#counts once the day is GRACE_DAYS old.  After that the day is taken as one AILA
+#didn't post (a federal holiday) and is remembered in GONE_FP so it isn't asked
+#for again on every run.
+BACKFILL_DAYS = 14
+BACKFILL_WORKERS = 2
+GRACE_DAYS = 2
+GONE_FP = "./data/aila_gone.json"
+#Days found missing by plan_backfill, fetched by the next ingest_xml
+BACKFILL = []
+
+#FUNCTION Day URL
+def day_url(day:datetime.date)->str:
+    return f"https://www.aila.org/library/daily-immigration-news-clips-{day.strftime('%B').lower()}-{day.day}-{day.year}"
+
+#CLASS Gone Days
+class GoneDays():
+    """Weekdays whose page still wasn't there after GRACE_DAYS, persisted to
+    disk between runs
+
+    Args:
+        fp (str, optional): path of the on disk list. Defaults to GONE_FP.
+    """
+    def __init__(self, fp:str=GONE_FP):
+        self.fp = fp
+        self.days = set()
+        self.lock = threading.Lock()
+        if exists(fp):
+            try:
+                with open(fp, "r") as f:
+                    self.days = {datetime.date.fromisoformat(day) for day in json.loads(f.read())}
+            except (OSError, ValueError) as e:
+                logger.warning(f"Couldn't read {fp}, AILA gone days start empty. {e}")
+
+    def __contains__(self, day:datetime.date)->bool:
+        return day in self.days
+
+    def add(self, day:datetime.date):
+        with self.lock:
+            self.days.add(day)
+
+    def save(self, today:datetime.date, lookback:int=BACKFILL_DAYS):
+        """Atomically writes the days still inside the lookback window"""
+        with self.lock:
+            self.days = {day for day in self.days if (today - day).days <= lookback}
+            tmp = self.fp + ".tmp"
+            with open(tmp, "w") as out_f:
+                out_f.write(json.dumps(sorted(day.isoformat() for day in self.days)))
+            os.replace(tmp, self.fp)
+
+GONE = GoneDays(GONE_FP)
+
+#FUNCTION Missing Days
+def missing_days(pub_dates:list, today:datetime.date, lookback:int=BACKFILL_DAYS, gone:set=())->list:
+    """Weekdays before today with no stored article
+
+    Args:
+        pub_dates (list): UTC epoch pub_dates of stored AILA articles
+        today (datetime.date): current local date
+        lookback (int, optional): days to look back. Defaults to BACKFILL_DAYS.
+        gone (set, optional): days known to have no page. Defaults to ().
+
+    Returns:
+        days (list): missing dates, oldest first
+    """
+    stored = {datetime.datetime.fromtimestamp(x).date() for x in pub_dates if x is not None}
+    days = [today - datetime.timedelta(days=n) for n in range(lookback, 0, -1)]
+    return [day for day in days if is_publish_day(day) and day not in stored and day not in gone]
+
+#FUNCTION Plan Backfill
+def plan_backfill(history:dict, source:str="https://www.aila.org", cat:str="AILA Daily News Update", lookback:int=BACKFILL_DAYS):
+    """Works out which recent weekdays are missing from the store so the
+    next ingest_xml fetches them too
+
+    Args:
+        history (dict): (source, category) -> pub_dates, from the store's feed_history
+        source (str, optional): AILA source address. Defaults to "https://www.aila.org".
+        cat (str, optional): AILA category. Defaults to "AILA Daily News Update".
+        lookback (int, optional): days to look back. Defaults to BACKFILL_DAYS.
+    """
+    global BACKFILL
+    today = datetime.date.today()
+    BACKFILL = missing_days(history.get((source, cat), []), today, lookback, GONE)
+    if BACKFILL:
+        logger.info(f"AILA backfill for {', '.join(str(day) for day in BACKFILL)}")
+
+def get_articles(result:BeautifulSoup, cat:str, source:str, NewArticle, pub_date:int=None)->list:
     """[Ingest XML of summary page for articles info]
 
     Args:
@@ -17,6 +121,7 @@ def get_articles(result:BeautifulSoup, cat:str, source:str, NewArticle)->list:
         cat (str): category being searched
         source (str): source website
         NewArticle (dataclass) : Dataclass object for NewsArticle
+        pub_date (int, optional): the page's date.  Defaults to None (now).
 
     Returns:
         articles (list): [List of NewArticle objects]
@@ -78,42 +183,51 @@ def get_articles(result:BeautifulSoup, cat:str, source:str, NewArticle)->list:
         #assign id
         article.id = article.link
 
-        #Not available either without digesting the downstream link
-        article.pub_date = datetime.datetime.now()
+        #Not available either without digesting the downstream link, the page's date is the closest
+        article.pub_date = pub_date or int(time.time())
 
         articles.append(article)
     
     return articles
 
-def ingest_xml(cat:str, source:str, NewArticle)->list:
-    """[Outer scraping function to set up request pulls]
+def parse_html(html:str, cat:str, source:str, NewArticle, pub_date:int=None)->list:
+    """[Parse a daily news clips page down to its articles]
+
+    Args:
+        html (str): page html
+        cat (str): category being searched
+        source (str): source website
+        NewArticle (dataclass) : Dataclass object for NewsArticle
+        pub_date (int, optional): the page's date.  Defaults to None (now).
+
+    Returns:
+        articles (list): [List of NewArticle objects, None if the page has no clips section]
+    """
+    with tracing.span("parse"):
+        bs4ob = BeautifulSoup(html, features="lxml")
+
+        #Find all records
+        results = bs4ob.find("div", class_="typography text rte")
+        if results:
+            articles = get_articles(results, cat, source, NewArticle, pub_date)
+            tracing.add_items(len(articles))
+            return articles
+
+#FUNCTION Fetch Day
+def fetch_day(day:datetime.date, cat:str, source:str, NewArticle)->list:
+    """[Requests one day's clips page]
 
     Args:
+        day (datetime.date): page date
         cat (str): category of site to be searched
         source (str): RSS feed origin
         NewArticle (dataclass): Custom data object
 
     Returns:
-        new_articles (list): List of dataclass objects
+        new_articles (list): List of dataclass objects, None if the page isn't there
     """
-    dt = datetime.datetime.now()
-    day = dt.day
-    weekend = dt.weekday() > 4
-    if weekend:
-        logger.info("AILA only posts on weekdays. No soup for you!")
-        return None
-    
-    month = dt.strftime("%B").lower()
-    year = dt.year
-    feeds = {
-        "AILA Daily News Update":f"https://www.aila.org/library/daily-immigration-news-clips-{month}-{day}-{year}",
-        #"Aaila Blog"           :f"https://www.aila.org/library/daily-immigration-news-clips-march-6-2025",
-    }
-    # 
-
-    new_articles = []
-    url = feeds.get(cat)
-    chrome_version = np.random.randint(120, 132)
+    url = day_url(day)
+    chrome_version = random.randint(120, 131)
     headers = {
         'Upgrade-Insecure-Requests': '1',
         'User-Agent': f'Mozilla/5.0 (Linux; Android 6.0; Nexus 5 Build/MRA58N) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{chrome_version}.0.0.0 Mobile Safari/537.36',
@@ -125,27 +239,69 @@ def ingest_xml(cat:str, source:str, NewArticle)->list:
         'Content-Type': 'text/html,application/xhtml+xml,application/xml'
     }
     try:
-        response = requests.get(url, headers=headers)
+        response = client.get(url, headers=headers)
     
         if response.status_code != 200:
             logger.warning(f'Status code: {response.status_code}')
             logger.warning(f'Reason: {response.reason}')
-            logger.warning(f"Daily news not up yet for {source}.  Check again later")
+            logger.warning(f"Daily news for {day} not up on {source}")
+            #Past the grace period a missing page isn't coming
+            if response.status_code == 404 and (datetime.date.today() - day).days >= GRACE_DAYS:
+                logger.info(f"No AILA page for {day}, not asking again")
+                GONE.add(day)
             return None
     except Exception as e:            
         logger.warning(f"Error {e}")
         return None
-        
-    #Parse the XML
-    bs4ob = BeautifulSoup(response.text, features="lxml")
-
-    #Find all records
-    results = bs4ob.find("div", class_="typography text rte")
-    if results:
-        new_articles = get_articles(results, cat, source, NewArticle)
-        logger.debug(f'{len(new_articles)} articles returned from {source}')
+
+    #Local midnight of the page's day
+    pub_date = to_epoch(datetime.datetime.combine(day, datetime.time()).astimezone())
+    return parse_html(response.text, cat, source, NewArticle, pub_date)
+
+def ingest_xml(cat:str, source:str, NewArticle)->list:
+    """[Outer scraping function to set up request pulls.  Today's page plus
+    any missing weekdays from plan_backfill]
+
+    Args:
+        cat (str): category of site to be searched
+        source (str): RSS feed origin
+        NewArticle (dataclass): Custom data object
+
+    Returns:
+        new_articles (list): List of dataclass objects
+    """
+    global BACKFILL
+    today = datetime.date.today()
+    days = list(BACKFILL)
+    if is_publish_day(today):
+        days.append(today)
+    if not days:
+        logger.info("AILA only posts on weekdays. No soup for you!")
+        return None
+
+    #Each day gets its own copy of the tracing context so its spans land under this category
+    with ThreadPoolExecutor(max_workers=BACKFILL_WORKERS, thread_name_prefix="aila") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, fetch_day, day, cat, source, NewArticle) for day in days]
+        pages = [future.result() for future in futures]
+
+    #One pass over every page, a link repeated on a later page keeps its first date
+    found, new_articles = {}, []
+    for day, articles in zip(days, pages):
+        if day in GONE:
+            BACKFILL.remove(day)
+        if articles is None:
+            continue
+        if day != today:
+            BACKFILL.remove(day)
+        for article in articles:
+            if article.id not in found:
+                found[article.id] = article
+                new_articles.append(article)
+    GONE.save(today)
+
+    if new_articles:
+        logger.debug(f'{len(new_articles)} articles returned from {source} over {len(days)} pages')
         return new_articles
-            
     else:
         logger.info(f"No articles returned on {source} / {cat}.  Moving to next feed")
 
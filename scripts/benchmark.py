@@ -0,0 +1,618 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import tempfile
+import datetime
+import subprocess
+import tracemalloc
+import dataclasses
+from bs4 import BeautifulSoup
+import rss
+import storage
+import fingerprints
+import search
+import uscis, travel, ice, g_news, aila, boundless
+import main as pipeline
+from main import NewArticle
+from idindex import load_index
+import support
+from support import logger
+
+#Where every run's results are appended, one JSON object per line
+RESULTS_FP = "./data/bench/results.jsonl"
+#Flag a timing as a regression when it's this much slower than the last run
+REGRESSION = 1.25
+#Most seconds of imports a run limited to one RSS site should take.  The
+#scraped sites bring bs4 (and Boundless playwright) so they're over it
+IMPORT_BUDGET = 0.3
+
+################################# Recorded Fixtures ####################################
+#One saved response per site module, parsed through the same entry point the
+#live fetch uses.  Keys are (module, fixture file, category, source).
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURES = {
+    "uscis"    :(uscis, "uscis.xml", "News Releases", "https://www.uscis.gov"),
+    "travel"   :(travel, "travel.xml", "main_feed", "https://travel.state.gov"),
+    "ice"      :(ice, "ice.xml", "Enforcement and Removal", "https://www.ice.gov"),
+    "g_news"   :(g_news, "g_news.xml", "US Immigration Changes", "https://www.news.google.com"),
+    "aila"     :(aila, "aila.html", "AILA Daily News Update", "https://www.aila.org"),
+    "boundless":(boundless, "boundless.html", "Boundless Blog", "https://www.boundless.com"),
+}
+
+################################# Synthetic Feeds ####################################
+USCIS_ITEM = """
+    <item>
+      <title>USCIS Update {idx}</title>
+      <link>https://www.uscis.gov/newsroom/alerts/update-{idx}</link>
+      <description>&lt;p&gt;Policy change number {idx} affecting &lt;b&gt;employment based&lt;/b&gt; petitions.&lt;/p&gt;</description>
+      <pubDate>Mon, 06 Jan 25 14:30:00 -0500</pubDate>
+      <dc:creator>USCIS</dc:creator>
+      <guid isPermaLink="false">{idx} at https://www.uscis.gov</guid>
+    </item>"""
+
+DOS_ITEM = """
+    <item>
+      <title>Country {idx} - Level 2: Exercise Increased Caution</title>
+      <link>https://travel.state.gov/content/travel/en/traveladvisories/country-{idx}.html</link>
+      <description><![CDATA[<p>Exercise increased caution in Country {idx} due to crime.</p>]]></description>
+      <pubDate>Mon, 06 Jan 2025</pubDate>
+      <dc:creator>travel.state.gov</dc:creator>
+      <guid>https://travel.state.gov/country-{idx}</guid>
+      <dc:identifier>
+C{idx}
+</dc:identifier>
+      <category domain="Threat-Level">Level 2: Exercise Increased Caution</category>
+      <category domain="Country-Tag">C{idx}</category>
+      <category domain="Keyword">advisory</category>
+    </item>"""
+
+FEED = """<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0" xmlns:dc="http://purl.org/dc/elements/1.1/">
+  <channel>
+    <title>Synthetic feed</title>
+    <link>https://example.com</link>{items}
+  </channel>
+</rss>"""
+
+#FUNCTION Make Feed
+def make_feed(template:str, n_items:int)->bytes:
+    """Builds an RSS feed with n_items copies of an item template
+
+    Args:
+        template (str): item xml with an {idx} placeholder
+        n_items (int): how many items to generate
+
+    Returns:
+        feed (bytes): encoded feed
+    """
+    items = "".join(template.format(idx=idx) for idx in range(n_items))
+    return FEED.format(items=items).encode("utf-8")
+
+################################# BeautifulSoup Reference ####################################
+#FUNCTION BS4 Articles
+def bs4_articles(content:bytes, cat:str, source:str, date_convert)->list:
+    """The pre streaming parse path.  Full BeautifulSoup tree, find_all items
+    and a match on each child.  Kept here so the streaming parser has
+    something to be measured against.
+    """
+    bs4ob = BeautifulSoup(content.decode("utf-8"), features="xml")
+    articles = []
+    for card in bs4ob.find_all("item"):
+        article = NewArticle()
+        article.pull_date = time.strftime("%m-%d-%Y_%H-%M-%S")
+        for row in card.contents:
+            rname = row.name
+            if row == "\n":
+                continue
+            match rname:
+                case "title":
+                    article.title = row.text
+                case "link":
+                    article.link = row.text
+                case "description":
+                    article.description = row.text
+                case "pubDate":
+                    article.pub_date = date_convert(row.text)
+                case "creator":
+                    article.creator = row.text
+                case "guid":
+                    article.id = row.text
+                case "identifier":
+                    article.identifier = row.text.strip("\n")
+            if row.name and "domain" in row.attrs:
+                match row.attrs["domain"]:
+                    case "Threat-Level":
+                        article.threat_level = row.text
+                    case "Country-Tag":
+                        article.country = row.text
+                    case "Keyword":
+                        article.keyword = row.text
+        article.category = cat
+        article.source = source
+        articles.append(article)
+    return articles
+
+################################# Synthetic Archives ####################################
+#FUNCTION Make Archive
+def make_archive(fp:str, n_articles:int)->storage.ArticleLog:
+    """Writes an article log of n_articles USCIS shaped records, oldest
+    first, the order a real archive is appended in (and the worst case for
+    anything that keeps ids newest first as they're loaded)
+
+    Args:
+        fp (str): where to write the log
+        n_articles (int): how many records
+
+    Returns:
+        log (ArticleLog): log (with its id index) over the file
+    """
+    log = storage.ArticleLog(fp)
+    start = support.to_epoch(datetime.datetime(2020, 1, 1))
+    records = {}
+    for idx in range(n_articles):
+        records[f"{idx} at https://www.uscis.gov"] = {
+            "author"     :None,
+            "category"   :"News Releases",
+            "creator"    :"USCIS",
+            "description":f"Policy change number {idx} affecting employment based petitions. " * 3,
+            "link"       :f"https://www.uscis.gov/newsroom/news-releases/update-{idx}",
+            "pub_date"   :start + idx * 60,
+            "pull_date"  :"01-01-2025_00-00-00",
+            "source"     :"https://www.uscis.gov",
+            "title"      :f"USCIS Update {idx}",
+        }
+        if len(records) == 10000:
+            log.append(records)
+            records = {}
+    log.append(records)
+    return log
+
+#FUNCTION Make Articles
+def make_articles(n_articles:int, start:int=0, site:str="USCIS", article_type=NewArticle)->list:
+    """NewArticle objects shaped like a parsed feed.  Ids line up with
+    make_archive so a range below the archive size reads as already stored.
+
+    Args:
+        n_articles (int): how many articles
+        start (int, optional): first id number. Defaults to 0.
+        site (str, optional): "USCIS" or "DOS" shaped. Defaults to "USCIS".
+        article_type (dataclass, optional): record type to build. Defaults to NewArticle.
+
+    Returns:
+        articles (list): List of NewArticle objects
+    """
+    articles = []
+    for idx in range(start, start + n_articles):
+        article = article_type()
+        article.pull_date = "01-01-2025_00-00-00"
+        article.pub_date = support.to_epoch(datetime.datetime(2025, 1, 1)) + idx
+        if site == "DOS":
+            article.id = f"https://travel.state.gov/country-{idx}"
+            article.title = f"Country {idx} - Level 2: Exercise Increased Caution"
+            article.description = f"<p>Exercise increased caution in Country {idx} due to crime.</p>"
+            article.threat_level = "Level 2: Exercise Increased Caution"
+            article.country = f"C{idx}"
+            article.keyword = "advisory"
+            article.link = article.id
+            article.source = "https://travel.state.gov"
+            article.category = "main_feed"
+        else:
+            article.id = f"{idx} at https://www.uscis.gov"
+            article.title = f"USCIS Update {idx}"
+            article.description = f"Policy change number {idx} affecting employment based petitions. " * 3
+            article.link = f"https://www.uscis.gov/newsroom/news-releases/update-{idx}"
+            article.source = "https://www.uscis.gov"
+            article.category = "News Releases"
+        article.creator = "USCIS"
+        articles.append(article)
+    return articles
+
+################################# Timing Helpers ####################################
+#FUNCTION Timed
+def timed(fn, repeats:int, setup=None)->dict:
+    """Runs fn repeats times (setup before each, untimed) and summarizes
+
+    Args:
+        fn (function): called with whatever setup returns (or nothing)
+        repeats (int): how many runs
+        setup (function, optional): builds fresh args for each run. Defaults to None.
+
+    Returns:
+        timing (dict): best / median seconds and the last output
+    """
+    times = []
+    for _ in range(repeats):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        out = fn(*args)
+        times.append(time.perf_counter() - start)
+    return {"best":min(times), "median":statistics.median(times), "runs":repeats, "out":out}
+
+#FUNCTION Measure
+def measure(fn, *args, **kwargs)->tuple:
+    """Runs fn once, returning its output, wall time and peak traced memory
+
+    Returns:
+        out (any): whatever fn returned
+        took (float): seconds
+        peak (int): peak bytes allocated while fn ran
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    out = fn(*args, **kwargs)
+    took = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, took, peak
+
+################################# Benchmarks ####################################
+#FUNCTION Bench RSS
+def bench_rss(sizes:list)->list:
+    """Streaming lxml parser vs the BeautifulSoup path over USCIS and DOS
+    shaped feeds of increasing size.
+
+    Args:
+        sizes (list): item counts to test
+
+    Returns:
+        results (list): dict per (feed, size, parser)
+    """
+    results = []
+    shapes = {
+        "USCIS":(USCIS_ITEM, uscis.date_convert),
+        "DOS"  :(DOS_ITEM, travel.date_convert),
+    }
+    for site, (template, date_convert) in shapes.items():
+        for size in sizes:
+            content = make_feed(template, size)
+            old, bs_took, bs_peak = measure(bs4_articles, content, "bench", site, date_convert)
+            new, lx_took, lx_peak = measure(rss.parse_articles, content, site, "bench", site, NewArticle, date_convert)
+            if [(a.id, a.title, a.description, a.pub_date) for a in old] != [(a.id, a.title, a.description, a.pub_date) for a in new]:
+                logger.warning(f"{site} parsers disagree at {size} items")
+            for parser, took, peak in (("bs4", bs_took, bs_peak), ("lxml", lx_took, lx_peak)):
+                results.append({"bench":"rss", "feed":site, "items":size, "parser":parser, "seconds":round(took, 4), "peak_bytes":peak})
+            logger.info(f"{site} {size:>7} items | bs4 {bs_took:.3f}s {bs_peak / 1e6:.1f}MB | lxml {lx_took:.3f}s {lx_peak / 1e6:.1f}MB | {bs_took / max(lx_took, 1e-9):.1f}x")
+    return results
+
+#FUNCTION Pub Order
+def pub_order(records:dict)->list:
+    """Builds a PubOrder over records in their stored order and walks it"""
+    order = storage.PubOrder()
+    for idx, record in records.items():
+        order.insert(idx, record.get("pub_date"))
+    return list(order)
+
+#FUNCTION Bench Load
+def bench_load(sizes:list)->list:
+    """Startup cost of the eager article log load vs the lazy id index load,
+    plus putting the loaded (oldest first) records in pub order the way
+    compaction does
+
+    Args:
+        sizes (list): archive sizes to test
+
+    Returns:
+        results (list): dict per (size, mode)
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            log = make_archive(os.path.join(tmp, f"archive_{size}.jsonl"), size)
+            records = log.load()
+            modes = {
+                "eager"    :lambda: storage.load_json(storage.ArticleLog(log.fp)),
+                "lazy"     :lambda: storage.LazyJsonStore(storage.ArticleLog(log.fp)),
+                "pub_order":lambda: pub_order(records),
+            }
+            for mode, fn in modes.items():
+                tracemalloc.start()
+                start = time.perf_counter()
+                store = fn()
+                took = time.perf_counter() - start
+                resident, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                del store
+                results.append({"bench":"load", "articles":size, "mode":mode, "seconds":round(took, 4), "resident_bytes":resident, "peak_bytes":peak})
+                logger.info(f"load {size:>8} articles | {mode:<9} {took:.3f}s | resident {resident / 1e6:.1f}MB | peak {peak / 1e6:.1f}MB")
+    return results
+
+#FUNCTION Bench Fixtures
+def bench_fixtures(repeats:int)->list:
+    """Parse time for each site module over its recorded fixture
+
+    Args:
+        repeats (int): runs per module
+
+    Returns:
+        results (list): dict per module
+    """
+    results = []
+    for name, (module, fixture, cat, source) in FIXTURES.items():
+        with open(os.path.join(FIXTURE_DIR, fixture), "rb") as f:
+            content = f.read()
+        if fixture.endswith(".html"):
+            parse = lambda: module.parse_html(content.decode("utf-8"), cat, source, NewArticle)
+        else:
+            parse = lambda: module.get_articles(content, cat, source, NewArticle)
+        timing = timed(parse, repeats)
+        items = len(timing["out"] or [])
+        results.append({"bench":"get_articles", "module":name, "items":items, "bytes":len(content), "seconds":round(timing["best"], 6), "median":round(timing["median"], 6)})
+        logger.info(f"get_articles {name:<10} {items:>3} items | best {timing['best'] * 1e3:.2f}ms | median {timing['median'] * 1e3:.2f}ms")
+    return results
+
+#FUNCTION Bench Pipeline
+def bench_pipeline(sizes:list, batch:int, repeats:int)->list:
+    """Times each stage of a run against synthetic archives.  A feed batch
+    is half already stored, half new, which is about what a real run sees.
+
+    Args:
+        sizes (list): archive sizes
+        batch (int): articles per simulated feed
+        repeats (int): runs per stage
+
+    Returns:
+        results (list): dict per (size, stage)
+    """
+    results = []
+    def record(size:int, stage:str, timing:dict, **extra):
+        results.append({"bench":"pipeline", "articles":size, "stage":stage, "seconds":round(timing["best"], 6), "median":round(timing["median"], 6), **extra})
+        logger.info(f"pipeline {size:>8} articles | {stage:<15} best {timing['best'] * 1e3:9.2f}ms | median {timing['median'] * 1e3:9.2f}ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            fp = os.path.join(tmp, f"archive_{size}.jsonl")
+            make_archive(fp, size)
+            log = storage.ArticleLog(fp)
+
+            timing = timed(lambda: storage.load_json(log), 1)
+            record(size, "load_historical", timing, mode="eager")
+            timing = timed(lambda: storage.load_lazy(log), repeats)
+            record(size, "load_historical", timing, mode="lazy")
+
+            #Pipeline globals as main() sets them up
+            pipeline.jsondata = storage.load_json(log)
+            pipeline.idindex = load_index(pipeline.jsondata, os.path.join(tmp, "missing.npz"))
+            pipeline.newstories, pipeline.newids, pipeline.newdates = [], [], []
+            feed = make_articles(batch // 2, max(size - batch // 2, 0)) + make_articles(batch // 2, size)
+
+            timing = timed(pipeline.check_ids, repeats, lambda: (feed,))
+            record(size, "check_ids", timing, batch=batch)
+
+            #DOS batch: a third unseen, a third unchanged, a third changed since last run
+            advisories = make_articles(batch, 0, "DOS")
+            for article in advisories[batch // 3:]:
+                fingerprints.remember(article.id, article.country, fingerprints.fingerprint_record(article))
+            for article in advisories[2 * batch // 3:]:
+                article.description += " Updated."
+            timing = timed(pipeline.check_changes, repeats, lambda: (advisories,))
+            record(size, "check_changes", timing, batch=batch)
+
+            #add_data / save_data mutate the store so each run gets fresh ids
+            runs = iter(range(repeats))
+            def fresh():
+                return (make_articles(batch, size + batch * (next(runs) + 1)), "USCIS", "News Releases")
+            timing = timed(pipeline.add_data, repeats, fresh)
+            record(size, "add_data", timing, batch=batch)
+            timing = timed(lambda: storage.save_data(pipeline.jsondata, pipeline.newids[-batch:]), repeats)
+            record(size, "save_data", timing, batch=batch)
+
+            timing = timed(support.urlformat, repeats, lambda: (pipeline.newstories,))
+            record(size, "urlformat", timing, stories=len(pipeline.newstories))
+            pipeline.jsondata = None
+            os.remove(fp)
+    return results
+
+################################# Results ####################################
+#FUNCTION Bench Search
+def bench_search(sizes:list, repeats:int)->list:
+    """Full text query times over synthetic archives.  Every archive record
+    shares its description words, so the common term queries are the worst
+    case for ranking.
+
+    Args:
+        sizes (list): archive sizes to test
+        repeats (int): runs per query
+
+    Returns:
+        results (list): dict per (size, query)
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            log = make_archive(os.path.join(tmp, f"archive_{size}.jsonl"), size)
+            index = search.SearchIndex(os.path.join(tmp, f"search_{size}.db"))
+            start = time.perf_counter()
+            index.rebuild((idx, json.loads(raw)) for idx, raw in log.scan())
+            build = time.perf_counter() - start
+            results.append({"bench":"search", "articles":size, "query":"rebuild", "seconds":round(build, 4)})
+            logger.info(f"search {size:>8} articles | rebuild {build:.2f}s")
+            middle = support.to_epoch(datetime.datetime(2020, 1, 1)) + size * 30
+            queries = {
+                "rare"          :({"query":f'title:"update {size // 2}"'}),
+                "phrase common" :({"query":'"employment based"'}),
+                "prefix common" :({"query":"petit*"}),
+                "phrase recent" :({"query":'"employment based"', "recent":True}),
+                "filtered"      :({"query":"polic*", "sources":["https://www.uscis.gov"], "since":middle, "until":middle + 86400, "recent":True}),
+            }
+            for name, kwargs in queries.items():
+                timing = timed(lambda: index.search(**kwargs), repeats)
+                results.append({"bench":"search", "articles":size, "query":name, "seconds":round(timing["best"], 6), "median":round(timing["median"], 6)})
+                logger.info(f"search {size:>8} articles | {name:<14} best {timing['best'] * 1e3:.2f}ms | median {timing['median'] * 1e3:.2f}ms")
+            index.close()
+    return results
+
+#FUNCTION Traced Bytes
+def traced_bytes(fn)->tuple:
+    """Memory still held by what fn returns, and its peak on the way
+
+    Returns:
+        out (any): what fn returned
+        resident (int): bytes allocated and still live after fn
+        peak (int): peak traced bytes
+    """
+    tracemalloc.start()
+    out = fn()
+    resident, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, resident, peak
+
+#FUNCTION Bench Memory
+def bench_memory(sizes:list)->list:
+    """Resident size of the loaded archive and of parsed articles, before
+    (plain json.loads records, dict backed dataclass) and after (interned
+    records, slotted NewArticle).  Reported per 100k articles.
+
+    Args:
+        sizes (list): archive sizes to test
+
+    Returns:
+        results (list): dict per (size, what, layout)
+    """
+    #The old NewArticle, same fields with a __dict__ per instance
+    DictArticle = dataclasses.make_dataclass(
+        "DictArticle", [(f.name, f.type, dataclasses.field(default=f.default)) for f in dataclasses.fields(NewArticle)]
+    )
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            log = make_archive(os.path.join(tmp, f"archive_{size}.jsonl"), size)
+            cases = {
+                ("archive", "plain")  :lambda: {idx:json.loads(raw) for idx, raw in log.scan()},
+                ("archive", "interned"):lambda: log.load(),
+                ("articles", "dict")  :lambda: make_articles(size, article_type=DictArticle),
+                ("articles", "slots") :lambda: make_articles(size),
+            }
+            for (what, layout), fn in cases.items():
+                out, resident, peak = traced_bytes(fn)
+                del out
+                per_100k = resident * 100000 / size
+                results.append({"bench":"memory", "articles":size, "what":what, "layout":layout, "resident_bytes":resident, "peak_bytes":peak})
+                logger.info(f"memory {size:>8} {what:<8} {layout:<8} | {per_100k / 1e6:.1f}MB per 100k | peak {peak / 1e6:.1f}MB")
+    return results
+
+#FUNCTION Import Seconds
+def import_seconds(code:str)->float:
+    """Seconds spent running import code in a fresh interpreter, so nothing
+    is already cached in sys.modules
+    """
+    #Run from here (support wants ./data/logs) with the scripts importable
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    timer = f"import time; start = time.perf_counter(); {code}; print(time.perf_counter() - start)"
+    proc = subprocess.run([sys.executable, "-c", timer], env=env, capture_output=True, text=True, check=True)
+    return float(proc.stdout.strip().splitlines()[-1])
+
+#FUNCTION Bench Imports
+def bench_imports(sites:list, repeats:int)->list:
+    """Startup import cost of main plus the modules a run limited to each
+    site loads.  Single site runs are checked against IMPORT_BUDGET.
+
+    Args:
+        sites (list): site names to test one at a time
+        repeats (int): fresh interpreters per case, the best is kept
+
+    Returns:
+        results (list): dict per case
+    """
+    cases = {
+        "none":"import main",
+        "all" :"import main, registry; [registry.module(name) for name in registry.names()]",
+    }
+    cases.update({site:f"import main, registry; registry.module({site!r})" for site in sites})
+    took = {case:min(import_seconds(code) for _ in range(repeats)) for case, code in cases.items()}
+    results = []
+    for case, seconds in took.items():
+        results.append({"bench":"imports", "sites":case, "seconds":round(seconds, 4)})
+        msg = f"imports {case:<10} {seconds * 1e3:.0f}ms | {seconds / took['all']:.0%} of every site"
+        if case not in ("none", "all") and seconds > IMPORT_BUDGET:
+            logger.warning(msg + f", over the {IMPORT_BUDGET * 1e3:.0f}ms budget")
+        else:
+            logger.info(msg)
+    return results
+
+#FUNCTION Save Results
+def save_results(results:list, fp:str=RESULTS_FP):
+    """Appends this run's results, stamped with the run time and interpreter,
+    and warns on anything noticeably slower than the previous run.
+
+    Args:
+        results (list): result dicts from the benchmarks
+        fp (str, optional): results file. Defaults to RESULTS_FP.
+    """
+    os.makedirs(os.path.dirname(fp), exist_ok=True)
+    previous = {}
+    if os.path.exists(fp):
+        with open(fp, "r") as f:
+            for line in f:
+                row = json.loads(line)
+                previous[result_key(row)] = row
+    run = {
+        "run"     :datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "python"  :platform.python_version(),
+        "platform":platform.platform(),
+    }
+    with open(fp, "a") as out_f:
+        for row in results:
+            out_f.write(json.dumps({**run, **row}) + "\n")
+            last = previous.get(result_key(row))
+            if last and last.get("seconds") and row["seconds"] > last["seconds"] * REGRESSION:
+                logger.warning(f"Regression {result_key(row)}: {last['seconds']:.6f}s -> {row['seconds']:.6f}s")
+    logger.info(f"{len(results)} results written to {fp}")
+
+def result_key(row:dict)->tuple:
+    """What makes two results comparable run over run"""
+    skip = {"run", "python", "platform", "seconds", "median", "peak_bytes", "resident_bytes"}
+    return tuple(sorted((k, v) for k, v in row.items() if k not in skip))
+
+################################# Start Program ####################################
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the news pipeline")
+    parser.add_argument("--out", default=RESULTS_FP, help="results file (JSON lines, appended)")
+    sub = parser.add_subparsers(dest="bench", required=True)
+    rss_p = sub.add_parser("rss", help="streaming lxml parser vs BeautifulSoup")
+    rss_p.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    load_p = sub.add_parser("load", help="eager vs lazy historical load, pub ordering an oldest first archive")
+    load_p.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000])
+    fix_p = sub.add_parser("fixtures", help="get_articles for every site module over recorded fixtures")
+    fix_p.add_argument("--repeats", type=int, default=20)
+    pipe_p = sub.add_parser("pipeline", help="check_ids / check_changes / add_data / save_data / load / urlformat")
+    pipe_p.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    pipe_p.add_argument("--batch", type=int, default=100)
+    pipe_p.add_argument("--repeats", type=int, default=5)
+    mem_p = sub.add_parser("memory", help="resident size of the loaded archive and parsed articles, before / after")
+    mem_p.add_argument("--sizes", type=int, nargs="+", default=[100000])
+    search_p = sub.add_parser("search", help="full text index rebuild and query times")
+    search_p.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    search_p.add_argument("--repeats", type=int, default=5)
+    imp_p = sub.add_parser("imports", help="startup import time per site (python -X importtime shows the breakdown)")
+    imp_p.add_argument("--sites", nargs="+", default=["USCIS", "DOS", "Google", "ICE"])
+    imp_p.add_argument("--repeats", type=int, default=5)
+    all_p = sub.add_parser("all", help="fixtures then pipeline")
+    all_p.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    all_p.add_argument("--batch", type=int, default=100)
+    all_p.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.bench == "rss":
+        results = bench_rss(args.sizes)
+    elif args.bench == "load":
+        results = bench_load(args.sizes)
+    elif args.bench == "fixtures":
+        results = bench_fixtures(args.repeats)
+    elif args.bench == "pipeline":
+        results = bench_pipeline(args.sizes, args.batch, args.repeats)
+    elif args.bench == "memory":
+        results = bench_memory(args.sizes)
+    elif args.bench == "imports":
+        results = bench_imports(args.sites, args.repeats)
+    elif args.bench == "search":
+        results = bench_search(args.sizes, args.repeats)
+    else:
+        results = bench_fixtures(args.repeats * 4) + bench_pipeline(args.sizes, args.batch, args.repeats)
+    save_results(results, args.out)
+
+if __name__ == "__main__":
+    main()
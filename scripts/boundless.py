@@ -1,15 +1,18 @@
 import time
 import datetime
-from support import logger
+import browser
+import politeness
+import retry
+import tracing
+from support import logger, to_epoch, host_key
 from bs4 import BeautifulSoup
-from playwright.sync_api import sync_playwright
-from playwright._impl._errors import Error as PlaywrightError
 
-def date_convert(time_str:str)->datetime:
+def date_convert(time_str:str)->int:
     # _.strftime("%a, %d %b %y %H:%M:%S %z") #To verify correct converstion
     # dateOb = datetime.datetime.strptime(time_str, "%a, %d %b %Y %H:%M:%S %Z")
     dateOb = datetime.datetime.strptime(time_str, "%B %d, %Y")
-    return dateOb
+    #Stored as UTC epoch seconds
+    return to_epoch(dateOb)
 
 def get_articles(result:BeautifulSoup, cat:str, source:str, NewArticle)->list:
     """[Ingest XML of summary page for articles info]
@@ -66,58 +69,58 @@ def get_articles(result:BeautifulSoup, cat:str, source:str, NewArticle)->list:
     
     return articles
 
-def get_html(url: str, retries:int = 3, delay:int = 5):
-    browser = None
-    for attempt in range(retries):
-        try:
-            with sync_playwright() as p:
-                logger.debug("Playwright launched")
-                browser = p.chromium.launch(headless=True)
-                logger.debug("Browser launched")
-                context = browser.new_context(
-                    user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                )
-                logger.debug("Context created")
-                page = context.new_page()
-                logger.debug(f"Navigating to {url}")
-                response = page.goto(url)
-
-                if response.status == 403:
-                    logger.warning(f"Attempt {attempt + 1} - 403 Forbidden. Retrying in {delay} seconds.")
-                    time.sleep(delay)
-                    delay *= 2
-                    continue
-
-                if response.status != 200:
-                    logger.warning(f"Status code: {response.status}")
-                    logger.warning(f"Reason: {response.status_text}")
-                    return None
-
-                page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                time.sleep(2)
-
-                page.wait_for_selector(".w-dyn-item", timeout=15000)
-                html = page.content()
-                logger.info("HTML retrieved")
-                return html
-
-        except Exception as e:
-            logger.warning(f"Attempt {attempt + 1} - Error: {e}")
-            if attempt + 1 == retries:
-                return None
-            time.sleep(delay)
-            delay *= 2
-        finally:
-            if browser: #check if the browser object exists.
-                try:
-                    browser.close()
-                    logger.debug("Browser closed")
-                except PlaywrightError as pe: #Catch the playwright error specifically.
-                    logger.warning(f"Error closing browser (PlaywrightError): {pe}")
-                except Exception as close_error:
-                    logger.warning(f"Error closing browser: {close_error}")
-                
-    return None
+def parse_html(html:str, cat:str, source:str, NewArticle)->list:
+    """[Parse the blog listing page down to its article cards]
+
+    Args:
+        html (str): page html
+        cat (str): category being searched
+        source (str): source website
+        NewArticle (dataclass) : Dataclass object for NewsArticle
+
+    Returns:
+        articles (list): [List of NewArticle objects, None if no cards were found]
+    """
+    with tracing.span("parse"):
+        bs4ob = BeautifulSoup(html, features="lxml")
+
+        #Find all records (item CSS)
+        results = bs4ob.find_all("div", {"role":"listitem"}, class_="cards-collection-item w-dyn-item")
+        if results:
+            articles = get_articles(results, cat, source, NewArticle)
+            tracing.add_items(len(articles))
+            return articles
+
+#Boundless answers bot suspicion with a 403 that usually clears on a later try
+RETRY_ON = retry.RETRY_STATUSES | {403}
+
+def get_html(url: str):
+    """Pulls the rendered blog page through the shared browser pool under the
+    shared retry policy.  The browser is launched once per run, each attempt
+    gets a fresh context.
+
+    Args:
+        url (str): page to load
+
+    Returns:
+        html (str): page content or None
+    """
+    def send()->tuple:
+        with tracing.span("fetch", host=host_key(url)):
+            politeness.wait(url)
+            status, reason, headers, html = browser.fetch(url, ".w-dyn-item", timeout=15000)
+            tracing.add_bytes(len(html.encode("utf-8")) if html else 0)
+        politeness.observe(url, status, headers)
+        return status, headers, (status, reason, html)
+
+    status, reason, html = retry.call(url, send, retry_on=RETRY_ON)
+    if status != 200:
+        logger.warning(f"Status code: {status}")
+        logger.warning(f"Reason: {reason}")
+        return None
+
+    logger.info("HTML retrieved")
+    return html
 
 def ingest_xml(cat:str, source:str, NewArticle)->list:
     """[Outer scraping function to set up request pulls]
@@ -144,12 +147,8 @@ def ingest_xml(cat:str, source:str, NewArticle)->list:
     
     #Parse the XML
     if response:
-        bs4ob = BeautifulSoup(response, features="lxml")
-
-        #Find all records (item CSS)
-        results = bs4ob.find_all("div", {"role":"listitem"}, class_="cards-collection-item w-dyn-item")
-        if results:
-            new_articles = get_articles(results, cat, source, NewArticle)
+        new_articles = parse_html(response, cat, source, NewArticle)
+        if new_articles:
             logger.info(f'{len(new_articles)} articles returned from {source}')
             return new_articles
     else:
@@ -0,0 +1,127 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from support import logger, host_key
+
+################################# Browser Pool ####################################
+#Playwright's sync api is bound to the thread that started it.  The pool owns a
+#single worker thread and every browser call is run on it, so any fetch thread
+#can use the pool without tripping over that.  Playwright itself is only imported
+#when the browser is first launched, runs that never need it don't pay for it.
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+BLOCKED_TYPES = {"image", "font", "media"}
+
+#Polls the matched element count and resolves once it has held steady for a few
+#checks in a row.  Replaces the old scroll and sleep 2 seconds.
+SETTLE_JS = """
+(selector) => {
+    const count = document.querySelectorAll(selector).length;
+    if (count > 0 && window.__settleCount === count) {
+        window.__settleHits = (window.__settleHits || 0) + 1;
+    } else {
+        window.__settleHits = 0;
+        window.__settleCount = count;
+    }
+    return window.__settleHits >= 3;
+}
+"""
+
+#CLASS Browser Pool
+class BrowserPool():
+    """Launches headless chromium once per run and hands out a fresh context
+    for every page fetch.  Images, fonts, media and scripts from other hosts
+    are aborted before they're requested.
+    """
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="browser")
+        self.playwright = None
+        self.browser = None
+        self.fetches = []
+
+    def _launch(self):
+        if self.browser is None:
+            from playwright.sync_api import sync_playwright
+            self.playwright = sync_playwright().start()
+            self.browser = self.playwright.chromium.launch(headless=True)
+            logger.debug("Browser launched")
+
+    def _route(self, route, page_host:str):
+        request = route.request
+        if request.resource_type in BLOCKED_TYPES:
+            return route.abort()
+        if request.resource_type == "script" and host_key(request.url) != page_host:
+            return route.abort()
+        return route.continue_()
+
+    def _fetch(self, url:str, selector:str, timeout:int)->tuple:
+        start = time.perf_counter()
+        cold = self.browser is None
+        self._launch()
+        context = self.browser.new_context(user_agent=USER_AGENT)
+        try:
+            page_host = host_key(url)
+            context.route("**/*", lambda route: self._route(route, page_host))
+            page = context.new_page()
+            logger.debug(f"Navigating to {url}")
+            response = page.goto(url)
+            if response is None:
+                return None, "No response", {}, None
+            html = None
+            if response.status == 200:
+                page.wait_for_selector(selector, timeout=timeout)
+                page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                page.wait_for_function(SETTLE_JS, arg=selector, polling=150, timeout=timeout)
+                html = page.content()
+            took = time.perf_counter() - start
+            self.fetches.append(("cold" if cold else "warm", took))
+            logger.info(f"{'Cold' if cold else 'Warm'} page fetch of {url} took {took:.2f}s")
+            return response.status, response.status_text, response.headers, html
+        finally:
+            context.close()
+
+    def fetch(self, url:str, selector:str, timeout:int=15000)->tuple:
+        """Loads a page in a fresh context and waits for selector to settle
+
+        Args:
+            url (str): page to load
+            selector (str): css selector whose element count has to settle
+            timeout (int, optional): ms to wait on the selector. Defaults to 15000.
+
+        Returns:
+            status (int): response status
+            status_text (str): response reason
+            headers (dict): response headers
+            html (str): page content, None unless the status was 200
+        """
+        return self.executor.submit(self._fetch, url, selector, timeout).result()
+
+    def _close(self):
+        if self.browser is not None:
+            from playwright._impl._errors import Error as PlaywrightError
+            try:
+                self.browser.close()
+                logger.debug("Browser closed")
+            except PlaywrightError as pe:
+                logger.warning(f"Error closing browser (PlaywrightError): {pe}")
+            self.playwright.stop()
+        self.browser = self.playwright = None
+
+    def close(self):
+        """Shuts the browser down and reports the page fetch times"""
+        if self.fetches:
+            cold = [took for kind, took in self.fetches if kind == "cold"]
+            warm = [took for kind, took in self.fetches if kind == "warm"]
+            msg = f"Browser page fetches | cold: {sum(cold):.2f}s over {len(cold)}"
+            if warm:
+                msg += f" | warm avg: {sum(warm) / len(warm):.2f}s over {len(warm)}"
+            logger.info(msg)
+        self.executor.submit(self._close).result()
+        self.fetches = []
+
+################################# Module Interface ####################################
+POOL = BrowserPool()
+
+def fetch(url:str, selector:str, timeout:int=15000)->tuple:
+    return POOL.fetch(url, selector, timeout)
+
+def close():
+    POOL.close()
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import queue
+import threading
+from os.path import exists
+import politeness
+import tracing
+import retry
+from support import logger, host_key
+
+################################# Session Pool ####################################
+#One pool of sessions per host for the whole run.  Each curl_cffi session keeps
+#its connections alive and caches the TLS session, and impersonating chrome
+#negotiates HTTP/2 (and multiplexes on it) wherever the host offers it.
+#size: how many sessions the host gets, ie how many requests can be in flight
+HOST_POOLS = {
+    "news.google.com" : {"size":2},
+    "default"         : {"size":1},
+}
+IMPERSONATE = "chrome"
+
+################################# Robots Cache ####################################
+#Each host's robots.txt crawl-delay is kept on disk and only fetched again once
+#it's older than ROBOTS_TTL, so a run doesn't spend a request per host on it.
+ROBOTS_FP = "./data/robots.json"
+ROBOTS_TTL = 24 * 3600
+
+#CLASS Robots Cache
+class RobotsCache():
+    """Per host crawl-delay from robots.txt (None if it doesn't set one) and
+    when it was fetched, persisted to disk
+
+    Args:
+        fp (str, optional): path of the on disk cache. Defaults to ROBOTS_FP.
+        ttl (float, optional): seconds an entry stays fresh. Defaults to ROBOTS_TTL.
+    """
+    def __init__(self, fp:str=ROBOTS_FP, ttl:float=ROBOTS_TTL):
+        self.fp = fp
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hosts = {}
+        self.dirty = False
+        if exists(fp):
+            try:
+                with open(fp, "r") as f:
+                    self.hosts = json.loads(f.read())
+            except (OSError, ValueError) as e:
+                logger.warning(f"Couldn't read {fp}, robots.txt will be fetched again. {e}")
+
+    def fresh(self, host:str)->bool:
+        with self.lock:
+            entry = self.hosts.get(host)
+            return entry is not None and time.time() - entry.get("fetched", 0) < self.ttl
+
+    def delay(self, host:str)->float:
+        with self.lock:
+            return self.hosts.get(host, {}).get("delay")
+
+    def store(self, host:str, delay:float):
+        with self.lock:
+            self.hosts[host] = {"delay":delay, "fetched":time.time()}
+            self.dirty = True
+
+    def save(self):
+        """Atomically writes the cache back to disk if anything changed"""
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp = self.fp + ".tmp"
+            with open(tmp, "w") as out_f:
+                out_f.write(json.dumps(self.hosts, indent=2, sort_keys=True))
+            os.replace(tmp, self.fp)
+            self.dirty = False
+
+#CLASS Host Pool
+class HostPool():
+    """Sessions for a single host.  Callers check a session out, use it and
+    hand it back so a session is never shared between threads.
+
+    Args:
+        host (str): hostname the pool serves
+        size (int): number of sessions to keep
+    """
+    def __init__(self, host:str, size:int):
+        #curl_cffi is only imported once a request is actually made
+        import curl_cffi
+        self.host = host
+        self.sessions = queue.LifoQueue()
+        self.all = []
+        for _ in range(max(size, 1)):
+            session = curl_cffi.requests.Session(impersonate=IMPERSONATE)
+            self.all.append(session)
+            self.sessions.put(session)
+        self.requests = 0
+
+    def checkout(self)->"curl_cffi.requests.Session":
+        return self.sessions.get()
+
+    def checkin(self, session:"curl_cffi.requests.Session"):
+        self.sessions.put(session)
+
+    def close(self):
+        for session in self.all:
+            try:
+                session.close()
+            except Exception as e:
+                logger.warning(f"Error closing session for {self.host} {e}")
+
+#CLASS Client
+class Client():
+    """Shared HTTP layer every site module fetches through.  Lazily opens a
+    pool per host, waits on the politeness scheduler before each request and
+    reports the response back to it.
+    """
+    def __init__(self, pools:dict=HOST_POOLS, robots_cache:RobotsCache=None):
+        self.config = pools
+        self.pools = {}
+        self.lock = threading.Lock()
+        self.robots_cache = robots_cache or RobotsCache()
+
+    def pool(self, url:str)->HostPool:
+        host = host_key(url)
+        new = False
+        with self.lock:
+            if host not in self.pools:
+                size = self.config.get(host, self.config["default"])["size"]
+                self.pools[host] = HostPool(host, size)
+                new = True
+        if new:
+            self.robots(url, self.pools[host])
+        return self.pools[host]
+
+    def robots(self, url:str, pool:HostPool):
+        """Applies the host's robots.txt crawl-delay to the politeness
+        scheduler.  The cached value is used while it's fresh, otherwise
+        robots.txt is fetched like any other request (scheduler, breaker and
+        retries).
+
+        Args:
+            url (str): any address on the host
+            pool (HostPool): session pool for that host
+        """
+        if not self.robots_cache.fresh(pool.host):
+            scheme = url.split("://")[0]
+            robots_url = f"{scheme}://{url.split('://')[1].split('/')[0]}/robots.txt"
+            def send()->tuple:
+                politeness.wait(robots_url)
+                session = pool.checkout()
+                try:
+                    response = session.get(robots_url, timeout=5)
+                    pool.requests += 1
+                finally:
+                    pool.checkin(session)
+                politeness.observe(robots_url, response.status_code, response.headers)
+                return response.status_code, response.headers, response
+            try:
+                response = retry.call(robots_url, send)
+            except Exception as e:
+                #Not cached, so it's tried again next run
+                logger.debug(f"No robots.txt for {pool.host} {e}")
+                return
+            delay = None
+            if response.status_code == 200:
+                from urllib.robotparser import RobotFileParser
+                parser = RobotFileParser()
+                parser.parse(response.text.splitlines())
+                delay = parser.crawl_delay("*")
+            self.robots_cache.store(pool.host, float(delay) if delay else None)
+        delay = self.robots_cache.delay(pool.host)
+        if delay:
+            politeness.crawl_delay(url, delay)
+
+    def get(self, url:str, headers:dict=None, timeout:int=10):
+        """Polite GET through the host's pooled session, retried under the
+        shared retry policy.  Hosts with an open breaker aren't contacted.
+
+        Args:
+            url (str): address to request
+            headers (dict, optional): request headers. Defaults to None.
+            timeout (int, optional): seconds before giving up on an attempt. Defaults to 10.
+
+        Raises:
+            retry.CircuitOpen: the host's breaker is open
+
+        Returns:
+            response (curl_cffi.requests.Response): the server's response
+        """
+        def send()->tuple:
+            #Opened inside the attempt so a host with an open breaker doesn't even get a robots.txt request
+            pool = self.pool(url)
+            with tracing.span("fetch", host=host_key(url)):
+                politeness.wait(url)
+                session = pool.checkout()
+                try:
+                    response = session.get(url, headers=headers, timeout=timeout)
+                    pool.requests += 1
+                finally:
+                    pool.checkin(session)
+                tracing.add_bytes(len(response.content))
+            politeness.observe(url, response.status_code, response.headers)
+            return response.status_code, response.headers, response
+
+        return retry.call(url, send)
+
+    def close(self):
+        with self.lock:
+            for host, pool in self.pools.items():
+                logger.debug(f"Closing {host} sessions after {pool.requests} requests")
+                pool.close()
+            self.pools = {}
+        self.robots_cache.save()
+
+################################# Module Interface ####################################
+CLIENT = Client(HOST_POOLS, RobotsCache(ROBOTS_FP))
+
+def get(url:str, headers:dict=None, timeout:int=10):
+    return CLIENT.get(url, headers=headers, timeout=timeout)
+
+def close():
+    CLIENT.close()
@@ -0,0 +1,349 @@
+import os
+import json
+import time
+import heapq
+import random
+import datetime
+from os.path import exists
+import registry, storage, httpcache, client, browser, fingerprints, tracing, retry, outbox, filters, neardup, search, support
+import main as pipeline
+from support import logger
+from fetcher import fetch_all
+
+################################# Polling Policy ####################################
+#How often a feed is polled comes from how often it has published lately.  The
+#average gap between its recent posts (counting the time since the last one, so
+#a feed that's gone quiet slows down on its own) is split POLLS_PER_POST ways
+#and clamped to MIN/MAX.  A feed with too little history gets DEFAULT.
+MIN_INTERVAL = 15 * 60
+MAX_INTERVAL = 24 * 3600
+DEFAULT_INTERVAL = 3600
+POLLS_PER_POST = 4
+#Only look at this much history, and at most this many posts of it
+HISTORY_DAYS = 90
+HISTORY_POSTS = 30
+#Spread polls out a bit so feeds on the same host don't line up
+JITTER = 0.1
+
+#Calendar rules.  Site -> function(datetime) saying whether it publishes that day
+CALENDAR_RULES = {
+    "AILA": lambda dt: registry.module("AILA").is_publish_day(dt),
+}
+
+#Local times the email digest goes out
+DIGEST_TIMES = ["08:00", "16:00"]
+#Stories waiting on the next digest.  Kept on disk so a restart doesn't lose them
+STATE_FP = "./data/daemon_state.json"
+#Wait before trying a failed digest again
+DIGEST_RETRY = 15 * 60
+#Longest single sleep, so a clock change or a late feed is noticed reasonably soon
+MAX_NAP = 60
+#Ids whose save failed, kept in memory and saved with the next poll
+UNSAVED = []
+
+#FUNCTION Learn Interval
+def learn_interval(pub_dates:list, now:float)->float:
+    """Poll interval for a feed from its recent pub_dates
+
+    Args:
+        pub_dates (list): sorted UTC epoch pub_dates for the feed
+        now (float): current epoch time
+
+    Returns:
+        interval (float): seconds between polls
+    """
+    recent = [x for x in pub_dates[-HISTORY_POSTS:] if x >= now - HISTORY_DAYS * 86400]
+    if len(recent) < 2:
+        return DEFAULT_INTERVAL
+    gap = (now - recent[0]) / len(recent)
+    return min(max(gap / POLLS_PER_POST, MIN_INTERVAL), MAX_INTERVAL)
+
+#CLASS Feed Scheduler
+class FeedScheduler():
+    """Heap of (next poll time, site, category) with a learned interval per feed
+
+    Args:
+        feeds (list): (site, category) pairs to poll
+        sources (dict): site -> source address, to match stored history
+        history (dict): (source, category) -> sorted pub_dates
+        rules (dict, optional): calendar rules. Defaults to CALENDAR_RULES.
+    """
+    def __init__(self, feeds:list, sources:dict, history:dict, rules:dict=CALENDAR_RULES):
+        self.sources = sources
+        self.history = history
+        self.rules = rules
+        self.intervals = {}
+        now = time.time()
+        #Everything is polled once at startup, conditional GETs keep that cheap
+        self.heap = [(now, site, cat) for site, cat in feeds]
+        heapq.heapify(self.heap)
+        for site, cat in feeds:
+            self.intervals[(site, cat)] = learn_interval(self.dates(site, cat), now)
+            logger.info(f"{site}:{cat} polling every {self.intervals[(site, cat)] / 60:.0f} min")
+
+    def dates(self, site:str, cat:str)->list:
+        return self.history.setdefault((self.sources[site], cat), [])
+
+    def next_due(self)->float:
+        return self.heap[0][0] if self.heap else time.time() + MAX_INTERVAL
+
+    def scheduled(self, site:str, cat:str)->bool:
+        return any(entry[1] == site and entry[2] == cat for entry in self.heap)
+
+    def due(self, now:float)->list:
+        """Pops every feed that's due
+
+        Returns:
+            feeds (list): (site, category) pairs to poll now
+        """
+        feeds = []
+        while self.heap and self.heap[0][0] <= now:
+            _, site, cat = heapq.heappop(self.heap)
+            feeds.append((site, cat))
+        return feeds
+
+    def observe(self, site:str, cat:str, new_dates:list, now:float):
+        """Folds a poll's new pub_dates into the history and reschedules the feed
+
+        Args:
+            site (str): site polled
+            cat (str): category polled
+            new_dates (list): pub_dates of articles that were new this poll
+            now (float): when the poll finished
+        """
+        dates = self.dates(site, cat)
+        dates.extend(x for x in new_dates if x is not None)
+        dates.sort()
+        del dates[:-HISTORY_POSTS]
+        interval = learn_interval(dates, now)
+        if abs(interval - self.intervals.get((site, cat), interval)) > 60:
+            logger.info(f"{site}:{cat} now polling every {interval / 60:.0f} min")
+        self.intervals[(site, cat)] = interval
+        due = now + interval * random.uniform(1 - JITTER, 1 + JITTER)
+        heapq.heappush(self.heap, (self.apply_rules(site, due), site, cat))
+
+    def apply_rules(self, site:str, due:float)->float:
+        """Pushes a poll off days the site doesn't publish to the start of
+        the next day it does
+        """
+        rule = self.rules.get(site)
+        if rule is None:
+            return due
+        when = datetime.datetime.fromtimestamp(due)
+        for _ in range(7):
+            if rule(when):
+                return when.timestamp()
+            when = datetime.datetime.combine(when.date() + datetime.timedelta(days=1), datetime.time())
+        return due
+
+################################# Email Digest ####################################
+#CLASS Digest
+class Digest():
+    """New stories waiting for the next scheduled digest email
+
+    Args:
+        times (list): "HH:MM" local send times
+        fp (str, optional): where pending stories are kept. Defaults to STATE_FP.
+    """
+    def __init__(self, times:list, fp:str=STATE_FP):
+        self.times = sorted(datetime.time.fromisoformat(x) for x in times)
+        self.fp = fp
+        self.pending = []
+        self.last_sent = time.time()
+        self.retry_at = 0
+        if exists(fp):
+            try:
+                with open(fp, "r") as f:
+                    state = json.loads(f.read())
+                self.pending = [tuple(x) for x in state.get("pending", [])]
+                self.last_sent = state.get("last_sent", self.last_sent)
+            except (OSError, ValueError, AttributeError, TypeError) as e:
+                logger.warning(f"Couldn't read {fp}, digest starts empty. {e}")
+
+    def save(self):
+        tmp = self.fp + ".tmp"
+        with open(tmp, "w") as out_f:
+            out_f.write(json.dumps({"pending":self.pending, "last_sent":self.last_sent}))
+        os.replace(tmp, self.fp)
+
+    def add(self, stories:list):
+        """Queues stories for the next digest, once per link"""
+        seen = {story[0] for story in self.pending}
+        self.pending.extend(story for story in stories if story[0] not in seen)
+        self.save()
+
+    def next_slot(self, after:float)->float:
+        """First send time after the given epoch time"""
+        when = datetime.datetime.fromtimestamp(after)
+        for days in range(2):
+            day = when.date() + datetime.timedelta(days=days)
+            for slot in self.times:
+                at = datetime.datetime.combine(day, slot)
+                if at > when:
+                    return at.timestamp()
+
+    def next_due(self)->float:
+        return max(self.next_slot(self.last_sent), self.retry_at)
+
+    def due(self, now:float)->bool:
+        return now >= self.next_due()
+
+    def send(self, now:float):
+        """Hands whatever's pending to the outbox.  If it can't even be
+        queued the stories stay pending and another attempt is made after
+        DIGEST_RETRY.
+        """
+        if self.pending:
+            with tracing.span("email"):
+                try:
+                    entries = neardup.dedupe(self.pending)
+                    if entries:
+                        filters.send_digests(entries)
+                except Exception as e:
+                    logger.warning(f"Digest email failed, retrying in {DIGEST_RETRY // 60} min. {e}")
+                    self.retry_at = now + DIGEST_RETRY
+                    return
+                neardup.record(self.pending)
+                neardup.save()
+                tracing.add_items(len(entries))
+            logger.warning(f"Digest of {len(entries)} entries for {len(self.pending)} new articles queued")
+        else:
+            logger.info("Nothing new for this digest")
+        self.pending = []
+        self.last_sent = now
+        self.retry_at = 0
+        self.save()
+
+################################# Daemon Loop ####################################
+#FUNCTION Save Articles
+def save_articles(backend:str="json")->bool:
+    """Writes this poll's new articles, plus any whose save failed on an
+    earlier poll.  New articles are already in the in-memory store and id
+    index, so a later poll won't fetch them again.  If the save fails their
+    ids wait in UNSAVED and go out with the next save.
+
+    Args:
+        backend (str, optional): article store backend. Defaults to "json".
+
+    Returns:
+        saved (bool): False if the save failed
+    """
+    ids = list(dict.fromkeys(UNSAVED + pipeline.newids))
+    if not ids:
+        return True
+    with tracing.span("store"):
+        try:
+            storage.save_data(pipeline.jsondata, ids)
+            pipeline.idindex.save()
+            search.save(backend)
+        except Exception as e:
+            UNSAVED[:] = ids
+            logger.warning(f"Saving {len(ids)} articles failed, retrying with the next poll. {e}")
+            return False
+        tracing.add_items(len(ids))
+    UNSAVED.clear()
+    return True
+
+#FUNCTION Poll
+def poll(feeds:list, scheduler:FeedScheduler, digest:Digest, backend:str="json"):
+    """Fetches, dedupes and stores one batch of due feeds, then queues the
+    new stories for the digest and reschedules each feed
+
+    Args:
+        feeds (list): (site, category) pairs due now
+        scheduler (FeedScheduler): the feed schedule
+        digest (Digest): pending digest
+        backend (str, optional): article store backend. Defaults to "json".
+    """
+    sites = {site:pipeline.SITES[site] for site, _ in feeds}
+    categories = {}
+    for site, cat in feeds:
+        categories.setdefault(site, []).append(cat)
+    pipeline.newstories, pipeline.newids, pipeline.newdates = [], [], []
+    added = {}
+    with tracing.span("run") as run:
+        prog, task = support.mainspinner(support.get_console(), len(feeds))
+        with prog:
+            results = fetch_all(sites, categories, pipeline.NewArticle, prog, task)
+            for (site, cat), data in results.items():
+                before = len(pipeline.newdates)
+                pipeline.parse_feed(site, cat, data)
+                added[(site, cat)] = pipeline.newdates[before:]
+        client.close()
+        browser.close()
+
+        if pipeline.newids:
+            #Stories are queued before the articles are saved
+            digest.add(pipeline.newstories)
+        #Validators and fingerprints only go to disk once the articles behind them are saved
+        if save_articles(backend):
+            httpcache.save()
+            fingerprints.save()
+        retry.save()
+
+    now = time.time()
+    for site, cat in feeds:
+        #pub_dates come from the articles as they were added, not back out of the store
+        scheduler.observe(site, cat, added.get((site, cat), []), now)
+    tracing.write_summary(run, support.log_dir)
+
+#FUNCTION Run
+def run(backend:str="json", lazy:bool=False, retention:int=None, digest_times:list=DIGEST_TIMES, sites:list=None):
+    """Runs until interrupted, polling each feed on its own schedule and
+    sending digests on theirs
+
+    Args:
+        backend (str, optional): article store backend. Defaults to "json".
+        lazy (bool, optional): json store only, start with the id index. Defaults to False.
+        retention (int, optional): months of descriptions to keep. Defaults to None.
+        digest_times (list, optional): "HH:MM" digest send times. Defaults to DIGEST_TIMES.
+        sites (list, optional): only poll these sites. Defaults to None (all).
+    """
+    #numpy comes in with the id index, not at import
+    from idindex import load_index
+    pipeline.jsondata = storage.load_historical(backend, lazy, retention)
+    pipeline.idindex = load_index(pipeline.jsondata)
+    sources = {site:info[0] for site, info in pipeline.SITES.items()}
+    feeds = [(site, cat) for site, cats in registry.categories(sites).items() for cat in cats if cat]
+    since = int(time.time()) - HISTORY_DAYS * 86400
+    history = pipeline.jsondata.feed_history(since)
+    scheduler = FeedScheduler(feeds, sources, history)
+    if any(site == "AILA" for site, _ in feeds):
+        registry.module("AILA").plan_backfill(history)
+    digest = Digest(digest_times)
+    outbox.start()
+    logger.info(f"Daemon started with {len(feeds)} feeds, digests at {', '.join(digest_times)}")
+
+    try:
+        while True:
+            now = time.time()
+            due = scheduler.due(now)
+            if due:
+                logger.info(f"Polling {len(due)} feeds")
+                try:
+                    poll(due, scheduler, digest, backend)
+                except Exception as e:
+                    #One bad poll shouldn't stop the daemon.  Put the feeds back on their usual schedule
+                    logger.warning(f"Poll of {len(due)} feeds failed. {e}")
+                    failed = time.time()
+                    for site, cat in due:
+                        if not scheduler.scheduled(site, cat):
+                            scheduler.observe(site, cat, [], failed)
+            if digest.due(time.time()):
+                try:
+                    digest.send(time.time())
+                except Exception as e:
+                    logger.warning(f"Digest failed, retrying in {DIGEST_RETRY // 60} min. {e}")
+                    digest.retry_at = time.time() + DIGEST_RETRY
+            nap = min(scheduler.next_due(), digest.next_due()) - time.time()
+            if nap > 0:
+                time.sleep(min(nap, MAX_NAP))
+    except KeyboardInterrupt:
+        logger.warning("Daemon stopping")
+    finally:
+        if UNSAVED:
+            save_articles(backend)
+        digest.save()
+        client.close()
+        browser.close()
+        outbox.stop()
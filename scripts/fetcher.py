@@ -0,0 +1,72 @@
+import contextvars
+from itertools import groupby
+from concurrent.futures import ThreadPoolExecutor
+import politeness
+import tracing
+from support import logger, host_key
+
+################################# Fetch Engine ####################################
+
+#FUNCTION Fetch Host
+def fetch_host(jobs:list, NewArticle, prog:"Progress", jobtask:int)->dict:
+    """Worker for a single host.  Walks that host's categories one at a time
+    so the same server never sees more than one of our requests at once.
+    Spacing between those requests is left to the politeness scheduler.
+
+    Args:
+        jobs (list): List of (site, cat, siteinfo) tuples that all share a host
+        NewArticle (dataclass): Custom data object
+        prog (Progress): Overall progress bar
+        jobtask (int): jobid for the main overall task
+
+    Returns:
+        results (dict): (site, cat) -> list of NewArticle objects or None
+    """
+    results = {}
+    for site, site_jobs in groupby(jobs, key=lambda job: job[0]):
+        with tracing.span("site", site=site):
+            for _, cat, siteinfo in site_jobs:
+                logger.info(f"Parsing {site} for {cat}")
+                with tracing.span("category", cat=cat):
+                    try:
+                        results[(site, cat)] = siteinfo[1].ingest_xml(cat, siteinfo[0], NewArticle)
+                    except Exception as e:
+                        logger.warning(f"{site}:{cat} fetch failed {e}")
+                        results[(site, cat)] = None
+                prog.update(task_id=jobtask, description=f"[green]{site}:{cat}", advance=1)
+    return results
+
+#FUNCTION Fetch All
+def fetch_all(sites:dict, categories:dict, NewArticle, prog:"Progress", jobtask:int)->dict:
+    """Fetches every category of every site on a bounded thread pool.  Each
+    host gets one worker so different hosts are fetched in parallel while
+    requests to the same host stay sequential.
+
+    Args:
+        sites (dict): Site name -> (site address, site module)
+        categories (dict): Site name -> list of categories
+        NewArticle (dataclass): Custom data object
+        prog (Progress): Overall progress bar
+        jobtask (int): jobid for the main overall task
+
+    Returns:
+        results (dict): (site, cat) -> list of NewArticle objects (or None).
+        Keys are ordered the same as sites / categories regardless of which
+        host finished first so downstream dedupe and emailing are
+        deterministic.
+    """
+    order = [(site, cat) for site in sites.keys() for cat in categories.get(site, []) if cat]
+    hosts = {}
+    for site, cat in order:
+        hosts.setdefault(host_key(sites[site][0]), []).append((site, cat, sites[site]))
+
+    finished = {}
+    politeness.attach_progress(prog)
+    with ThreadPoolExecutor(max_workers=max(len(hosts), 1), thread_name_prefix="fetch") as pool:
+        #Each worker runs in its own copy of the context so its spans land under the run span
+        futures = [pool.submit(contextvars.copy_context().run, fetch_host, jobs, NewArticle, prog, jobtask) for jobs in hosts.values()]
+        for fut in futures:
+            finished.update(fut.result())
+
+    results = {key:finished.get(key) for key in order}
+    return results
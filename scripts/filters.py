@@ -0,0 +1,170 @@
+import re
+import json
+from os.path import exists
+import outbox
+from fingerprints import normalize
+from support import logger, urlformat
+
+################################# Recipient Filters ####################################
+#Per recipient include / exclude rules over each story's title, description,
+#creator and category.  ./secret/filters.json looks like
+#
+#   {
+#       "bex@example.com": {
+#           "include": ["chicago", "illinois"],
+#           "exclude": ["asylum", "title:removal"]
+#       },
+#       "*": {"exclude": ["category:Transnational Gangs"]}
+#   }
+#
+#A bare term matches any field, "field:term" only that field.  Matching is case
+#insensitive on whole words.  A recipient with include rules only gets stories
+#that hit one of them, anything hitting an exclude rule is dropped.  "*" holds
+#the rules for recipients that aren't listed.  No file (or no rules) means
+#everyone gets everything.
+#
+#All terms for all recipients are compiled into one regex per field.  Each
+#term maps to a bitmask of the recipients whose rules mention it, so a story is
+#routed with one regex pass per field and a few integer ORs no matter how many
+#recipients or rules there are.
+FILTERS_FP = "./secret/filters.json"
+FIELDS = ("title", "description", "creator", "category")
+DEFAULT = "*"
+
+#CLASS Filter Engine
+class FilterEngine():
+    """Compiled routing rules for a set of recipients
+
+    Args:
+        recipients (list): every address that gets the digest
+        rules (dict): address (or "*") -> {"include":[terms], "exclude":[terms]}
+    """
+    def __init__(self, recipients:list, rules:dict):
+        self.recipients = list(recipients)
+        #field -> term -> bitmask, one table for includes and one for excludes
+        self.include = {field:{} for field in FIELDS}
+        self.exclude = {field:{} for field in FIELDS}
+        #Recipients that only get stories matching an include
+        self.restricted = 0
+        for bit, recipient in enumerate(self.recipients):
+            rule = rules.get(recipient, rules.get(DEFAULT, {}))
+            if rule.get("include"):
+                self.restricted |= 1 << bit
+            for kind, table in (("include", self.include), ("exclude", self.exclude)):
+                for term in rule.get(kind, []):
+                    for field, word in self.parse_term(term):
+                        table[field][word] = table[field].get(word, 0) | (1 << bit)
+        self.everyone = (1 << len(self.recipients)) - 1
+        self.patterns = {field:self.compile(field) for field in FIELDS}
+
+    def parse_term(self, term:str)->list:
+        """"field:term" -> [(field, term)], a bare term -> one per field"""
+        field, sep, word = term.partition(":")
+        if sep and field.strip().lower() in FIELDS:
+            return [(field.strip().lower(), normalize(word).lower())]
+        return [(field, normalize(term).lower()) for field in FIELDS]
+
+    def compile(self, field:str):
+        """One alternation over every term used on a field.  Longest terms go
+        first, and each term also carries the masks of shorter terms inside
+        it, so "removal" still counts when "removal proceedings" is the match.
+        """
+        terms = set(self.include[field]) | set(self.exclude[field])
+        if not terms:
+            return None
+        ordered = sorted(terms, key=len, reverse=True)
+        for table in (self.include[field], self.exclude[field]):
+            for term in ordered:
+                for inner in terms:
+                    if inner != term and inner in table and re.search(rf"(?<!\w){re.escape(inner)}(?!\w)", term):
+                        table[term] = table.get(term, 0) | table[inner]
+        return re.compile(r"(?<!\w)(?:" + "|".join(re.escape(term) for term in ordered) + r")(?!\w)", re.IGNORECASE)
+
+    def route_one(self, story:dict)->int:
+        """Bitmask of the recipients that should get a story
+
+        Args:
+            story (dict): title / description / creator / category
+
+        Returns:
+            mask (int): bit n set if recipients[n] gets it
+        """
+        include = exclude = 0
+        for field, pattern in self.patterns.items():
+            if pattern is None or not story.get(field):
+                continue
+            for hit in pattern.findall(normalize(story[field])):
+                hit = hit.lower()
+                include |= self.include[field].get(hit, 0)
+                exclude |= self.exclude[field].get(hit, 0)
+        allowed = (self.everyone & ~self.restricted) | include
+        return allowed & ~exclude
+
+    def route(self, stories:list)->list:
+        """Splits a run's stories into one list per group of recipients that
+        should get the same thing
+
+        Args:
+            stories (list): (link, site, category, title, description, creator) tuples
+
+        Returns:
+            batches (list): (recipients, stories) pairs, recipients with nothing are left out
+        """
+        masks = []
+        for story in stories:
+            _, _, cat, title, description, creator = (tuple(story) + (None,) * 6)[:6]
+            masks.append(self.route_one({"title":title, "description":description, "creator":creator, "category":cat}))
+        #Recipients that end up with the same stories share an email
+        batches = {}
+        for bit, recipient in enumerate(self.recipients):
+            picked = tuple(i for i, mask in enumerate(masks) if mask >> bit & 1)
+            if picked:
+                batches.setdefault(picked, []).append(recipient)
+        return [(recipients, [stories[i] for i in picked]) for picked, recipients in batches.items()]
+
+#FUNCTION Load Engine
+def load_engine(recipients:list, fp:str=FILTERS_FP)->FilterEngine:
+    """Compiles the rules in filters.json for the given recipients
+
+    Args:
+        recipients (list): every address that gets the digest
+        fp (str, optional): rules file. Defaults to FILTERS_FP.
+
+    Returns:
+        engine (FilterEngine): compiled rules (empty if there's no file)
+    """
+    rules = {}
+    if exists(fp):
+        try:
+            with open(fp, "r") as f:
+                rules = json.loads(f.read())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Couldn't read {fp}, everyone gets every story. {e}")
+    unknown = set(rules) - set(recipients) - {DEFAULT}
+    if unknown:
+        logger.warning(f"Filter rules for addresses not in login.txt {sorted(unknown)}")
+    return FilterEngine(recipients, rules)
+
+################################# Module Interface ####################################
+ENGINE = None
+
+#FUNCTION Send Digests
+def send_digests(stories:list)->int:
+    """Routes the stories through each recipient's rules and queues one email
+    per group of recipients getting the same list
+
+    Args:
+        stories (list): (link, site, category, title, description, creator) tuples
+
+    Returns:
+        emails (int): how many emails were queued
+    """
+    global ENGINE
+    login = outbox.read_login()
+    if ENGINE is None or ENGINE.recipients != login["recipients"]:
+        ENGINE = load_engine(login["recipients"])
+    batches = ENGINE.route(stories)
+    for recipients, picked in batches:
+        outbox.send(urlformat(picked), recipients)
+        logger.info(f"{len(picked)} of {len(stories)} stories queued for {', '.join(recipients)}")
+    return len(batches)
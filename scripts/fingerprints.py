@@ -0,0 +1,108 @@
+import os
+import re
+import json
+import html
+import hashlib
+import threading
+from os.path import exists
+from support import logger
+
+################################# Content Fingerprints ####################################
+#DOS advisories are re-published constantly with the same content.  Rather than
+#comparing full title/description strings against the stored record, each record
+#carries a digest of its normalized content and we compare digests.
+TABLE_FP = "./data/dos_fingerprints.json"
+TAG_RE = re.compile(r"<[^>]+>")
+SPACE_RE = re.compile(r"\s+")
+
+#FUNCTION Normalize
+def normalize(text:str)->str:
+    """Strips markup, unescapes entities and collapses whitespace so only a
+    change in the actual words changes the fingerprint.
+
+    Args:
+        text (str): raw field text
+
+    Returns:
+        text (str): normalized text
+    """
+    if not text:
+        return ""
+    text = html.unescape(TAG_RE.sub(" ", html.unescape(text)))
+    return SPACE_RE.sub(" ", text).strip()
+
+#FUNCTION Fingerprint
+def fingerprint(title:str, description:str, threat_level:str, country:str, keyword:str)->str:
+    """Digest of the normalized fields that make up an advisory
+
+    Returns:
+        digest (str): 128 bit blake2b hex digest
+    """
+    parts = (normalize(x) for x in (title, description, threat_level, country, keyword))
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+#FUNCTION Fingerprint Record
+def fingerprint_record(record)->str:
+    """Fingerprint of a NewArticle or a stored record dict
+
+    Args:
+        record (NewArticle | dict): article to fingerprint
+
+    Returns:
+        digest (str): content fingerprint
+    """
+    get = record.get if isinstance(record, dict) else lambda key: getattr(record, key, "")
+    return fingerprint(get("title"), get("description"), get("threat_level"), get("country"), get("keyword"))
+
+#CLASS Fingerprint Table
+class FingerprintTable():
+    """Per country table of advisory id -> fingerprint, persisted to disk.
+    A flat id lookup is kept alongside so an advisory whose country tag moved
+    is still recognized.
+
+    Args:
+        fp (str): path of the on disk table
+    """
+    def __init__(self, fp:str=TABLE_FP):
+        self.fp = fp
+        self.lock = threading.Lock()
+        self.countries = {}
+        if exists(fp):
+            try:
+                with open(fp, "r") as f:
+                    self.countries = json.loads(f.read())
+            except (OSError, ValueError) as e:
+                logger.warning(f"Couldn't read {fp}, fingerprints will be rebuilt. {e}")
+        self.by_id = {idx:(country, digest) for country, ids in self.countries.items() for idx, digest in ids.items()}
+
+    def get(self, idx:str)->str:
+        found = self.by_id.get(idx)
+        return found[1] if found else None
+
+    def set(self, idx:str, country:str, digest:str):
+        with self.lock:
+            old = self.by_id.get(idx)
+            if old and old[0] != country:
+                self.countries.get(old[0], {}).pop(idx, None)
+            self.countries.setdefault(country or "", {})[idx] = digest
+            self.by_id[idx] = (country or "", digest)
+
+    def save(self):
+        """Atomically writes the table back to disk"""
+        with self.lock:
+            tmp = self.fp + ".tmp"
+            with open(tmp, "w") as out_f:
+                out_f.write(json.dumps(self.countries, indent=2, sort_keys=True))
+            os.replace(tmp, self.fp)
+
+################################# Module Interface ####################################
+TABLE = FingerprintTable(TABLE_FP)
+
+def lookup(idx:str)->str:
+    return TABLE.get(idx)
+
+def remember(idx:str, country:str, digest:str):
+    TABLE.set(idx, country, digest)
+
+def save():
+    TABLE.save()
@@ -1,60 +1,165 @@
+import json
 import time
+import heapq
 import datetime
-import requests
-from support import logger
-from bs4 import BeautifulSoup
+import contextvars
+from os.path import exists
+from urllib.parse import quote_plus, urlsplit, urlunsplit
+from concurrent.futures import ThreadPoolExecutor
+import client
+import httpcache
+import rss
+import tracing
+from support import logger, to_epoch
 
-def date_convert(time_str:str)->datetime:
+################################# Query Fan-out ####################################
+#Each Google category is a set of search queries.  The queries are fetched
+#concurrently (news.google.com gets a pool of 2 sessions and a burst of 2 from
+#the politeness scheduler), each keeps only its newest TOP_N items, and the
+#results are merged in query order with anything already seen (same guid or
+#same link once tracking bits are stripped) dropped.  ./secret/g_news.json
+#overrides the defaults, category -> list of queries.  Only categories in
+#QUERIES can be overridden, they're the ones registered for Google in main.py.
+QUERIES_FP = "./secret/g_news.json"
+QUERIES = {
+    "US Immigration Changes": ["US immigration changes"],
+    "USCIS Updates"         : ["USCIS updates"],
+}
+SEARCH_URL = "https://news.google.com/rss/search?q="
+#Newest items kept per query
+TOP_N = 5
+QUERY_WORKERS = 2
+
+def date_convert(time_str:str)->int:
     # _.strftime("%a, %d %b %y %H:%M:%S %z") #To verify correct converstion
     dateOb = datetime.datetime.strptime(time_str, "%a, %d %b %Y %H:%M:%S %Z")
-    return dateOb
+    #Stored as UTC epoch seconds
+    return to_epoch(dateOb)
+
+#FUNCTION Load Queries
+def load_queries(fp:str=QUERIES_FP)->dict:
+    """Category -> queries, QUERIES overridden by g_news.json if present.
+    Categories that aren't in QUERIES are never fetched, so they're skipped
+    with a warning.
+    """
+    queries = {cat:list(terms) for cat, terms in QUERIES.items()}
+    if exists(fp):
+        try:
+            with open(fp, "r") as f:
+                for cat, terms in json.loads(f.read()).items():
+                    if cat not in queries:
+                        logger.warning(f"{fp} has queries for {cat!r}, only {list(QUERIES)} are fetched")
+                        continue
+                    queries[cat] = [terms] if isinstance(terms, str) else list(terms)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Couldn't read {fp}, using the default queries. {e}")
+    return queries
 
-def get_articles(results:BeautifulSoup, cat:str, source:str, NewArticle)->list:
-    """[Ingest XML of summary page for articles info]
+#FUNCTION Canonical Link
+def canonical_link(link:str)->str:
+    """Link with the query string, fragment and trailing slash dropped and
+    the host lowercased (Google tacks ?oc=5 and the like onto its links)
+    """
+    if not link:
+        return link
+    parts = urlsplit(link.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), "", ""))
+
+def get_articles(content:bytes, cat:str, source:str, NewArticle, top_n:int=TOP_N)->list:
+    """[Stream the RSS items out of the feed for articles info]
 
     Args:
-        result (BeautifulSoup object): html of apartments page
+        content (bytes): raw XML of the feed
         cat (str): category being searched
         source (str): source website
         NewArticle (dataclass) : Dataclass object for NewsArticle
+        top_n (int, optional): newest items to keep. Defaults to TOP_N.
+
+    Returns:
+        articles (list): [List of NewArticle objects, newest first]
+    """
+    with tracing.span("parse"):
+        articles = rss.iter_articles(content, "Google", cat, source, NewArticle, date_convert)
+        #A bounded heap over the stream, only top_n articles are ever held
+        newest = heapq.nlargest(top_n, articles, key=lambda x:x.pub_date or 0)
+        tracing.add_items(len(newest))
+    return newest
+
+#FUNCTION Fetch Query
+def fetch_query(query:str, cat:str, source:str, NewArticle)->list:
+    """[Requests one search feed]
+
+    Args:
+        query (str): search terms
+        cat (str): category being searched
+        source (str): RSS feed origin
+        NewArticle (dataclass): Custom data object
 
     Returns:
-        articles (list): [List of NewArticle objects]
+        new_articles (list): newest TOP_N articles, None if unchanged or failed
     """
+    url = SEARCH_URL + quote_plus(query)
+    headers = {
+        'Upgrade-Insecure-Requests': '1',
+        'User-Agent': 'Mozilla/5.0 (Linux; Android 6.0; Nexus 5 Build/MRA58N) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Mobile Safari/537.36',
+        'sec-ch-ua': '"Not)A;Brand";v="99", "Google Chrome";v="122", "Chromium";v="122"',
+        'sec-ch-ua-mobile': '?1',
+        'sec-ch-ua-platform': '"Android"',
+        'referer': url,
+        'origin':source,
+        'Content-Type': 'text/html,application/xhtml+xml,application/xml'
+    }
+    #Only send the feed if it changed since our last pull
+    headers.update(httpcache.conditional_headers(url))
+    try:
+        response = client.get(url, headers=headers)
+        if response.status_code == 304:
+            #Nothing new, skip the download and the parse
+            httpcache.not_modified(url)
+            return None
+        #Just in case we piss someone off
+        if response.status_code != 200:
+            # If there's an error, log it and return no data for that query
+            logger.warning(f'Status code: {response.status_code}')
+            logger.warning(f'Reason: {response.reason}')
+            return None
+
+    except Exception as e:
+        logger.warning(f"Error {e}")
+        return None
+
+    #Stream the items straight out of the XML
+    parse_start = time.perf_counter()
+    new_articles = get_articles(response.content, cat, source, NewArticle)
+    httpcache.modified(url, response.headers, len(response.content), time.perf_counter() - parse_start)
+    return new_articles
+
+#FUNCTION Merge
+def merge(results:list)->list:
+    """Merges per query results in order, dropping repeats by guid or
+    canonical link
+
+    Args:
+        results (list): list of article lists (None for queries with nothing)
 
-    articles = []
-    #Set the outer loop over each card returned. 
-    for card in results:
-        article = NewArticle()
-        # Time of pull
-        article.pull_date = time.strftime("%m-%d-%Y_%H-%M-%S")
-        for row in card.contents:
-            rname = row.name
-            if row == "\n":
+    Returns:
+        articles (list): unique articles
+    """
+    seen_ids, seen_links, merged = set(), set(), []
+    for articles in results:
+        for article in articles or []:
+            link = canonical_link(article.link)
+            if article.id in seen_ids or (link and link in seen_links):
                 continue
-            match rname:
-                case "title":
-                    article.title = row.text
-                case "link":
-                    article.link = row.text
-                case "description":
-                    article.description = row.text
-                case "pubDate":
-                    article.pub_date = date_convert(row.text)
-                case "source url":
-                    article.creator = row.text
-                case "guid":
-                    article.id = row.text
-        # Assign category
-        article.category = cat
-        # Assign source
-        article.source = source
-        articles.append(article)
-    
-    return sorted(articles, key=lambda x:x.pub_date, reverse=True)[:5] #Only return top 5
+            seen_ids.add(article.id)
+            if link:
+                seen_links.add(link)
+            merged.append(article)
+    return merged
 
 def ingest_xml(cat:str, source:str, NewArticle)->list:
-    """[Outer scraping function to set up request pulls]
+    """[Outer scraping function to set up request pulls.  Fans out over the
+    category's queries]
 
     Args:
         cat (str): category of site to be searched
@@ -64,45 +169,21 @@ def ingest_xml(cat:str, source:str, NewArticle)->list:
     Returns:
         new_articles (list): List of dataclass objects
     """
-    feeds = {
-        "US Immigration Changes":"https://news.google.com/rss/search?q=US+immigration+changes",
-        "USCIS Updates"         :"https://news.google.com/rss/search?q=USCIS+updates",        
-    }
-    for feed in feeds.keys():
-        new_articles = []
-        url = feeds.get(feed)
-        headers = {
-            'Upgrade-Insecure-Requests': '1',
-            'User-Agent': 'Mozilla/5.0 (Linux; Android 6.0; Nexus 5 Build/MRA58N) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Mobile Safari/537.36',
-            'sec-ch-ua': '"Not)A;Brand";v="99", "Google Chrome";v="122", "Chromium";v="122"',
-            'sec-ch-ua-mobile': '?1',
-            'sec-ch-ua-platform': '"Android"',
-            'referer': url,
-            'origin':source,
-            'Content-Type': 'text/html,application/xhtml+xml,application/xml'
-        }
-        try:
-            response = requests.get(url, headers=headers)
-            #Just in case we piss someone off
-            if response.status_code != 200:
-                # If there's an error, log it and return no data for that site
-                logger.warning(f'Status code: {response.status_code}')
-                logger.warning(f'Reason: {response.reason}')
-                return None
-            
-        except Exception as e:            
-            logger.warning(f"Error {e}")
-            return None
-            
-        #Parse the XML
-        bs4ob = BeautifulSoup(response.text, features="xml")
-
-        #Find all records (item CSS)
-        results = bs4ob.find_all("item")
-        if results:
-            new_articles = get_articles(results, cat, source, NewArticle)
-            logger.info(f'{len(new_articles)} articles returned from {source} searching {cat}')
-            return new_articles
-                
-        else:
-            logger.warning(f"No articles returned on {source} / {cat}.  Moving to next feed")
+    queries = load_queries().get(cat)
+    if not queries:
+        logger.warning(f"No Google News queries set up for {cat}")
+        return None
+
+    #Each query gets its own copy of the tracing context so its spans land under this category
+    with ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="g_news") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, fetch_query, query, cat, source, NewArticle) for query in queries]
+        results = [future.result() for future in futures]
+
+    new_articles = merge(results)
+    if new_articles:
+        logger.info(f'{len(new_articles)} articles returned from {source} searching {cat} over {len(queries)} queries')
+        return new_articles
+    elif all(result is None for result in results):
+        logger.info(f"Nothing new on {source} / {cat}")
+    else:
+        logger.warning(f"No articles returned on {source} / {cat}.  Moving to next feed")
@@ -0,0 +1,104 @@
+import os
+import json
+import threading
+from os.path import exists
+from support import logger
+
+################################# Conditional GET Cache ####################################
+#Validators are keyed by feed url.  They're only written to disk at the end of a
+#run (after the articles are saved) so a crash can never leave us thinking we
+#already have a feed we never stored.
+CACHE_FP = "./data/http_cache.json"
+
+#CLASS Validator Cache
+class ValidatorCache():
+    """Persistent ETag / Last-Modified store for the RSS feeds.  Tracks per
+    feed hit/miss counts along with the size and parse time of the last full
+    download so a 304 can report what it saved.
+
+    Args:
+        fp (str): path of the on disk cache
+    """
+    def __init__(self, fp:str=CACHE_FP):
+        self.fp = fp
+        self.lock = threading.Lock()
+        self.feeds = {}
+        if exists(fp):
+            try:
+                with open(fp, "r") as f:
+                    self.feeds = json.loads(f.read())
+            except (OSError, ValueError) as e:
+                logger.warning(f"Couldn't read {fp}, starting a fresh cache. {e}")
+
+    def entry(self, url:str)->dict:
+        return self.feeds.setdefault(url, {"etag":None, "last_modified":None, "hits":0, "misses":0, "bytes":0, "parse_time":0.0})
+
+    def headers(self, url:str)->dict:
+        """Builds the conditional request headers for a feed
+
+        Args:
+            url (str): feed url
+
+        Returns:
+            headers (dict): If-None-Match / If-Modified-Since if we have them
+        """
+        with self.lock:
+            feed = self.feeds.get(url, {})
+            headers = {}
+            if feed.get("etag"):
+                headers["If-None-Match"] = feed["etag"]
+            if feed.get("last_modified"):
+                headers["If-Modified-Since"] = feed["last_modified"]
+            return headers
+
+    def not_modified(self, url:str):
+        """Records a 304 for the feed and logs what it saved us
+
+        Args:
+            url (str): feed url
+        """
+        with self.lock:
+            feed = self.entry(url)
+            feed["hits"] += 1
+            logger.info(f"Feed not modified (304) {url} | hits:{feed['hits']} misses:{feed['misses']} | saved ~{feed['bytes']} bytes and {feed['parse_time']:.3f}s of parsing")
+
+    def modified(self, url:str, resp_headers:dict, size:int, parse_time:float):
+        """Records a full download, remembering its validators for next time
+
+        Args:
+            url (str): feed url
+            resp_headers (dict): response headers
+            size (int): bytes downloaded
+            parse_time (float): seconds spent parsing the feed
+        """
+        with self.lock:
+            feed = self.entry(url)
+            feed["misses"] += 1
+            feed["etag"] = resp_headers.get("ETag") or resp_headers.get("etag")
+            feed["last_modified"] = resp_headers.get("Last-Modified") or resp_headers.get("last-modified")
+            feed["bytes"] = size
+            feed["parse_time"] = round(parse_time, 4)
+            logger.info(f"Feed downloaded {url} | hits:{feed['hits']} misses:{feed['misses']} | {size} bytes parsed in {parse_time:.3f}s")
+
+    def save(self):
+        """Atomically writes the cache back to disk"""
+        with self.lock:
+            tmp = self.fp + ".tmp"
+            with open(tmp, "w") as out_f:
+                out_f.write(json.dumps(self.feeds, indent=2))
+            os.replace(tmp, self.fp)
+
+################################# Module Interface ####################################
+CACHE = ValidatorCache(CACHE_FP)
+
+def conditional_headers(url:str)->dict:
+    return CACHE.headers(url)
+
+def not_modified(url:str):
+    CACHE.not_modified(url)
+
+def modified(url:str, resp_headers:dict, size:int, parse_time:float):
+    CACHE.modified(url, resp_headers, size, parse_time)
+
+def save():
+    CACHE.save()
@@ -1,20 +1,21 @@
 import time
 import datetime
-# import requests
-import curl_cffi as cf
-from support import logger, USER_AGENTS, chrome_version
-from bs4 import BeautifulSoup
+import client
+import httpcache
+import rss
+from support import logger, to_epoch, USER_AGENTS, chrome_version
 
-def date_convert(time_str:str)->datetime:
+def date_convert(time_str:str)->int:
     # dateOb.strftime("%a, %d %b %Y %H:%M:%S %z") #To verify correct converstion
     dateOb = datetime.datetime.strptime(time_str, "%a, %d %b %Y %H:%M:%S %z")
-    return dateOb
+    #Stored as UTC epoch seconds
+    return to_epoch(dateOb)
 
-def get_articles(results:BeautifulSoup, cat:str, source:str, NewArticle)->list:
-    """[Ingest XML of summary page for articles info]
+def get_articles(content:bytes, cat:str, source:str, NewArticle)->list:
+    """[Stream the RSS items out of the feed for articles info]
 
     Args:
-        result (BeautifulSoup object): html 
+        content (bytes): raw XML of the feed
         cat (str): category being searched
         source (str): source website
         NewArticle (dataclass) : Dataclass object for NewsArticle
@@ -22,37 +23,7 @@ def get_articles(results:BeautifulSoup, cat:str, source:str, NewArticle)->list:
     Returns:
         articles (list): [List of NewArticle objects]
     """
-
-    articles = []
-
-    #Set the outer loop over each card returned. 
-    for card in results:
-        article = NewArticle()
-        # Time of pull
-        article.pull_date = time.strftime("%m-%d-%Y_%H-%M-%S")
-        for row in card.contents:
-            rname = row.name
-            if row == "\n":
-                continue
-            match rname:
-                case "title":
-                    article.title = row.text
-                case "link":
-                    article.link = row.text
-                case "description":
-                    article.description = row.text
-                case "pubDate":
-                    article.pub_date = date_convert(row.text)
-                case "source":
-                    article.creator = row.text
-                case "guid":
-                    article.id = row.text
-        # Assign category
-        article.category = cat
-        # Assign source
-        article.source = source
-        articles.append(article)
-
+    articles = rss.parse_articles(content, "ICE", cat, source, NewArticle, date_convert)
     return articles
 
 def ingest_xml(cat:str, source:str, NewArticle)->list:
@@ -92,26 +63,30 @@ def ingest_xml(cat:str, source:str, NewArticle)->list:
         'User-Agent': USER_AGENTS[9],
         'Origin':source,
     }
+    #Only send the feed if it changed since our last pull
+    headers.update(httpcache.conditional_headers(url))
     try:
-        with cf.requests.Session(impersonate="chrome") as session:
-            response = session.get(url=url,headers=headers, impersonate="chrome", timeout=10)
-            #Just in case we piss someone off
-            if response.status_code != 200:
-                # If there's an error, log it and return no data for that site
-                logger.warning(f'Status code: {response.status_code}')
-                logger.warning(f'Reason: {response.reason}')
-                return None
+        #Pooled per host session, reused across every category on the host
+        response = client.get(url, headers=headers, timeout=10)
+        if response.status_code == 304:
+            #Nothing new, skip the download and the parse
+            httpcache.not_modified(url)
+            return None
+        #Just in case we piss someone off
+        if response.status_code != 200:
+            # If there's an error, log it and return no data for that site
+            logger.warning(f'Status code: {response.status_code}')
+            logger.warning(f'Reason: {response.reason}')
+            return None
     except Exception as e:            
         logger.warning(f"Error {e}")
         return None
     
-    #Parse the XML
-    bs4ob = BeautifulSoup(response.text, features="xml")
-
-    #Find all records (item CSS)
-    results = bs4ob.find_all("item")
-    if isinstance(results, list) & (len(results) > 0):
-        new_articles = get_articles(results, cat, source, NewArticle)
+    #Stream the items straight out of the XML
+    parse_start = time.perf_counter()
+    new_articles = get_articles(response.content, cat, source, NewArticle)
+    httpcache.modified(url, response.headers, len(response.content), time.perf_counter() - parse_start)
+    if new_articles:
         logger.info(f'{len(new_articles)} articles returned from {source}')
         return new_articles
             
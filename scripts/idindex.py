@@ -0,0 +1,170 @@
+import os
+import math
+import hashlib
+import numpy as np
+from os.path import exists
+from support import logger
+
+################################# Dedupe Index ####################################
+#Every stored id is kept as a 64 bit hash in a sorted array (8 bytes an id) with
+#a Bloom filter in front of it.  Most ids coming off a feed are already stored,
+#those fall through the filter to a batched np.searchsorted.  Ids the filter
+#has never seen are known new without touching the array at all.
+INDEX_FP = "./data/im_ids.npz"
+
+#Bloom false positive target
+FP_RATE = 0.01
+#Headroom so the filter isn't rebuilt every time a handful of ids are added
+GROWTH = 2
+MIN_CAPACITY = 10000
+
+#FUNCTION Hash IDs
+def hash_ids(ids:list)->np.ndarray:
+    """64 bit blake2b hash of each id
+
+    Args:
+        ids (list): article ids
+
+    Returns:
+        hashes (np.ndarray): uint64 hash per id, same order as ids
+    """
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(idx.encode("utf-8"), digest_size=8).digest(), "little") for idx in ids),
+        dtype=np.uint64,
+        count=len(ids)
+    )
+
+#CLASS ID Index
+class IdIndex():
+    """Bloom filter backed by a sorted array of id hashes
+
+    Args:
+        capacity (int, optional): ids the filter is sized for. Defaults to MIN_CAPACITY.
+    """
+    def __init__(self, capacity:int=MIN_CAPACITY):
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.size_bloom(capacity)
+
+    def __len__(self)->int:
+        return self.hashes.size
+
+    def size_bloom(self, capacity:int):
+        """(Re)builds the filter for capacity ids from the stored hashes
+
+        Args:
+            capacity (int): ids the filter should hold at FP_RATE
+        """
+        self.capacity = max(capacity, MIN_CAPACITY)
+        self.m = int(math.ceil(-self.capacity * math.log(FP_RATE) / math.log(2) ** 2))
+        self.k = max(int(round(self.m / self.capacity * math.log(2))), 1)
+        self.bloom = np.zeros((self.m + 7) // 8, dtype=np.uint8)
+        if self.hashes.size:
+            self.set_bits(self.hashes)
+
+    def positions(self, hashes:np.ndarray)->np.ndarray:
+        """k bit positions per hash via double hashing on the two 32 bit halves
+
+        Returns:
+            pos (np.ndarray): shape (n, k) bit positions
+        """
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.k, dtype=np.uint64)
+        return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.m)
+
+    def set_bits(self, hashes:np.ndarray):
+        pos = self.positions(hashes).ravel()
+        np.bitwise_or.at(self.bloom, (pos >> np.uint64(3)).astype(np.int64), (np.uint8(1) << (pos & np.uint64(7)).astype(np.uint8)))
+
+    def maybe(self, hashes:np.ndarray)->np.ndarray:
+        pos = self.positions(hashes)
+        bits = (self.bloom[(pos >> np.uint64(3)).astype(np.int64)] >> (pos & np.uint64(7)).astype(np.uint8)) & np.uint8(1)
+        return bits.all(axis=1)
+
+    def contains_many(self, ids:list)->np.ndarray:
+        """Batched membership check
+
+        Args:
+            ids (list): article ids
+
+        Returns:
+            found (np.ndarray): bool per id, True if already stored
+        """
+        found = np.zeros(len(ids), dtype=bool)
+        if not ids or not self.hashes.size:
+            return found
+        hashes = hash_ids(ids)
+        maybe = self.maybe(hashes)
+        if maybe.any():
+            candidates = hashes[maybe]
+            pos = np.searchsorted(self.hashes, candidates)
+            pos[pos == self.hashes.size] = 0
+            found[maybe] = self.hashes[pos] == candidates
+        return found
+
+    def add(self, ids:list)->int:
+        """Adds ids, inserting their hashes in sorted position
+
+        Args:
+            ids (list): article ids
+
+        Returns:
+            added (int): how many weren't already in the index
+        """
+        if not ids:
+            return 0
+        hashes = np.unique(hash_ids(ids))
+        pos = np.searchsorted(self.hashes, hashes)
+        present = np.zeros(hashes.size, dtype=bool)
+        inside = pos < self.hashes.size
+        present[inside] = self.hashes[pos[inside]] == hashes[inside]
+        hashes, pos = hashes[~present], pos[~present]
+        if not hashes.size:
+            return 0
+        self.hashes = np.insert(self.hashes, pos, hashes)
+        if self.hashes.size > self.capacity:
+            self.size_bloom(self.hashes.size * GROWTH)
+        else:
+            self.set_bits(hashes)
+        return int(hashes.size)
+
+    def save(self, fp:str=INDEX_FP):
+        """Atomically writes the index to disk"""
+        tmp = fp + ".tmp.npz"
+        np.savez(tmp, hashes=self.hashes, bloom=self.bloom, meta=np.array([self.capacity, self.m, self.k], dtype=np.int64))
+        os.replace(tmp, fp)
+
+    @classmethod
+    def load(cls, fp:str=INDEX_FP):
+        with np.load(fp) as saved:
+            index = cls.__new__(cls)
+            index.hashes = saved["hashes"]
+            index.bloom = saved["bloom"]
+            index.capacity, index.m, index.k = (int(x) for x in saved["meta"])
+        return index
+
+#FUNCTION Load Index
+def load_index(jsondata, fp:str=INDEX_FP)->IdIndex:
+    """Loads the saved dedupe index.  If it's missing, unreadable or doesn't
+    hold the same number of ids as the store (a run died between saving
+    articles and saving the index) it's rebuilt from the store's ids.
+
+    Args:
+        jsondata (dict like): the article store
+        fp (str, optional): index path. Defaults to INDEX_FP.
+
+    Returns:
+        index (IdIndex): dedupe index in sync with the store
+    """
+    if exists(fp):
+        try:
+            index = IdIndex.load(fp)
+            if len(index) == len(jsondata):
+                return index
+            logger.warning(f"Dedupe index has {len(index)} ids, store has {len(jsondata)}. Rebuilding")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Couldn't read {fp}, rebuilding. {e}")
+    ids = list(jsondata.keys())
+    index = IdIndex(len(ids) * GROWTH)
+    index.add(ids)
+    return index
@@ -1,53 +1,42 @@
 #Import libraries
-import numpy as np
+import argparse
 import datetime
 import logging
-from rich.progress import Progress
 from dataclasses import dataclass
-from os.path import exists
 
-import uscis, travel, ice, g_news, aila, boundless, support #cbp,
-from support import log_time, logger, console, move_log
+import registry, sources, support
+import httpcache, client, browser, storage, tracing, retry
+from support import logger, move_log
+from fetcher import fetch_all
 
 ################################# Global Variable Setup ####################################
-SITES = {
-    "USCIS"    : ("https://www.uscis.gov", uscis),
-    "DOS"      : ("https://travel.state.gov", travel),
-    "Boundless": ("https://www.boundless.com", boundless),
-    "Google"   : ("https://www.news.google.com", g_news),
-    "AILA"     : ("https://www.aila.org", aila),    
-    "ICE"      : ("https://www.ice.gov", ice),
-    # "CBP"    : ("https://www.cbp.gov", cbp),  #Sunsetting CBP 3-7-25.  They basically only report finding drugs at the border
-}
-
-CATEGORIES = {
-    "USCIS"    : ["Fact Sheets", "News Releases", "Stakeholder Messages", "Alerts", "Forms Updates"], 
-    "DOS"      : ["main_feed"], 
-    "Boundless": ["Boundless Blog"], #, "Boundless Weekly"    
-    "Google"   : ["US Immigration Changes", "USCIS Updates"],
-    "AILA"     : ["AILA Daily News Update"],
-    "ICE"      : ["Management and Administration", "Operational", "Profesional Responsibility", "National Security", "Partnership and Engagement", "Enforcement and Removal", "Transnational Gangs"]
-    #"CBP"     : ["Travel updates","Trusted traveler updates","Border Security","Newsroom"], #"Border wait time feeds" currently down, Also security might be redundant here
-}
-
-#Define dataclass container
-@dataclass
+#Sites are registered in sources.py
+SITES = registry.sites()
+CATEGORIES = registry.categories()
+
+#Define dataclass container.  Slotted, so a feed's worth of articles doesn't carry a __dict__ each
+@dataclass(slots=True)
 class NewArticle():
     author      : str = None
     category    : str = None
     country     : str = ""
     creator     : str = None
     description : str = None
+    fingerprint : str = ""
     id          : str = None
     identifier  : str = ""
     keyword     : str = ""
     link        : str = None
-    pub_date    : datetime.datetime = ""
+    pub_date    : int = None
     pull_date   : datetime.datetime = ""
     source      : str = None
     threat_level: str = ""
     title       : str = None
 
+    def to_record(self)->dict:
+        """The article as a plain dict for the store, repeated values shared"""
+        return storage.compact_record({name:getattr(self, name) for name in self.__slots__})
+
 ################################# Main Funcs ####################################
 #FUNCTION Add Data
 def add_data(data:list, site:str, cat:str):
@@ -57,33 +46,46 @@ def add_data(data:list, site:str, cat:str):
         data (list): List of NewArticle objects that are new (not in the historical)
         siteinfo (tuple): Tuple of website and category
     """	
+    import search
     ids = [data[x].id for x in range(len(data))]
     #Reshape data to dict
     #make a new dict that can be json serialized with the id as the key
-    new_dict = {data[x].id : data[x].__dict__ for x in range(len(data))}
+    new_dict = {data[x].id : data[x].to_record() for x in range(len(data))}
     #Pop the id from the dict underneath (no need to store it twice)
     [new_dict[x].pop("id") for x in ids]
     if site != "DOS":
-        for val in ["identifier","threat_level","country","keyword" ]:
+        for val in ["identifier","threat_level","country","keyword","fingerprint"]:
             [new_dict[x].pop(val) for x in ids]
+    else:
+        #Remember what each advisory looked like so the next run compares digests
+        import fingerprints
+        [fingerprints.remember(x, new_dict[x]["country"], new_dict[x]["fingerprint"]) for x in ids]
 
     #update main data container
     jsondata.update(new_dict)
     
-    #make tuples of (urls, site, category, title) for emailing
-    newurls = [(new_dict[idx].get("link"), site, cat, new_dict[idx].get("title")) for idx in new_dict.keys()]
+    #make tuples of (urls, site, category, title, description, creator) for emailing.  Description and creator feed the recipient filters
+    newurls = [(new_dict[idx].get("link"), site, cat, new_dict[idx].get("title"), new_dict[idx].get("description"), new_dict[idx].get("creator")) for idx in new_dict.keys()]
     #Extend the newstories global list
     newstories.extend(newurls)
+    #Track which ids need to be written to the article log, and when each was published
+    newids.extend(ids)
+    newdates.extend(new_dict[x].get("pub_date") for x in ids)
+    #Keep the dedupe index current
+    idindex.add(ids)
+    #Stage them for the search index, written with the articles
+    search.add(new_dict)
 
     logger.info(f"data added for {site} in {cat}")
     logger.info(f"These ids were added or altered\n{ids}")
     
 #FUNCTION Check IDs
 def check_ids(data:list):
-    """This function takes in a list of NewArticle objects, reformats them to a
-    dictionary, compares the id's to existing JSON historical id keys, finds
-    any new ones via set comparison. Then returns a list of NewArticle objects
-    that have those new id's (if any)
+    """This function takes in a list of NewArticle objects and checks their
+    id's against the dedupe index in one batch.  The Bloom filter clears
+    anything we've never seen, the rest are confirmed against the sorted id
+    hashes. Then returns a list of NewArticle objects that have new id's (if
+    any)
 
     Args:
         data (list): List of NewArticle objects
@@ -91,25 +93,23 @@ def check_ids(data:list):
     Returns:
         data (list): List of only new NewArticle objects
     """	
-    #Set comparison of jsondata ids and new data ids
-    j_ids = set(jsondata.keys())
-    n_ids = set([data[x].id for x in range(len(data))])
-    newids = n_ids - j_ids
-    if newids:
-        #Only add the articles that are new.  
-        newdata = []
-        [newdata.append(data[idx]) for idx, _ in enumerate(data) if data[idx].id in newids]
+    found = idindex.contains_many([article.id for article in data])
+    #Only add the articles that are new.  
+    newdata = [article for article, stored in zip(data, found) if not stored]
+    if newdata:
         return newdata
     else:
-        logger.info("Articles(s) already stored in im_updates.json") 
+        logger.info("Articles(s) already stored in the article log") 
         return None
 
 #FUNCTION Check Changes
 def check_changes(data:list)->list:
-    """For DOS, we want to track when a record changes, this function examines the
-    title and description of each country's travel status.  If either is
-    different in any way, then the record flagged for updating when
-    the data is added to the jsondata container.
+    """For DOS, we want to track when a record changes.  Each advisory is
+    fingerprinted (normalized title, description, threat level, country and
+    keyword) and the digest is looked up in the per country fingerprint
+    table.  If it differs, the record is flagged for updating when the data
+    is added to the jsondata container.  Whitespace or markup only churn
+    normalizes away and doesn't count as a change.
 
     Args:
         data (list): List of NewArticle objects]
@@ -117,101 +117,172 @@ def check_changes(data:list)->list:
     Returns:
         newdata (list): list of new ids
     """    
+    import fingerprints
     newdata = []
     for newarticle in data:
-        if newarticle.id in jsondata.keys():
-            title = jsondata[newarticle.id]["title"]
-            descript = jsondata[newarticle.id]["description"]
-            if (newarticle.description != descript) | (newarticle.title != title):
-                logger.warning(f"Updated information found for\n{newarticle.title}\n{newarticle.id} ")
-                newdata.append(newarticle)
-        else:
-            #if key doesn't exist in the jsondata container, add the record
+        newarticle.fingerprint = fingerprints.fingerprint_record(newarticle)
+
+    #Stored advisories from before fingerprinting get theirs computed once from the stored copy
+    missing = [newarticle.id for newarticle in data if fingerprints.lookup(newarticle.id) is None and newarticle.id in jsondata]
+    if missing:
+        jsondata.prefetch(missing)
+        for idx in missing:
+            record = jsondata[idx]
+            fingerprints.remember(idx, record.get("country"), fingerprints.fingerprint_record(record))
+
+    for newarticle in data:
+        stored = fingerprints.lookup(newarticle.id)
+        if stored is None:
+            #if the advisory has never been seen, add the record
+            newdata.append(newarticle)
+        elif stored != newarticle.fingerprint:
+            logger.warning(f"Updated information found for\n{newarticle.title}\n{newarticle.id} ")
             newdata.append(newarticle)
     if newdata:
         return newdata
     else:
-        logger.info("No updates from article(s) stored in im_updates.json") 
+        logger.info("No updates from article(s) stored in the article log") 
         return None
 
 #FUNCTION Parse Feed
-def parse_feed(site:str, siteinfo:tuple, prog:Progress, jobtask:int):
-    """This function will iterate through different categories on each RSS feed. Ingesting
-    only the material that we deem important
+def parse_feed(site:str, cat:str, data:list):
+    """This function takes the fetched articles for one site category and
+    ingests only the material that we deem important
 
     Args:
-        site (str): abbrev RSS feed we want to ingest
-        siteinfo (tuple): Tuple of site address and site file we want to run
-        prog (Progress): Overall progress bar
-        jobtask (int): jobid for the main overall task
+        site (str): abbrev RSS feed we ingested
+        cat (str): category of the site that was searched
+        data (list): List of NewArticle objects returned by the site module
     """
-    for cat in CATEGORIES.get(site):
-        if cat:
-            # Update and advance the overall progressbar
-            prog.update(task_id=jobtask, description=f"[green]{site}:{cat}", advance=1)
-            logger.info(f"Parsing {site} for {cat}")
-            data = siteinfo[1].ingest_xml(cat, siteinfo[0], NewArticle)
-
-            #Take a lil nap.  Be nice to the servers!
-            support.add_spin_subt(prog, "server nap", np.random.randint(3, 6))
-
-            #If data was returned
-            if data:
-                #These functions will isolate new id's that aren't in the historical JSON
-                if site != "DOS":
-                    datacheck = check_ids(data)
-                else:
-                    datacheck = check_changes(data)
-
-                if datacheck:
-                    logger.info(f"New data found, cleaning and storing {len(datacheck)} new links")
-                    data = datacheck
-                    del datacheck
-
-                    #Add the articles to the jsondata dict. 
-                    add_data(data, site, cat)
-                    del data
+    #Dedupe and store time is booked under the category's fetch span
+    category = tracing.find("category", site=site, cat=cat)
+    #If data was returned
+    if data:
+        #These functions will isolate new id's that aren't in the historical JSON
+        with tracing.span("dedupe", parent=category):
+            if site != "DOS":
+                datacheck = check_ids(data)
             else:
-                logger.info(f"No data found on {site}")
+                datacheck = check_changes(data)
+            tracing.add_items(len(datacheck or []))
 
-        else:
-            logger.warning(f"{site} is not in validated search list")
+        if datacheck:
+            logger.info(f"New data found, cleaning and storing {len(datacheck)} new links")
+            data = datacheck
+            del datacheck
 
-################################# Start Program ####################################
-@log_time
-def main():
-    global newstories, jsondata
-    newstories = []
-    fp = "./data/im_updates.json"
-    totalstops = sum([len(x) for x in CATEGORIES.values()])
-
-    #Load im_updates.json
-    if exists(fp):
-        jsondata = support.load_historical(fp)
-        logger.info("historical data loaded")
+            #Add the articles to the jsondata dict. 
+            with tracing.span("store", parent=category):
+                add_data(data, site, cat)
+                tracing.add_items(len(data))
+            del data
     else:
-        jsondata = {}
-        logger.warning("No historical data found")
+        logger.info(f"No data found on {site} / {cat}")
 
-    prog, task = support.mainspinner(console, totalstops)
-    with prog:
-        for site, info in SITES.items():
-            parse_feed(site, info, prog, task)
+################################# Start Program ####################################
+def main(backend:str="json", lazy:bool=False, retention:int=None, sites:list=None):
+    #Only needed once a run starts, so importing main (the daemon, the benchmarks) stays cheap
+    import outbox, filters, neardup, search, fingerprints
+    global newstories, newids, newdates, jsondata, idindex
+    newstories, newids, newdates = [], [], []
+    #Only the chosen sites (all by default) are fetched, and only their modules imported
+    run_sites, run_categories = registry.sites(sites), registry.categories(sites)
+    totalstops = sum([len(x) for x in run_categories.values()])
 
-    if newstories:
-        # If new articles are found, save the data to the json file, format the list of dataclassses to a url, send gmail alerting of new articles
-        support.save_data(jsondata)
-        links_html = support.urlformat(newstories)
-        support.send_email_update(links_html)
-        logger.warning(f"{len(newstories)} new articles found.  Email sent")
+    with tracing.span("run") as run:
+        #Anything still spooled from an earlier run goes out while we fetch
+        outbox.start()
+        #Load the article store
+        with tracing.span("load"):
+            #numpy comes in with the id index, not at import
+            from idindex import load_index
+            jsondata = storage.load_historical(backend, lazy, retention)
+            idindex = load_index(jsondata)
+            #Weekdays AILA posted that never made it into the store are fetched with today's page
+            if "AILA" in run_sites:
+                aila = registry.module("AILA")
+                since = int(datetime.datetime.now().timestamp()) - aila.BACKFILL_DAYS * 86400
+                aila.plan_backfill(jsondata.feed_history(since))
+            tracing.add_items(len(jsondata))
+        if len(jsondata):
+            logger.info("historical data loaded")
+        else:
+            logger.warning("No historical data found")
 
-    else:
-        logger.critical("No new articles were found")
-    
+        prog, task = support.mainspinner(support.get_console(), totalstops)
+        with prog:
+            #Hosts are fetched in parallel, results come back in SITES/CATEGORIES order
+            results = fetch_all(run_sites, run_categories, NewArticle, prog, task)
+            for (site, cat), data in results.items():
+                parse_feed(site, cat, data)
+        #Done with the network, drop the pooled sessions and the browser
+        client.close()
+        browser.close()
+
+        if newstories:
+            # If new articles are found, queue the email first so it survives anything after this, then save the data to the article log
+            with tracing.span("email"):
+                #The same story from several sources becomes one entry, then each recipient gets the stories their filters let through
+                digest = neardup.dedupe(newstories)
+                if digest:
+                    filters.send_digests(digest)
+                    neardup.record(newstories)
+                tracing.add_items(len(digest))
+            with tracing.span("store"):
+                storage.save_data(jsondata, newids)
+                idindex.save()
+                search.save(backend)
+                tracing.add_items(len(newids))
+            logger.warning(f"{len(newstories)} new articles found.  Email queued")
+
+        else:
+            logger.critical("No new articles were found")
+
+        #Feed validators and fingerprints are only persisted once the articles behind them are saved
+        httpcache.save()
+        fingerprints.save()
+        neardup.save()
+        retry.save()
+
+        #Give the sender a chance to deliver before we exit, whatever's left is retried next run
+        with tracing.span("deliver"):
+            outbox.flush()
+            outbox.stop()
+
+    tracing.write_summary(run, support.log_dir)
     logger.info("Program shutting down")
 
 if __name__ == "__main__":
-    main()
+    import search, outbox
+    parser = argparse.ArgumentParser(description="Immigration news aggregator")
+    parser.add_argument("--store", choices=["json", "sqlite"], default="json", help="article storage backend")
+    parser.add_argument("--lazy", action="store_true", help="json store only, load just the id index at startup")
+    parser.add_argument("--retention", type=int, default=None, metavar="MONTHS", help="drop article descriptions older than MONTHS (ids are kept)")
+    parser.add_argument("--daemon", action="store_true", help="keep running, polling each feed at its own learned rate")
+    parser.add_argument("--digest-at", nargs="+", default=None, metavar="HH:MM", help="daemon only, local times to send the email digest")
+    parser.add_argument("--sites", nargs="+", default=None, choices=registry.names(), help="only fetch these sites")
+    parser.add_argument("--smtp", default=None, metavar="HOST:PORT", help="send through a plain SMTP server (ie a local stand-in) instead of the configured one")
+    commands = parser.add_subparsers(dest="command")
+    search_p = commands.add_parser("search", help="full text search of stored articles")
+    search_p.add_argument("query", nargs="?", default="", help='terms, "a phrase", prefix*, field:term (title, description, creator, category), AND/OR/NOT')
+    search_p.add_argument("--source", nargs="+", default=None, help="only these sites (ie USCIS Google)")
+    search_p.add_argument("--since", default=None, metavar="YYYY-MM-DD", help="published on or after")
+    search_p.add_argument("--until", default=None, metavar="YYYY-MM-DD", help="published on or before")
+    search_p.add_argument("--limit", type=int, default=search.LIMIT, help="most results to show")
+    search_p.add_argument("--recent", action="store_true", help="newest first instead of best match first")
+    search_p.add_argument("--rebuild", action="store_true", help="reindex the whole archive first")
+    args = parser.parse_args()
+    if args.smtp:
+        host, port = args.smtp.rsplit(":", 1)
+        outbox.configure(host, int(port))
+    if args.command == "search":
+        sources = [SITES[x][0] if x in SITES else x for x in args.source] if args.source else None
+        search.run_search(args.query, sources, args.since, args.until, args.limit, args.recent, args.store, args.rebuild)
+    elif args.daemon:
+        import daemon
+        daemon.run(args.store, args.lazy, args.retention, args.digest_at or daemon.DIGEST_TIMES, args.sites)
+    else:
+        main(args.store, args.lazy, args.retention, args.sites)
     logging.shutdown()
     move_log()
 
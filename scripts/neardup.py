@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import time
+import hashlib
+from functools import lru_cache
+from os.path import exists
+from fingerprints import normalize
+from support import logger
+
+################################# Near Duplicates ####################################
+#The same story often comes in from several places (a USCIS release, then the
+#Google News pickup of it under both queries) with different ids.  Each story
+#gets a 64 bit SimHash of its normalized title and the start of its
+#description.  Stories within MAX_DISTANCE bits of each other are the same
+#story.  Signatures are split into MAX_DISTANCE + 1 bands, and two signatures
+#that close must agree exactly on at least one band.  Each band is a dict, so
+#finding candidates is a handful of lookups, not a scan of the index.  Only
+#stories from different sites are matched, one site doesn't repeat its own
+#story, and two of its posts being close just means they share a template.
+#DOS advisories are all one template (level, country, boilerplate) so they're
+#left out of matching entirely.
+INDEX_FP = "./data/neardup.json"
+MAX_DISTANCE = 5
+BANDS = MAX_DISTANCE + 1
+#Stories stay in the index this long, a repeat after that is news again
+WINDOW_DAYS = 14
+#Title words count this many times more than description words
+TITLE_WEIGHT = 3
+#Only the opening of a description says what the story is about
+DESCRIPTION_WORDS = 40
+#Which link leads a collapsed cluster, the official source first
+SOURCE_RANK = ["USCIS", "DOS", "ICE", "AILA", "Boundless", "Google"]
+#Sites never matched, their stories always go out as they are
+UNMATCHED_SITES = {"DOS"}
+
+WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "in", "is", "it",
+    "its", "of", "on", "or", "that", "the", "to", "was", "were", "will", "with",
+}
+#Band boundaries over the 64 bits
+BAND_BITS = [(64 * band // BANDS, 64 * (band + 1) // BANDS) for band in range(BANDS)]
+
+#FUNCTION Tokens
+def tokens(text:str)->list:
+    return [w for w in WORD_RE.findall(normalize(text).lower()) if w not in STOPWORDS]
+
+#FUNCTION SimHash
+@lru_cache(maxsize=4096)
+def simhash(title:str, description:str, creator:str=None)->int:
+    """64 bit SimHash of a story.  Features are the words and word pairs of
+    the title (weighted up) and the opening words of the description.  A
+    trailing " - Outlet" on the title (how Google News titles stories) is
+    dropped first.
+
+    Returns:
+        signature (int): 64 bit signature
+    """
+    title = title or ""
+    if creator and title.endswith(f" - {creator}"):
+        title = title[:-len(creator) - 3]
+    weights = {}
+    for words, weight in ((tokens(title), TITLE_WEIGHT), (tokens(description or "")[:DESCRIPTION_WORDS], 1)):
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            weights[feature] = weights.get(feature, 0) + weight
+    totals = [0] * 64
+    for feature, weight in weights.items():
+        digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        for bit in range(64):
+            totals[bit] += weight if digest >> bit & 1 else -weight
+    return sum(1 << bit for bit in range(64) if totals[bit] > 0)
+
+def distance(a:int, b:int)->int:
+    return (a ^ b).bit_count()
+
+def bands(signature:int)->list:
+    return [(band, (signature >> lo) & ((1 << (hi - lo)) - 1)) for band, (lo, hi) in enumerate(BAND_BITS)]
+
+#CLASS SimHash Index
+class SimHashIndex():
+    """Recent story signatures banded for near neighbour lookups, persisted
+    to disk between runs
+
+    Args:
+        fp (str, optional): path of the on disk index.  None keeps it in memory. Defaults to None.
+    """
+    def __init__(self, fp:str=None):
+        self.fp = fp
+        #link -> (signature, added epoch, site)
+        self.entries = {}
+        self.buckets = {}
+        if fp and exists(fp):
+            try:
+                with open(fp, "r") as f:
+                    for link, (signature, added, *site) in json.loads(f.read()).items():
+                        #Entries from before sites were kept have none, and never match
+                        self.add(link, int(signature, 16), added, site[0] if site else None)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Couldn't read {fp}, near duplicate index starts empty. {e}")
+
+    def __len__(self)->int:
+        return len(self.entries)
+
+    def add(self, link:str, signature:int, added:float=None, site:str=None):
+        if link in self.entries:
+            return
+        self.entries[link] = (signature, added or time.time(), site)
+        for key in bands(signature):
+            self.buckets.setdefault(key, []).append(link)
+
+    def near(self, signature:int, site:str)->list:
+        """Indexed links within MAX_DISTANCE of a signature from another
+        (known) site
+        """
+        found = set()
+        for key in bands(signature):
+            for link in self.buckets.get(key, []):
+                other = self.entries[link]
+                if link not in found and other[2] is not None and other[2] != site and distance(signature, other[0]) <= MAX_DISTANCE:
+                    found.add(link)
+        return list(found)
+
+    def prune(self, now:float):
+        """Drops everything older than WINDOW_DAYS and rebuilds the buckets"""
+        cutoff = now - WINDOW_DAYS * 86400
+        kept = {link:entry for link, entry in self.entries.items() if entry[1] >= cutoff}
+        self.entries, self.buckets = {}, {}
+        for link, (signature, added, site) in kept.items():
+            self.add(link, signature, added, site)
+
+    def save(self):
+        """Atomically writes the (pruned) index back to disk"""
+        self.prune(time.time())
+        tmp = self.fp + ".tmp"
+        with open(tmp, "w") as out_f:
+            out_f.write(json.dumps({link:(f"{sig:016x}", added, site) for link, (sig, added, site) in self.entries.items()}))
+        os.replace(tmp, self.fp)
+
+#FUNCTION Collapse
+def collapse(stories:list, index:SimHashIndex)->list:
+    """Clusters near duplicate stories from different sites and keeps one
+    digest entry per cluster.  The entry's link comes from the highest ranked
+    source and the rest of the cluster rides along as alternates.  Stories
+    matching one another site sent in an earlier digest are dropped.
+    UNMATCHED_SITES stories are passed through untouched.  The index isn't
+    changed, record() adds the stories once the digest is actually queued.
+
+    Args:
+        stories (list): (link, site, category, title, description, creator) tuples
+        index (SimHashIndex): signatures of stories already sent
+
+    Returns:
+        stories (list): one tuple per cluster, with a 7th element of
+        [(link, outlet or site), ...] alternates
+    """
+    matched = [story[1] not in UNMATCHED_SITES for story in stories]
+    signatures = [simhash(story[3], story[4], story[5]) if match else None for story, match in zip(stories, matched)]
+    #Union find over this run's stories, neighbours come from a banded index of the run itself
+    parent = list(range(len(stories)))
+    def find(i:int)->int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    #Sites in each cluster (by root), a cluster never takes two stories from one site
+    sites = {i:{story[1]} for i, story in enumerate(stories)}
+    run = SimHashIndex()
+    for i, signature in enumerate(signatures):
+        if signature is None:
+            continue
+        for other in run.near(signature, stories[i][1]):
+            a, b = find(int(other)), find(i)
+            if a != b and not sites[a] & sites[b]:
+                parent[a] = b
+                sites[b] |= sites.pop(a)
+        run.add(str(i), signature, site=stories[i][1])
+
+    clusters = {}
+    for i in range(len(stories)):
+        clusters.setdefault(find(i), []).append(i)
+    rank = {site:n for n, site in enumerate(SOURCE_RANK)}
+    collapsed = []
+    for members in sorted(clusters.values(), key=min):
+        seen = [link for i in members if matched[i] for link in index.near(signatures[i], stories[i][1]) if link != stories[i][0]]
+        if seen:
+            logger.info(f"Dropping {len(members)} stories already sent as {seen[0]}")
+            continue
+        members.sort(key=lambda i: (rank.get(stories[i][1], len(rank)), i))
+        lead = stories[members[0]]
+        #Google pickups are labelled with their outlet
+        alternates = [(stories[i][0], stories[i][5] or stories[i][1]) for i in members[1:] if stories[i][0] != lead[0]]
+        collapsed.append(tuple(lead[:6]) + (alternates,))
+    if len(collapsed) < len(stories):
+        logger.info(f"{len(stories)} new stories collapsed to {len(collapsed)} digest entries")
+    #Keep the digest in the order the stories came in
+    order = {story[0]:n for n, story in enumerate(stories)}
+    return sorted(collapsed, key=lambda story: order[story[0]])
+
+################################# Module Interface ####################################
+INDEX = SimHashIndex(INDEX_FP)
+
+def dedupe(stories:list)->list:
+    return collapse(stories, INDEX)
+
+def record(stories:list):
+    """Adds stories that went out in a digest to the index"""
+    for story in stories:
+        if story[1] not in UNMATCHED_SITES:
+            INDEX.add(story[0], simhash(story[3], story[4], story[5]), site=story[1])
+
+def save():
+    INDEX.save()
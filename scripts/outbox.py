@@ -0,0 +1,344 @@
+import os
+import ssl
+import json
+import time
+import uuid
+import random
+import smtplib
+import threading
+from os.path import exists
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from support import logger
+
+################################# Outbox Spool ####################################
+#Emails are written to a spool directory before anything is sent, one JSON file
+#per message written atomically.  A background sender delivers them over a
+#single authenticated SMTP connection it keeps open between messages.  A
+#message is only deleted once the server has accepted it.  Failures stay in the
+#spool and are retried with backoff, including by the next run.
+OUTBOX_DIR = "./data/outbox"
+LOGIN_FP = "./secret/login.txt"
+#Optional server override, same key:value lines as login.txt (host, port, security)
+SMTP_FP = "./secret/smtp.txt"
+SMTP_DEFAULTS = {"host":"smtp.gmail.com", "port":465, "security":"ssl"}
+
+#Backoff between delivery attempts of a message
+RETRY_BASE = 30
+RETRY_MAX = 3600
+#After this many attempts the message is parked in OUTBOX_DIR/dead
+MAX_ATTEMPTS = 12
+#Drop an idle connection after this long rather than find out it's stale mid send
+IDLE_TIMEOUT = 240
+
+#FUNCTION Read Login
+def read_login(fp:str=LOGIN_FP)->dict:
+    """Sender, password and recipients from login.txt
+
+    Returns:
+        login (dict): sender, password, recipients
+    """
+    with open(fp) as login_file:
+        login = login_file.read().splitlines()
+    return {
+        "sender"    :login[0].split(':')[1],
+        "password"  :login[1].split(':')[1],
+        "recipients":login[2].split(':')[1].split(","),
+    }
+
+#FUNCTION Read SMTP
+def read_smtp(fp:str=SMTP_FP)->dict:
+    """SMTP server settings, SMTP_DEFAULTS overridden by smtp.txt if present
+
+    Returns:
+        settings (dict): host, port, security ("ssl", "starttls" or "none")
+    """
+    settings = dict(SMTP_DEFAULTS)
+    if exists(fp):
+        with open(fp) as smtp_file:
+            for line in smtp_file.read().splitlines():
+                if ":" in line:
+                    key, value = line.split(":", 1)
+                    settings[key.strip()] = value.strip()
+    settings["port"] = int(settings["port"])
+    return settings
+
+#FUNCTION Compose
+def compose(urls:str, sender:str, recipients:list)->MIMEMultipart:
+    """Builds the update email around the formatted link list
+
+    Args:
+        urls (str): html list of links from urlformat
+        sender (str): from address
+        recipients (list): to addresses
+
+    Returns:
+        message (MIMEMultipart): the email
+    """
+    html = """
+        <html>
+            <body>
+                <p>Helloooooooooooo,<br>
+                Rob wanted you to look at these new articles!<br>
+                """ + urls + """
+                </p>
+            </body>
+        </html>
+        """
+    message = MIMEMultipart("alternative")
+    if "Forms Updates" in urls:
+        message["Subject"] = "FORMS FORMS FORMS!!! -> Immigration updates from Rob!"
+    else:
+        message["Subject"] = "Immigration Updates ala Rob!"
+    message["From"] = sender
+    message["To"] = ", ".join(recipients)   #multiple emails need to be comma separated strings
+    message.attach(MIMEText(html, "html"))
+    return message
+
+#CLASS Outbox
+class Outbox():
+    """Durable spool plus the background sender that drains it
+
+    Args:
+        spool (str, optional): spool directory. Defaults to OUTBOX_DIR.
+        smtp (dict, optional): server settings. Defaults to read_smtp().
+    """
+    def __init__(self, spool:str=OUTBOX_DIR, smtp:dict=None):
+        self.spool = spool
+        self.smtp = smtp
+        self.login = None
+        self.server = None
+        self.last_used = 0
+        self.thread = None
+        self.stopping = threading.Event()
+        self.wake = threading.Condition()
+
+    ############################ Spool ############################
+    def enqueue(self, sender:str, recipients:list, message:str)->str:
+        """Writes a message to the spool and fsyncs it before returning
+
+        Returns:
+            fp (str): spool file for the message
+        """
+        os.makedirs(self.spool, exist_ok=True)
+        name = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.json"
+        fp = os.path.join(self.spool, name)
+        self.write(fp, {"sender":sender, "recipients":recipients, "message":message, "attempts":0, "next_attempt":0})
+        with self.wake:
+            self.wake.notify_all()
+        logger.info(f"Email queued in {fp}")
+        return fp
+
+    def write(self, fp:str, entry:dict):
+        tmp = fp + ".tmp"
+        with open(tmp, "w") as out_f:
+            out_f.write(json.dumps(entry))
+            out_f.flush()
+            os.fsync(out_f.fileno())
+        os.replace(tmp, fp)
+
+    def pending(self)->list:
+        """Spooled message files, oldest first"""
+        if not exists(self.spool):
+            return []
+        return sorted(os.path.join(self.spool, x) for x in os.listdir(self.spool) if x.endswith(".json"))
+
+    ############################ SMTP ############################
+    def connect(self)->smtplib.SMTP:
+        """Reuses the open connection if it's still alive, otherwise opens
+        and authenticates a new one
+        """
+        if self.server is not None:
+            if time.monotonic() - self.last_used < IDLE_TIMEOUT:
+                try:
+                    if self.server.noop()[0] == 250:
+                        return self.server
+                except smtplib.SMTPException:
+                    pass
+            self.disconnect()
+        smtp = self.smtp or read_smtp()
+        if smtp["security"] == "ssl":
+            server = smtplib.SMTP_SSL(smtp["host"], smtp["port"], context=ssl.create_default_context(), timeout=30)
+        else:
+            server = smtplib.SMTP(smtp["host"], smtp["port"], timeout=30)
+            if smtp["security"] == "starttls":
+                server.starttls(context=ssl.create_default_context())
+        if smtp["security"] != "none":
+            self.login = self.login or read_login()
+            server.login(self.login["sender"], self.login["password"])
+        self.server = server
+        return server
+
+    def disconnect(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.server = None
+
+    ############################ Delivery ############################
+    def deliver(self, fp:str)->bool:
+        """Attempts one spooled message.  Deleted on acceptance, otherwise
+        rescheduled with backoff (or parked after MAX_ATTEMPTS).  Anything
+        going wrong on the way to the server, bad login.txt included, counts
+        as a failed attempt.
+
+        Raises:
+            KeyError, ValueError: the spool entry can't be read
+
+        Returns:
+            sent (bool): True if the server accepted it
+        """
+        with open(fp, "r") as f:
+            entry = json.loads(f.read())
+        sender, recipients, message = entry["sender"], entry["recipients"], entry["message"]
+        if entry["next_attempt"] > time.time():
+            return False
+        try:
+            server = self.connect()
+            refused = server.sendmail(sender, recipients, message)
+            self.last_used = time.monotonic()
+            if refused:
+                logger.warning(f"Some recipients were refused {refused}")
+            os.remove(fp)
+            logger.info(f"Email delivered to {len(recipients) - len(refused)} recipients")
+            return True
+        except Exception as e:
+            self.disconnect()
+            entry["attempts"] = entry.get("attempts", 0) + 1
+            if entry["attempts"] >= MAX_ATTEMPTS:
+                self.park(fp, f"Giving up on {fp} after {entry['attempts']} attempts. {e}")
+                return False
+            delay = min(RETRY_BASE * 2 ** (entry["attempts"] - 1), RETRY_MAX) * random.uniform(0.8, 1.2)
+            entry["next_attempt"] = time.time() + delay
+            self.write(fp, entry)
+            logger.warning(f"Email delivery failed, retrying in {delay:.0f}s. {e}")
+            return False
+
+    def park(self, fp:str, reason:str):
+        """Moves a message out of the spool into OUTBOX_DIR/dead"""
+        dead = os.path.join(self.spool, "dead")
+        try:
+            os.makedirs(dead, exist_ok=True)
+            os.replace(fp, os.path.join(dead, os.path.basename(fp)))
+        except OSError as e:
+            reason += f" (and couldn't move it to {dead}. {e})"
+        logger.critical(reason)
+
+    def next_attempt(self, fp:str)->float:
+        """When a spooled message is next due, None if it can't be read"""
+        try:
+            with open(fp, "r") as f:
+                return float(json.loads(f.read())["next_attempt"])
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+
+    def drain(self)->float:
+        """Delivers everything that's due.  A message that can't be handled
+        at all (a malformed spool entry) is parked so it can't block the rest.
+
+        Returns:
+            wait (float): seconds until the next retry is due (None if the spool is empty)
+        """
+        for fp in self.pending():
+            if self.stopping.is_set():
+                break
+            try:
+                self.deliver(fp)
+            except FileNotFoundError:
+                #Gone since the listing
+                continue
+            except Exception as e:
+                self.park(fp, f"Couldn't handle spooled email {fp}, moved to dead. {e!r}")
+        waits = [x - time.time() for x in map(self.next_attempt, self.pending()) if x is not None]
+        return max(min(waits), 0) if waits else None
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                wait = self.drain()
+            except Exception as e:
+                #Keep the sender alive, the spool is still on disk for the next pass
+                logger.warning(f"Outbox pass failed, trying again in {RETRY_BASE}s. {e!r}")
+                wait = RETRY_BASE
+            if self.server is not None and time.monotonic() - self.last_used >= IDLE_TIMEOUT:
+                self.disconnect()
+            with self.wake:
+                self.wake.notify_all()
+                self.wake.wait(timeout=min(wait, IDLE_TIMEOUT) if wait is not None else IDLE_TIMEOUT)
+        self.disconnect()
+
+    ############################ Control ############################
+    def start(self):
+        """Starts the background sender (once).  Anything left in the spool
+        from an earlier run goes out first.
+        """
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="outbox", daemon=True)
+        self.thread.start()
+
+    def flush(self, timeout:float=60)->bool:
+        """Waits for the spool to empty (or only hold messages backing off)
+
+        Args:
+            timeout (float, optional): seconds to wait. Defaults to 60.
+
+        Returns:
+            empty (bool): True if nothing is left to send
+        """
+        deadline = time.monotonic() + timeout
+        with self.wake:
+            self.wake.notify_all()
+            while time.monotonic() < deadline:
+                due = [fp for fp in self.pending() if self.due(fp)]
+                if not due:
+                    break
+                self.wake.wait(timeout=min(1, max(deadline - time.monotonic(), 0)))
+        left = len(self.pending())
+        if left:
+            logger.warning(f"{left} emails still in {self.spool}, they'll be retried")
+        return not left
+
+    def due(self, fp:str)->bool:
+        when = self.next_attempt(fp)
+        return when is not None and when <= time.time()
+
+    def stop(self):
+        self.stopping.set()
+        with self.wake:
+            self.wake.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=30)
+            self.thread = None
+
+################################# Module Interface ####################################
+OUTBOX = Outbox(OUTBOX_DIR)
+
+def configure(host:str, port:int, security:str="none"):
+    """Points the sender at another server (a local SMTP stand-in for testing)"""
+    OUTBOX.smtp = {"host":host, "port":int(port), "security":security}
+
+def send(urls:str, recipients:list=None):
+    """Queues the update email for the formatted link list
+
+    Args:
+        urls (str): html list of links from urlformat
+        recipients (list, optional): who gets it. Defaults to everyone in login.txt.
+    """
+    login = read_login()
+    recipients = recipients or login["recipients"]
+    message = compose(urls, login["sender"], recipients)
+    OUTBOX.enqueue(login["sender"], recipients, message.as_string())
+
+def start():
+    OUTBOX.start()
+
+def flush(timeout:float=60)->bool:
+    return OUTBOX.flush(timeout)
+
+def stop():
+    OUTBOX.stop()
@@ -0,0 +1,184 @@
+import time
+import random
+import threading
+import datetime
+import support
+import tracing
+from support import logger, host_key
+
+################################# Host Policies ####################################
+#min_interval: seconds between requests to the same host once the burst is spent
+#jitter      : up to this many random seconds added whenever we do have to wait
+#burst       : how many requests can go out back to back before we start waiting
+HOST_POLICIES = {
+    "uscis.gov"        : {"min_interval":3.0, "jitter":2.0, "burst":1},
+    "ice.gov"          : {"min_interval":3.0, "jitter":2.0, "burst":1},
+    "travel.state.gov" : {"min_interval":3.0, "jitter":2.0, "burst":1},
+    "news.google.com"  : {"min_interval":2.0, "jitter":1.0, "burst":2},
+    "aila.org"         : {"min_interval":3.0, "jitter":2.0, "burst":1},
+    "boundless.com"    : {"min_interval":3.0, "jitter":2.0, "burst":1},
+    "default"          : {"min_interval":3.0, "jitter":2.0, "burst":1},
+}
+
+#Never let a server park us for longer than this
+MAX_DEFER = 300
+
+################################# Token Bucket ####################################
+#CLASS Host Bucket
+class HostBucket():
+    """Token bucket for a single host.  Tokens refill at one per
+    min_interval up to burst.  Each request spends one token, if none are
+    left the caller sleeps until one refills.
+
+    Args:
+        min_interval (float): seconds per token refill
+        jitter (float): max random seconds added to any wait
+        burst (int): bucket capacity
+    """
+    def __init__(self, min_interval:float, jitter:float, burst:int):
+        self.min_interval = min_interval
+        self.jitter = jitter
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.last = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self)->float:
+        """Takes a token and returns how long the caller has to sleep before
+        using it.  Tokens can go negative so concurrent callers queue up
+        behind each other instead of all waking at once.
+
+        Returns:
+            wait (float): seconds to sleep before sending the request
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.min_interval > 0:
+                self.tokens = min(self.burst, self.tokens + (now - self.last) / self.min_interval)
+            else:
+                self.tokens = self.burst
+            self.last = now
+            self.tokens -= 1
+            wait = max(-self.tokens * self.min_interval, self.blocked_until - now, 0.0)
+            if wait > 0:
+                wait += random.uniform(0, self.jitter)
+            return wait
+
+    def defer(self, seconds:float):
+        """Pushes the next allowed request at least seconds into the future
+
+        Args:
+            seconds (float): how long the server asked us to back off
+        """
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + min(seconds, MAX_DEFER))
+
+#CLASS Host Scheduler
+class HostScheduler():
+    """Hands out request slots per host.  Only sleeps when the same host
+    would otherwise be hit too soon, different hosts never wait on each other.
+
+    Args:
+        policies (dict): host -> min_interval / jitter / burst settings
+    """
+    def __init__(self, policies:dict=HOST_POLICIES):
+        self.policies = policies
+        self.buckets = {}
+        self.prog = None
+        self.lock = threading.Lock()
+
+    def bucket(self, host:str)->HostBucket:
+        with self.lock:
+            if host not in self.buckets:
+                policy = self.policies.get(host, self.policies["default"])
+                self.buckets[host] = HostBucket(**policy)
+            return self.buckets[host]
+
+    def wait(self, url:str):
+        """Blocks until the host behind url can take another request
+
+        Args:
+            url (str): address about to be requested
+        """
+        host = host_key(url)
+        wait = self.bucket(host).reserve()
+        if wait <= 0:
+            return
+        logger.debug(f"Waiting {wait:.1f}s before hitting {host}")
+        with tracing.span("wait", host=host):
+            if self.prog is not None:
+                support.add_spin_subt(self.prog, f"{host} server nap", wait)
+            else:
+                time.sleep(wait)
+
+    def crawl_delay(self, url:str, seconds:float):
+        """Raises the host's min interval to a crawl-delay the site published
+
+        Args:
+            url (str): any address on the host
+            seconds (float): crawl-delay in seconds
+        """
+        bucket = self.bucket(host_key(url))
+        with bucket.lock:
+            if seconds > bucket.min_interval:
+                logger.info(f"Honoring crawl-delay of {seconds}s for {host_key(url)}")
+                bucket.min_interval = float(seconds)
+
+    def observe(self, url:str, status:int, headers:dict):
+        """Looks at a response for Retry-After.  Servers send it with 429
+        and 503 to tell us when they're willing to talk again.
+
+        Args:
+            url (str): address that was requested
+            status (int): response status code
+            headers (dict): response headers
+        """
+        if not headers:
+            return
+        retry = headers.get("Retry-After") or headers.get("retry-after")
+        if retry is None:
+            return
+        seconds = retry_after_seconds(retry)
+        if seconds and status in (429, 503):
+            logger.warning(f"{host_key(url)} asked us to wait {seconds:.0f}s (Retry-After)")
+            self.bucket(host_key(url)).defer(seconds)
+
+#FUNCTION Retry After Seconds
+def retry_after_seconds(value:str)->float:
+    """Retry-After can either be a number of seconds or an HTTP date.
+
+    Args:
+        value (str): Retry-After header value
+
+    Returns:
+        seconds (float): seconds from now, None if it can't be read
+    """
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+    #Dates are rare, the email package isn't worth importing for every run
+    from email.utils import parsedate_to_datetime
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max((when - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0.0)
+
+################################# Module Interface ####################################
+SCHEDULER = HostScheduler(HOST_POLICIES)
+
+def attach_progress(prog:"Progress"):
+    """Show waits as a sub task on the main progress bar"""
+    SCHEDULER.prog = prog
+
+def wait(url:str):
+    SCHEDULER.wait(url)
+
+def observe(url:str, status:int, headers:dict):
+    SCHEDULER.observe(url, status, headers)
+
+def crawl_delay(url:str, seconds:float):
+    SCHEDULER.crawl_delay(url, seconds)
@@ -0,0 +1,99 @@
+import importlib
+import threading
+
+################################# Site Registry ####################################
+#Every source is registered by name with its address, the module that scrapes
+#it and its categories.  The module is only imported the first time something
+#on it is used, so a run limited to a couple of RSS feeds never imports bs4 or
+#playwright for the scraped sites.  SITES keeps the (address, module) shape the
+#fetcher and daemon already use, the module slot just holds a LazyModule.
+
+#CLASS Lazy Module
+class LazyModule():
+    """Stands in for a site module and imports it on first attribute access
+
+    Args:
+        name (str): module name
+    """
+    def __init__(self, name:str):
+        self.name = name
+        self.module = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.module is None:
+            with self.lock:
+                if self.module is None:
+                    self.module = importlib.import_module(self.name)
+        return self.module
+
+    @property
+    def loaded(self)->bool:
+        return self.module is not None
+
+    def __getattr__(self, attr:str):
+        #Only called for attributes the proxy doesn't have itself
+        return getattr(self.load(), attr)
+
+    def __repr__(self)->str:
+        return f"<LazyModule {self.name}{'' if self.loaded else ' (not loaded)'}>"
+
+#CLASS Site Registry
+class SiteRegistry():
+    """Registered sources in registration order"""
+    def __init__(self):
+        self.sources = {}
+
+    def register(self, name:str, address:str, module:str, categories:list):
+        """Adds a source
+
+        Args:
+            name (str): site name used everywhere else (ie "USCIS")
+            address (str): site address, stored as each article's source
+            module (str): module with ingest_xml(cat, source, NewArticle)
+            categories (list): categories to fetch
+        """
+        if name in self.sources:
+            raise ValueError(f"{name} is already registered")
+        self.sources[name] = {"address":address, "module":LazyModule(module), "categories":list(categories)}
+
+    def names(self)->list:
+        return list(self.sources)
+
+    def select(self, names:list=None)->list:
+        if not names:
+            return self.names()
+        unknown = [name for name in names if name not in self.sources]
+        if unknown:
+            raise KeyError(f"Unknown sites {unknown}, choose from {self.names()}")
+        return [name for name in self.sources if name in names]
+
+    def sites(self, names:list=None)->dict:
+        """Site name -> (address, module) for the named sites (all if None)"""
+        return {name:(self.sources[name]["address"], self.sources[name]["module"]) for name in self.select(names)}
+
+    def categories(self, names:list=None)->dict:
+        """Site name -> categories for the named sites (all if None)"""
+        return {name:self.sources[name]["categories"] for name in self.select(names)}
+
+    def module(self, name:str):
+        """The site's module, imported now if it wasn't already"""
+        return self.sources[name]["module"].load()
+
+################################# Module Interface ####################################
+REGISTRY = SiteRegistry()
+
+def register(name:str, address:str, module:str, categories:list):
+    REGISTRY.register(name, address, module, categories)
+
+def names()->list:
+    return REGISTRY.names()
+
+def sites(names:list=None)->dict:
+    return REGISTRY.sites(names)
+
+def categories(names:list=None)->dict:
+    return REGISTRY.categories(names)
+
+def module(name:str):
+    return REGISTRY.module(name)
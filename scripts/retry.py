@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import random
+import threading
+from os.path import exists
+from support import logger, host_key
+
+################################# Retry Policy ####################################
+#Every outbound request goes through the same policy.  Failed attempts are
+#retried with full jitter exponential backoff.  When the server sent a
+#Retry-After the politeness scheduler already holds the host back until then,
+#so the retry only adds backoff on top when there wasn't one.
+ATTEMPTS = 3
+BASE_DELAY = 2.0
+MAX_DELAY = 60.0
+#Statuses worth another try.  Anything else is the server's final answer
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+################################# Circuit Breaker ####################################
+#A host that keeps failing is skipped outright for a cooldown instead of eating
+#timeouts on every category every run.  After the cooldown one trial request
+#is let through, success closes the breaker and another failure reopens it for
+#twice as long.  Breaker state is kept on disk between runs.
+BREAKER_FP = "./data/breakers.json"
+#Consecutive failed requests (after retries) that trip the breaker
+FAILURE_THRESHOLD = 3
+COOLDOWN = 10 * 60
+MAX_COOLDOWN = 24 * 3600
+
+#CLASS Circuit Open
+class CircuitOpen(Exception):
+    """Raised instead of sending a request to a host whose breaker is open"""
+    pass
+
+#CLASS Breaker Board
+class BreakerBoard():
+    """Per host breaker state, persisted to disk
+
+        closed    : requests flow, consecutive failures are counted
+        open      : requests fail fast until opened_at + cooldown
+        half_open : one trial request is in flight
+
+    Args:
+        fp (str, optional): path of the on disk state. Defaults to BREAKER_FP.
+    """
+    def __init__(self, fp:str=BREAKER_FP):
+        self.fp = fp
+        self.lock = threading.Lock()
+        self.hosts = {}
+        if exists(fp):
+            try:
+                with open(fp, "r") as f:
+                    self.hosts = json.loads(f.read())
+            except (OSError, ValueError) as e:
+                logger.warning(f"Couldn't read {fp}, starting with every breaker closed. {e}")
+        #A trial that never reported back (the run died) doesn't hold the host forever
+        for state in self.hosts.values():
+            if state["state"] == "half_open":
+                state["state"] = "open"
+
+    def state(self, host:str)->dict:
+        return self.hosts.setdefault(host, {"state":"closed", "failures":0, "opened_at":0, "cooldown":COOLDOWN})
+
+    def allow(self, host:str):
+        """Raises CircuitOpen if the host shouldn't be contacted right now"""
+        with self.lock:
+            state = self.state(host)
+            if state["state"] == "closed":
+                return
+            remaining = state["opened_at"] + state["cooldown"] - time.time()
+            if state["state"] == "open" and remaining <= 0:
+                logger.info(f"Breaker for {host} half open, sending a trial request")
+                state["state"] = "half_open"
+                return
+            raise CircuitOpen(f"{host} breaker is {state['state'].replace('_', ' ')}, skipping for another {max(remaining, 0) / 60:.0f} min")
+
+    def success(self, host:str):
+        with self.lock:
+            state = self.state(host)
+            if state["state"] != "closed":
+                logger.info(f"Breaker for {host} closed")
+            state.update({"state":"closed", "failures":0, "cooldown":COOLDOWN})
+
+    def failure(self, host:str):
+        with self.lock:
+            state = self.state(host)
+            state["failures"] += 1
+            if state["state"] == "half_open":
+                state["cooldown"] = min(state["cooldown"] * 2, MAX_COOLDOWN)
+            elif state["failures"] < FAILURE_THRESHOLD:
+                return
+            state["state"] = "open"
+            state["opened_at"] = time.time()
+            logger.warning(f"Breaker for {host} open for {state['cooldown'] / 60:.0f} min after {state['failures']} failures")
+
+    def save(self):
+        """Atomically writes breaker state back to disk"""
+        with self.lock:
+            tmp = self.fp + ".tmp"
+            with open(tmp, "w") as out_f:
+                out_f.write(json.dumps(self.hosts, indent=2, sort_keys=True))
+            os.replace(tmp, self.fp)
+
+#FUNCTION Backoff
+def backoff(attempt:int)->float:
+    """Full jitter exponential backoff for the given (0 based) attempt"""
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+################################# Module Interface ####################################
+BREAKERS = BreakerBoard(BREAKER_FP)
+
+#FUNCTION Call
+def call(url:str, send, retry_on:set=RETRY_STATUSES, attempts:int=ATTEMPTS):
+    """Sends a request under the shared retry policy and the host's breaker
+
+    Args:
+        url (str): address being requested
+        send (function): makes one attempt, returns (status, headers, result)
+        retry_on (set, optional): statuses to retry. Defaults to RETRY_STATUSES.
+        attempts (int, optional): tries before giving up. Defaults to ATTEMPTS.
+
+    Raises:
+        CircuitOpen: the host's breaker is open
+        Exception: whatever the last attempt raised
+
+    Returns:
+        result (any): what send returned on the last attempt
+    """
+    host = host_key(url)
+    BREAKERS.allow(host)
+    for attempt in range(attempts):
+        try:
+            status, headers, result = send()
+        except Exception as e:
+            if attempt + 1 == attempts:
+                BREAKERS.failure(host)
+                raise
+            delay = backoff(attempt)
+            logger.warning(f"{host} attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        if status not in retry_on:
+            BREAKERS.success(host)
+            return result
+        if attempt + 1 == attempts:
+            BREAKERS.failure(host)
+            return result
+        #429 / 503 with Retry-After are already held back by the politeness scheduler
+        deferred = status in (429, 503) and headers and (headers.get("Retry-After") or headers.get("retry-after"))
+        delay = 0 if deferred else backoff(attempt)
+        logger.warning(f"{host} attempt {attempt + 1} got {status}, retrying " + (f"in {delay:.1f}s" if delay else "after Retry-After"))
+        time.sleep(delay)
+
+def save():
+    BREAKERS.save()
@@ -0,0 +1,129 @@
+import io
+import time
+from lxml import etree
+import tracing
+
+################################# Field Mapping ####################################
+#Per source mapping of an item's child tag (local name, namespace stripped so
+#dc:creator is just creator) to the NewArticle attribute it fills.
+FIELD_MAPS = {
+    "USCIS": {
+        "title"      :"title",
+        "link"       :"link",
+        "description":"description",
+        "pubDate"    :"pub_date",
+        "creator"    :"creator",
+        "guid"       :"id",
+    },
+    "ICE": {
+        "title"      :"title",
+        "link"       :"link",
+        "description":"description",
+        "pubDate"    :"pub_date",
+        "source"     :"creator",
+        "guid"       :"id",
+    },
+    "DOS": {
+        "title"      :"title",
+        "link"       :"link",
+        "description":"description",
+        "pubDate"    :"pub_date",
+        "creator"    :"creator",
+        "guid"       :"id",
+        "identifier" :"identifier",
+    },
+    "Google": {
+        "title"      :"title",
+        "link"       :"link",
+        "description":"description",
+        "pubDate"    :"pub_date",
+        "source"     :"creator",
+        "guid"       :"id",
+    },
+}
+
+#DOS tags its advisories with <category domain="...">.  Maps the domain to the attribute
+DOMAIN_MAPS = {
+    "DOS": {
+        "Threat-Level":"threat_level",
+        "Country-Tag" :"country",
+        "Keyword"     :"keyword",
+    },
+}
+
+#Attributes that need their surrounding newlines trimmed
+STRIP_FIELDS = {"identifier"}
+
+################################# Streaming Parser ####################################
+#FUNCTION Iter Articles
+def iter_articles(content:bytes, site:str, cat:str, source:str, NewArticle, date_convert)->iter:
+    """Streams <item> elements out of an RSS feed and yields a NewArticle for
+    each one.  Elements are cleared (along with any siblings already consumed)
+    as soon as they've been read so memory stays flat no matter the feed size.
+
+    Args:
+        content (bytes): raw feed body
+        site (str): key into FIELD_MAPS / DOMAIN_MAPS
+        cat (str): category being searched
+        source (str): source website
+        NewArticle (dataclass): Dataclass object for NewsArticle
+        date_convert (function): turns the pubDate text into the stored date
+
+    Yields:
+        article (NewArticle): one per <item>
+    """
+    fields = FIELD_MAPS[site]
+    domains = DOMAIN_MAPS.get(site, {})
+    stream = io.BytesIO(content)
+    parser = etree.iterparse(stream, events=("end",), tag="item", resolve_entities=False, no_network=True, recover=True)
+    for _, item in parser:
+        article = NewArticle()
+        # Time of pull
+        article.pull_date = time.strftime("%m-%d-%Y_%H-%M-%S")
+        for row in item:
+            if not isinstance(row.tag, str):
+                continue
+            rname = etree.QName(row).localname
+            text = row.text or ""
+            domain = row.get("domain")
+            if domain and domain in domains:
+                setattr(article, domains[domain], text)
+                continue
+            attr = fields.get(rname)
+            if attr is None:
+                continue
+            if attr == "pub_date":
+                text = date_convert(text)
+            elif attr in STRIP_FIELDS:
+                text = text.strip("\n")
+            setattr(article, attr, text)
+        # Assign category
+        article.category = cat
+        # Assign source
+        article.source = source
+
+        #Free the item and anything before it now that we're done
+        item.clear()
+        while item.getprevious() is not None:
+            del item.getparent()[0]
+        yield article
+
+#FUNCTION Parse Articles
+def parse_articles(content:bytes, site:str, cat:str, source:str, NewArticle, date_convert)->list:
+    """Convenience wrapper around iter_articles for callers that want a list
+
+    Args:
+        content (bytes): raw feed body
+        site (str): key into FIELD_MAPS / DOMAIN_MAPS
+        cat (str): category being searched
+        source (str): source website
+        NewArticle (dataclass): Dataclass object for NewsArticle
+        date_convert (function): turns the pubDate text into the stored date
+
+    Returns:
+        articles (list): List of NewArticle objects
+    """
+    with tracing.span("parse"):
+        articles = list(iter_articles(content, site, cat, source, NewArticle, date_convert))
+        tracing.add_items(len(articles))
+    return articles
@@ -0,0 +1,292 @@
+import re
+import html
+import json
+import sqlite3
+import datetime
+import storage
+from support import logger
+
+################################# Search Index ####################################
+#Full text index over every article's title, description, creator and category
+#in its own SQLite FTS5 database, whichever store backend holds the articles.
+#The inverted index means a query only reads the posting lists of its terms,
+#never the archive.  add_data stages each run's articles and they're written
+#in one transaction when the run's articles are saved.  Prefix indexes on 2 and
+#3 characters keep short prefix queries off the full term list.  The archive
+#itself is indexed once, before the first save or search, and a meta row
+#records that it finished so an index holding only recent runs is never
+#mistaken for a complete one.
+SEARCH_FP = "./data/search.db"
+FIELDS = ("title", "description", "creator", "category")
+LIMIT = 20
+
+TAG_RE = re.compile(r"<[^>]+>")
+#"a phrase", field:"a phrase", field:word, word*, or a bare word
+QUERY_RE = re.compile(r'(?:(\w+):)?(?:"([^"]*)"|(\S+))')
+OPERATORS = {"AND", "OR", "NOT"}
+
+#FUNCTION Plain Text
+def plain_text(value)->str:
+    """Strips markup (Google descriptions are html) down to searchable text"""
+    if not value:
+        return ""
+    return html.unescape(TAG_RE.sub(" ", str(value)))
+
+#FUNCTION To Match
+def to_match(query:str)->str:
+    """Turns a search box query into an FTS5 MATCH expression.  Every term is
+    quoted so punctuation (H-1B, I-130) can't break the FTS5 syntax.
+
+        "fee waiver"        phrase
+        asyl*               prefix
+        title:visa          only in that field
+        AND / OR / NOT      passed through, terms are ANDed otherwise
+
+    Args:
+        query (str): user query
+
+    Returns:
+        match (str): FTS5 expression
+    """
+    parts = []
+    for m in QUERY_RE.finditer(query):
+        field, phrase, word = m.groups()
+        if field and field.lower() not in FIELDS:
+            #Not a column, the colon is part of the word
+            word, field = m.group(0), None
+            phrase = None
+        if phrase is None and word in OPERATORS and not field:
+            parts.append(word)
+            continue
+        prefix = phrase is None and word.endswith("*")
+        text = phrase if phrase is not None else word.rstrip("*")
+        if not text.strip():
+            continue
+        term = '"' + text.replace('"', '""') + '"' + ("*" if prefix else "")
+        parts.append(f"{field.lower()}:{term}" if field else term)
+    return " ".join(parts)
+
+#FUNCTION Parse Day
+def parse_day(value:str, end:bool=False)->int:
+    """YYYY-MM-DD to UTC epoch seconds, the end of the day if end is set"""
+    day = datetime.datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+    if end:
+        day += datetime.timedelta(days=1, seconds=-1)
+    return int(day.timestamp())
+
+#CLASS Search Index
+class SearchIndex():
+    """FTS5 index of the article archive
+
+    Args:
+        fp (str, optional): path of the index database. Defaults to SEARCH_FP.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS docs (
+            rowid    INTEGER PRIMARY KEY,
+            id       TEXT UNIQUE NOT NULL,
+            source   TEXT,
+            pub_date INTEGER,
+            link     TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_docs_source_date ON docs(source, pub_date);
+        CREATE INDEX IF NOT EXISTS idx_docs_pub_date    ON docs(pub_date);
+        CREATE VIRTUAL TABLE IF NOT EXISTS fts USING fts5(
+            title, description, creator, category,
+            tokenize = 'porter unicode61', prefix = '2 3'
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key   TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, fp:str=SEARCH_FP):
+        self.fp = fp
+        self.conn = None
+        self.pending = {}
+
+    def connect(self)->sqlite3.Connection:
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.fp)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(self.SCHEMA)
+        return self.conn
+
+    def __len__(self)->int:
+        return self.connect().execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def backfilled(self)->bool:
+        """Whether the whole archive has been indexed"""
+        row = self.connect().execute("SELECT value FROM meta WHERE key = 'backfilled'").fetchone()
+        return row is not None
+
+    def add(self, records:dict):
+        """Stages records (id -> record) for the next save"""
+        self.pending.update(records)
+
+    def write(self, records:dict):
+        """Indexes records in one transaction, replacing any earlier version
+        of the same id
+        """
+        conn = self.connect()
+        with conn:
+            for idx, record in records.items():
+                row = conn.execute("SELECT rowid FROM docs WHERE id = ?", (idx,)).fetchone()
+                if row is not None:
+                    conn.execute("DELETE FROM fts WHERE rowid = ?", row)
+                    conn.execute("DELETE FROM docs WHERE rowid = ?", row)
+                cursor = conn.execute(
+                    "INSERT INTO docs (id, source, pub_date, link) VALUES (?, ?, ?, ?)",
+                    (idx, record.get("source"), record.get("pub_date"), record.get("link"))
+                )
+                conn.execute(
+                    "INSERT INTO fts (rowid, title, description, creator, category) VALUES (?, ?, ?, ?, ?)",
+                    (cursor.lastrowid, *(plain_text(record.get(field)) for field in FIELDS))
+                )
+
+    def save(self):
+        """Writes everything staged this run"""
+        if self.pending:
+            self.write(self.pending)
+            logger.info(f"{len(self.pending)} articles added to the search index")
+            self.pending = {}
+
+    def rebuild(self, records:iter, batch:int=5000)->int:
+        """Reindexes the whole archive from (id, record) pairs
+
+        Returns:
+            count (int): articles indexed
+        """
+        conn = self.connect()
+        with conn:
+            conn.execute("DELETE FROM docs")
+            conn.execute("DELETE FROM fts")
+        count, chunk = 0, {}
+        for idx, record in records:
+            chunk[idx] = record
+            if len(chunk) >= batch:
+                self.write(chunk)
+                count, chunk = count + len(chunk), {}
+        self.write(chunk)
+        count += len(chunk)
+        with conn:
+            conn.execute("INSERT INTO fts (fts) VALUES ('optimize')")
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('backfilled', ?)", (str(count),))
+        return count
+
+    def search(self, query:str, sources:list=None, since:int=None, until:int=None, limit:int=LIMIT, recent:bool=False)->list:
+        """Best matches for a query, filtered on source and pub_date.  Ranking
+        has to score every match, so for very common terms recent=True is
+        faster.  FTS5 walks the matches newest rowid first and stops at limit.
+
+        Args:
+            query (str): see to_match
+            sources (list, optional): source addresses to keep. Defaults to None (all).
+            since (int, optional): earliest UTC epoch pub_date. Defaults to None.
+            until (int, optional): latest UTC epoch pub_date. Defaults to None.
+            limit (int, optional): most results to return. Defaults to LIMIT.
+            recent (bool, optional): newest indexed first instead of best. Defaults to False.
+
+        Returns:
+            results (list): dicts of id, source, pub_date, link, title, snippet
+        """
+        match = to_match(query)
+        if not match:
+            return []
+        sql = """
+            SELECT d.id, d.source, d.pub_date, d.link, fts.title,
+                   snippet(fts, 1, '[', ']', '...', 12)
+            FROM fts JOIN docs d ON d.rowid = fts.rowid
+            WHERE fts MATCH ?
+        """
+        params = [match]
+        if sources:
+            sql += f" AND d.source IN ({', '.join('?' * len(sources))})"
+            params.extend(sources)
+        if since is not None:
+            sql += " AND d.pub_date >= ?"
+            params.append(since)
+        if until is not None:
+            sql += " AND d.pub_date <= ?"
+            params.append(until)
+        sql += " ORDER BY fts.rowid DESC LIMIT ?" if recent else " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        keys = ("id", "source", "pub_date", "link", "title", "snippet")
+        return [dict(zip(keys, row)) for row in self.connect().execute(sql, params)]
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+#FUNCTION Archive Records
+def archive_records(backend:str="json")->iter:
+    """Streams (id, record) out of the article store without loading it all"""
+    if backend == "sqlite":
+        conn = sqlite3.connect(storage.DB_FP)
+        try:
+            for idx, record in conn.execute("SELECT id, record FROM articles"):
+                yield idx, json.loads(record)
+        finally:
+            conn.close()
+    else:
+        for idx, raw in storage.LOG.scan():
+            record = json.loads(raw)
+            yield record.pop("id"), record
+
+################################# Module Interface ####################################
+INDEX = SearchIndex(SEARCH_FP)
+
+#FUNCTION Backfill
+def backfill(backend:str="json", rebuild:bool=False):
+    """Indexes the whole archive if that hasn't finished yet (or rebuild
+    is asked for).  An interrupted backfill leaves no meta row, so it runs
+    again next time.
+
+    Args:
+        backend (str, optional): store to build from. Defaults to "json".
+        rebuild (bool, optional): reindex even if already backfilled. Defaults to False.
+    """
+    if rebuild or not INDEX.backfilled():
+        storage.LOG.migrate()
+        count = INDEX.rebuild(archive_records(backend))
+        logger.info(f"Search index built over {count} articles")
+
+def add(records:dict):
+    INDEX.add(records)
+
+def save(backend:str="json"):
+    """Writes the run's articles, backfilling the archive first if needed"""
+    if INDEX.pending:
+        backfill(backend)
+    INDEX.save()
+
+#FUNCTION Run Search
+def run_search(query:str, sources:list=None, since:str=None, until:str=None, limit:int=LIMIT, recent:bool=False, backend:str="json", rebuild:bool=False):
+    """The search command.  Builds the index from the store first if it
+    doesn't exist yet (or rebuild is asked for), then prints the matches.
+
+    Args:
+        query (str): see to_match
+        sources (list, optional): source addresses to keep. Defaults to None.
+        since (str, optional): YYYY-MM-DD. Defaults to None.
+        until (str, optional): YYYY-MM-DD. Defaults to None.
+        limit (int, optional): most results. Defaults to LIMIT.
+        recent (bool, optional): newest first instead of best first. Defaults to False.
+        backend (str, optional): store to build from. Defaults to "json".
+        rebuild (bool, optional): reindex the whole archive first. Defaults to False.
+    """
+    backfill(backend, rebuild)
+    if not query:
+        return
+    try:
+        results = INDEX.search(query, sources, parse_day(since) if since else None, parse_day(until, True) if until else None, limit, recent)
+    except sqlite3.OperationalError as e:
+        logger.warning(f"Couldn't run query {query!r}. {e}")
+        return
+    for result in results:
+        day = datetime.datetime.fromtimestamp(result["pub_date"], datetime.timezone.utc).strftime("%Y-%m-%d") if result["pub_date"] else "----------"
+        print(f"{day}  {result['title']}\n            {result['link']}\n            {result['snippet']}")
+    logger.info(f"{len(results)} matches for {query!r}")
@@ -0,0 +1,15 @@
+import registry
+
+################################# Sources ####################################
+#Every site the aggregator knows about.  Registered here, in a module that's only
+#ever imported once, because main.py is both run as a script (__main__) and
+#imported as main by the daemon and benchmarks, and registering twice is an error.
+#Site modules are imported on first use (see registry.py), so a run limited with --sites only loads what it fetches
+registry.register("USCIS",     "https://www.uscis.gov",       "uscis",     ["Fact Sheets", "News Releases", "Stakeholder Messages", "Alerts", "Forms Updates"])
+registry.register("DOS",       "https://travel.state.gov",    "travel",    ["main_feed"])
+registry.register("Boundless", "https://www.boundless.com",   "boundless", ["Boundless Blog"]) #, "Boundless Weekly"
+registry.register("Google",    "https://www.news.google.com", "g_news",    ["US Immigration Changes", "USCIS Updates"])
+registry.register("AILA",      "https://www.aila.org",        "aila",      ["AILA Daily News Update"])
+registry.register("ICE",       "https://www.ice.gov",         "ice",       ["Management and Administration", "Operational", "Profesional Responsibility", "National Security", "Partnership and Engagement", "Enforcement and Removal", "Transnational Gangs"])
+#Sunsetting CBP 3-7-25.  They basically only report finding drugs at the border
+# registry.register("CBP", "https://www.cbp.gov", "cbp", ["Travel updates","Trusted traveler updates","Border Security","Newsroom"]) #"Border wait time feeds" currently down, Also security might be redundant here
@@ -0,0 +1,799 @@
+import os
+import sys
+import glob
+import gzip
+import json
+import shutil
+import sqlite3
+import time
+import datetime
+from os.path import exists
+from support import logger, NumpyArrayEncoder, to_epoch
+
+################################# Article Log ####################################
+#Articles are stored as append-only JSON lines logs, one record per line with
+#its id inlined.  A re-stored id (DOS updates) is just appended again and the
+#last line for an id wins on load.  Compaction rewrites a log down to one
+#line per id once the dead lines pile up.
+#
+#The archive is split into one log per year/month under ARCHIVE_DIR.  Only the
+#current month's log is ever appended to or compacted.  Once a month is over
+#its log is gzipped and left alone.
+#
+#Records are not kept in publication order on disk.  A save appends in the
+#order the run found the articles and months are partitioned by when a record
+#was stored, not by its pub_date, so saving never sorts or rewrites anything
+#old.  Publication order (newest first) is worked out when it's needed, with
+#one sort in PubOrder when the current month is compacted or the legacy file
+#is migrated.  Readers that care about pub_date (feed_history, search) filter
+#and sort on it themselves.
+ARCHIVE_DIR = "./data/archive"
+LOG_FP = "./data/im_updates.jsonl"
+LEGACY_FP = "./data/im_updates.json"
+DB_FP = "./data/im_updates.db"
+
+#Months of description bodies to keep.  None keeps everything.  Older records
+#keep their ids (and the rest of the record) so dedupe is unaffected.
+RETENTION_MONTHS = None
+
+#Compact once the log has this many lines per live record
+COMPACT_RATIO = 2
+#Don't bother compacting until there are at least this many dead lines
+COMPACT_MIN_DEAD = 500
+
+#Values that repeat across thousands of records.  Interned (along with every
+#record's keys) as records come in, so the archive holds one copy of each
+INTERNED_FIELDS = ("category", "source", "creator", "pull_date")
+
+#FUNCTION Compact Record
+def compact_record(record:dict)->dict:
+    """Interns a record's keys and its INTERNED_FIELDS values.  json.loads
+    makes fresh key strings for every record, sharing them roughly halves
+    the size of the loaded archive.
+
+    Args:
+        record (dict): decoded record
+
+    Returns:
+        record (dict): the same record with shared strings
+    """
+    intern = sys.intern
+    record = {intern(key):value for key, value in record.items()}
+    for field in INTERNED_FIELDS:
+        value = record.get(field)
+        if type(value) is str:
+            record[field] = intern(value)
+    return record
+
+#CLASS Article Log
+class ArticleLog():
+    """Append-only JSON lines file of articles.  Alongside it sits a compact
+    id index (one JSON string per line, line for line with the log) so a run
+    can know every stored id without reading a single record.
+
+    Args:
+        fp (str): path of the log, a .gz log is read only
+        index_fp (str, optional): path of the id index. Defaults to the log path with .ids.
+    """
+    def __init__(self, fp:str=LOG_FP, index_fp:str=None):
+        self.fp = fp
+        self.index_fp = index_fp or os.path.splitext(fp)[0] + ".ids"
+        self.lines = 0
+
+    @property
+    def closed(self)->bool:
+        return self.fp.endswith(".gz")
+
+    def exists(self)->bool:
+        return exists(self.fp)
+
+    def scan(self, wanted:set=None)->iter:
+        """Walks the log yielding (id, line).  Only the id at the front of
+        each line is decoded here.  A torn final line from a crash mid append
+        is trimmed off so the next append starts clean.
+
+        Args:
+            wanted (set, optional): only yield these ids. Defaults to None (all).
+
+        Yields:
+            idx (str): article id
+            raw (bytes): the full line
+        """
+        decoder = json.JSONDecoder()
+        with (gzip.open(self.fp, "rb") if self.closed else open(self.fp, "rb+")) as f:
+            good = 0
+            for raw in f:
+                if not raw.endswith(b"\n") and not self.closed:
+                    logger.warning(f"Dropping partial record at the end of {self.fp}")
+                    f.truncate(good)
+                    break
+                good += len(raw)
+                #Every line starts with {"id": so the id can be pulled without parsing the rest
+                idx = decoder.raw_decode(raw[7:].decode("utf-8"))[0]
+                if wanted is None or idx in wanted:
+                    yield idx, raw
+
+    def load(self, wanted:set=None)->dict:
+        """Reads records out of the log, last line for an id wins.
+
+        Args:
+            wanted (set, optional): only load these ids. Defaults to None (all).
+
+        Returns:
+            jsondata (dict): id -> record
+        """
+        jsondata = {}
+        lines = 0
+        for idx, raw in self.scan(wanted):
+            record = compact_record(json.loads(raw))
+            record.pop("id")
+            jsondata[idx] = record
+            lines += 1
+        if wanted is None:
+            self.lines = lines
+        return jsondata
+
+    def load_ids(self)->list:
+        """Reads the id index, rebuilding it from the log if it's missing or
+        older than the log (ie a crash landed between the two appends).
+
+        Returns:
+            ids (list): one id per log line, duplicates and all
+        """
+        if not exists(self.fp):
+            return []
+        if not exists(self.index_fp) or os.path.getmtime(self.index_fp) < os.path.getmtime(self.fp):
+            logger.warning(f"Rebuilding id index {self.index_fp}")
+            ids = [idx for idx, _ in self.scan()]
+            self.write_index(ids)
+        else:
+            with open(self.index_fp, "r") as f:
+                text = f.read().strip()
+            ids = json.loads("[" + text.replace("\n", ",") + "]") if text else []
+        self.lines = len(ids)
+        return ids
+
+    def write_index(self, ids:list):
+        tmp = self.index_fp + ".tmp"
+        with open(tmp, "w") as out_f:
+            out_f.write("".join(json.dumps(idx) + "\n" for idx in ids))
+            out_f.flush()
+            os.fsync(out_f.fileno())
+        os.replace(tmp, self.index_fp)
+
+    def append(self, records:dict):
+        """Appends records (then their ids to the index) in a single write
+        each and fsyncs before returning
+
+        Args:
+            records (dict): id -> record
+        """
+        if not records:
+            return
+        #A log from before the index existed gets its index built before we add to it
+        if exists(self.fp) and not exists(self.index_fp):
+            self.write_index([idx for idx, _ in self.scan()])
+        out = "".join(json.dumps({"id":idx, **record}, cls=NumpyArrayEncoder) + "\n" for idx, record in records.items())
+        with open(self.fp, "a") as out_f:
+            out_f.write(out)
+            out_f.flush()
+            os.fsync(out_f.fileno())
+        with open(self.index_fp, "a") as out_f:
+            out_f.write("".join(json.dumps(idx) + "\n" for idx in records.keys()))
+            out_f.flush()
+            os.fsync(out_f.fileno())
+        self.lines += len(records)
+
+    def needs_compaction(self, live:int)->bool:
+        dead = self.lines - live
+        return dead >= COMPACT_MIN_DEAD and self.lines >= COMPACT_RATIO * live
+
+    def maintain(self):
+        """Compacts the log against itself once enough superseded lines
+        have built up.  Only this log's records are read to do it.
+        """
+        if not exists(self.fp):
+            return
+        live = len(set(self.load_ids()))
+        if self.needs_compaction(live):
+            records = self.load()
+            order = PubOrder()
+            for idx, record in records.items():
+                order.insert(idx, migrate_date(record.get("pub_date")))
+            self.compact(records, order)
+
+    def compact(self, jsondata:dict, order:iter):
+        """Rewrites the log with one line per id, newest first.  Written to a
+        temp file, fsynced and swapped in with os.replace so a crash leaves
+        either the old log or the new one, never half of each.
+
+        Args:
+            jsondata (dict): Main dictionary container
+            order (iter): ids newest first
+        """
+        ordered = list(order)
+        tmp = self.fp + ".tmp"
+        with open(tmp, "w") as out_f:
+            for idx in ordered:
+                out_f.write(json.dumps({"id":idx, **jsondata[idx]}, cls=NumpyArrayEncoder) + "\n")
+            out_f.flush()
+            os.fsync(out_f.fileno())
+        os.replace(tmp, self.fp)
+        self.write_index(ordered)
+        self.lines = len(ordered)
+        logger.info(f"Compacted {self.fp} to {self.lines} records")
+
+#CLASS Pub Order
+class PubOrder():
+    """Ids in publication order (newest first).  Inserts only record the
+    pub_date, the order is worked out with one sort the first time it's
+    iterated (and again only if something changed since).  Ties on
+    pub_date go by id so the order is stable run to run.
+    """
+    def __init__(self):
+        self.dates = {}
+        self.ordered = None
+
+    def __len__(self)->int:
+        return len(self.dates)
+
+    def __iter__(self):
+        if self.ordered is None:
+            self.ordered = sorted(self.dates, key=lambda idx: (-self.dates[idx], idx))
+        return iter(self.ordered)
+
+    def insert(self, idx:str, pub_date:int):
+        """Places (or moves) idx at its pub_date
+
+        Args:
+            idx (str): article id
+            pub_date (int): UTC epoch seconds
+        """
+        pub_date = pub_date or 0
+        if self.dates.get(idx) != pub_date:
+            self.dates[idx] = pub_date
+            self.ordered = None
+
+#CLASS Partitioned Log
+class PartitionedLog():
+    """The article archive as one log per year/month of ingestion.
+
+        archive/2025/03.jsonl              current month, appended to
+        archive/2025/02.jsonl.gz           closed month, never rewritten
+        archive/2024/01.pruned.jsonl.gz    closed and past retention
+        archive/YYYY/MM.ids                id index for each month
+
+    Partitions are by the month a record was stored, not its pub_date, so a
+    closed month never needs another write.  A record re-stored later (a DOS
+    update) lands in the current month and wins because months are read
+    oldest first.  Reads stream through the gzipped months.
+
+    Args:
+        root (str, optional): archive directory. Defaults to ARCHIVE_DIR.
+        retention (int, optional): months of descriptions to keep. Defaults to RETENTION_MONTHS.
+    """
+    def __init__(self, root:str=ARCHIVE_DIR, retention:int=RETENTION_MONTHS):
+        self.root = root
+        self.retention = retention
+
+    def month_key(self, when:datetime.datetime=None)->tuple:
+        when = when or datetime.datetime.now(datetime.timezone.utc)
+        return when.year, when.month
+
+    def partition(self, year:int, month:int)->ArticleLog:
+        """Log for a month, whichever state it's in on disk (plain if new)"""
+        base = os.path.join(self.root, f"{year}", f"{month:02d}")
+        index_fp = base + ".ids"
+        for suffix in (".jsonl", ".jsonl.gz", ".pruned.jsonl.gz"):
+            if exists(base + suffix):
+                return ArticleLog(base + suffix, index_fp)
+        return ArticleLog(base + ".jsonl", index_fp)
+
+    def partitions(self)->list:
+        """Every month on disk, oldest first
+
+        Returns:
+            partitions (list): ((year, month), ArticleLog) pairs
+        """
+        months = set()
+        for fp in glob.glob(os.path.join(self.root, "*", "*.jsonl*")):
+            year = os.path.basename(os.path.dirname(fp))
+            month = os.path.basename(fp).split(".")[0]
+            if year.isdigit() and month.isdigit():
+                months.add((int(year), int(month)))
+        return [(key, self.partition(*key)) for key in sorted(months)]
+
+    def active(self)->ArticleLog:
+        year, month = self.month_key()
+        os.makedirs(os.path.join(self.root, f"{year}"), exist_ok=True)
+        return self.partition(year, month)
+
+    def exists(self)->bool:
+        return bool(self.partitions())
+
+    def scan(self, wanted:set=None, since:int=None)->iter:
+        """Streams (id, line) through every month oldest first.  Months whose
+        id index doesn't hold any wanted id are skipped without being opened.
+
+        Args:
+            wanted (set, optional): only yield these ids. Defaults to None (all).
+            since (int, optional): skip months stored before this epoch time. Defaults to None.
+        """
+        first = self.month_key(datetime.datetime.fromtimestamp(since, datetime.timezone.utc)) if since else None
+        for key, log in self.partitions():
+            if first and key < first:
+                continue
+            if wanted is not None and not wanted.intersection(log.load_ids()):
+                continue
+            yield from log.scan(wanted)
+
+    def load(self, wanted:set=None)->dict:
+        jsondata = {}
+        for idx, raw in self.scan(wanted):
+            record = compact_record(json.loads(raw))
+            record.pop("id")
+            jsondata[idx] = record
+        return jsondata
+
+    def load_ids(self)->list:
+        ids = []
+        for _, log in self.partitions():
+            ids.extend(log.load_ids())
+        return ids
+
+    def append(self, records:dict):
+        self.active().append(records)
+
+    def maintain(self):
+        """Closes finished months, compacts the current one and applies retention"""
+        current = self.month_key()
+        for key, log in self.partitions():
+            if key < current and not log.closed:
+                self.close(log)
+        self.active().maintain()
+        if self.retention is not None:
+            self.prune(current)
+
+    def close(self, log:ArticleLog):
+        """Compacts a finished month one last time and gzips it"""
+        log.maintain()
+        gz_fp = log.fp + ".gz"
+        tmp = gz_fp + ".tmp"
+        with open(log.fp, "rb") as in_f, gzip.open(tmp, "wb") as out_f:
+            shutil.copyfileobj(in_f, out_f)
+        os.replace(tmp, gz_fp)
+        os.remove(log.fp)
+        #The index still matches line for line, keep it from looking stale
+        os.utime(log.index_fp)
+        logger.info(f"Closed archive partition {gz_fp}")
+
+    def prune(self, current:tuple):
+        """Drops description bodies from closed months older than the
+        retention window.  Each month is pruned once and marked in its name.
+        """
+        cutoff = current[0] * 12 + current[1] - 1 - self.retention
+        for (year, month), log in self.partitions():
+            if year * 12 + month - 1 >= cutoff or not log.closed or ".pruned." in log.fp:
+                continue
+            pruned_fp = log.fp.replace(".jsonl.gz", ".pruned.jsonl.gz")
+            tmp = pruned_fp + ".tmp"
+            with gzip.open(tmp, "wt") as out_f:
+                for _, raw in log.scan():
+                    record = json.loads(raw)
+                    record.pop("description", None)
+                    out_f.write(json.dumps(record, cls=NumpyArrayEncoder) + "\n")
+            os.replace(tmp, pruned_fp)
+            os.remove(log.fp)
+            os.utime(log.index_fp)
+            logger.info(f"Pruned descriptions from {pruned_fp}")
+
+    def migrate(self):
+        """One time split of the single article log (or the older
+        im_updates.json) into monthly partitions by pull date.  The old files
+        are left in place.
+        """
+        if self.exists():
+            return
+        if exists(LOG_FP):
+            source = LOG_FP
+            records = ArticleLog(LOG_FP).load()
+        elif exists(LEGACY_FP):
+            source = LEGACY_FP
+            with open(LEGACY_FP, "r") as f:
+                records = json.loads(f.read())
+        else:
+            return
+        logger.warning(f"Migrating {source} into monthly partitions under {self.root}")
+        months = {}
+        order = PubOrder()
+        for idx, record in records.items():
+            record["pub_date"] = migrate_date(record.get("pub_date"))
+            order.insert(idx, record["pub_date"])
+            try:
+                pulled = datetime.datetime.strptime(record.get("pull_date"), "%m-%d-%Y_%H-%M-%S")
+            except (TypeError, ValueError):
+                pulled = datetime.datetime.fromtimestamp(record["pub_date"] or 0, datetime.timezone.utc)
+            months.setdefault(self.month_key(pulled), []).append(idx)
+        current = self.month_key()
+        for (year, month) in sorted(months.keys()):
+            os.makedirs(os.path.join(self.root, f"{year}"), exist_ok=True)
+            log = self.partition(year, month)
+            members = set(months[(year, month)])
+            log.append({idx:records[idx] for idx in order if idx in members})
+            if (year, month) < current:
+                self.close(log)
+
+LOG = PartitionedLog(ARCHIVE_DIR, RETENTION_MONTHS)
+
+################################# Stores ####################################
+#Both backends look like the jsondata dict main.py has always used (keys, in,
+#[], update) plus a save(new_ids) that persists what this run added.
+
+#CLASS Json Store
+class JsonStore(dict):
+    """The whole archive in memory, persisted through the article log
+
+    Args:
+        records (dict, optional): id -> record. Defaults to None.
+        log (PartitionedLog | ArticleLog, optional): log backing the store. Defaults to LOG.
+    """
+    def __init__(self, records:dict=None, log:PartitionedLog=LOG):
+        super().__init__(records or {})
+        self.log = log
+
+    def prefetch(self, ids:list):
+        """Everything is already in memory"""
+        pass
+
+    def feed_history(self, since:int=0)->dict:
+        """pub_dates per feed, see group_history"""
+        return group_history(((r.get("source"), r.get("category"), r.get("pub_date")) for r in self.values()), since)
+
+    def save(self, new_ids:list):
+        """Appends the new (or updated) articles to the log.  Cost scales with
+        the number of new articles, not the size of the archive.  The log
+        compacts the current month when enough superseded lines have built up.
+
+        Args:
+            new_ids (list): ids added or altered this run
+        """
+        self.log.append({idx:self[idx] for idx in dict.fromkeys(new_ids)})
+        self.log.maintain()
+
+#CLASS Lazy Json Store
+class LazyJsonStore():
+    """Article log store that starts with only the id index in memory.  Full
+    records are read from the log on demand, just the ids asked for.  Saves
+    only ever touch the current month.
+
+    Args:
+        log (PartitionedLog | ArticleLog, optional): log backing the store. Defaults to LOG.
+    """
+    def __init__(self, log:PartitionedLog=LOG):
+        self.log = log
+        self.ids = set(log.load_ids())
+        self.records = {}
+        self.pending = {}
+
+    def __len__(self)->int:
+        return len(self.ids)
+
+    def __contains__(self, idx:str)->bool:
+        return idx in self.ids
+
+    def __getitem__(self, idx:str)->dict:
+        if idx in self.pending:
+            return self.pending[idx]
+        if idx not in self.records:
+            if idx not in self.ids:
+                raise KeyError(idx)
+            self.prefetch([idx])
+        return self.records[idx]
+
+    def get(self, idx:str, default=None):
+        try:
+            return self[idx]
+        except KeyError:
+            return default
+
+    def keys(self)->set:
+        return self.ids
+
+    def update(self, records:dict):
+        self.pending.update(records)
+        self.ids.update(records.keys())
+
+    def prefetch(self, ids:list):
+        """Loads the records for ids in one pass over the log
+
+        Args:
+            ids (list): ids that are about to be read
+        """
+        wanted = {idx for idx in ids if idx in self.ids and idx not in self.records and idx not in self.pending}
+        if not wanted:
+            return
+        records = self.log.load(wanted)
+        for record in records.values():
+            record["pub_date"] = migrate_date(record["pub_date"])
+        self.records.update(records)
+
+    def feed_history(self, since:int=0)->dict:
+        """pub_dates per feed, streamed out of the log one record at a time
+
+        Args:
+            since (int, optional): ignore anything published before this. Defaults to 0.
+        """
+        #Nothing published after since was stored in an earlier month
+        rows = self.log.scan(since=since) if isinstance(self.log, PartitionedLog) else self.log.scan()
+        def triples():
+            for _, raw in rows:
+                record = json.loads(raw)
+                yield record.get("source"), record.get("category"), migrate_date(record.get("pub_date"))
+            for record in self.pending.values():
+                yield record.get("source"), record.get("category"), record.get("pub_date")
+        return group_history(triples(), since)
+
+    def save(self, new_ids:list):
+        """Appends the new (or updated) articles to the log and lets it
+        compact / close / prune its partitions as needed.
+
+        Args:
+            new_ids (list): ids added or altered this run
+        """
+        self.log.append({idx:self.pending[idx] for idx in dict.fromkeys(new_ids) if idx in self.pending})
+        self.log.maintain()
+        self.pending = {}
+
+#CLASS Sqlite Store
+class SqliteStore():
+    """Archive kept in SQLite.  Records live in the db, not in memory.
+    Anything added during the run is held as pending and written in a single
+    transaction on save.
+
+    Args:
+        fp (str): path of the database
+        retention (int, optional): months of descriptions to keep. Defaults to RETENTION_MONTHS.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS articles (
+            id       TEXT PRIMARY KEY,
+            pub_date INTEGER,
+            source   TEXT,
+            category TEXT,
+            record   TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_articles_pub_date ON articles(pub_date);
+        CREATE INDEX IF NOT EXISTS idx_articles_source   ON articles(source);
+        CREATE INDEX IF NOT EXISTS idx_articles_category ON articles(category);
+    """
+
+    def __init__(self, fp:str=DB_FP, retention:int=RETENTION_MONTHS):
+        self.fp = fp
+        self.retention = retention
+        self.conn = sqlite3.connect(fp)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.migrate_dates()
+        self.pending = {}
+
+    def migrate_dates(self):
+        """Databases from before canonical dates kept pub_date as text.
+        Rewrites them (column and record) to UTC epoch ints in one transaction.
+        """
+        columns = {row[1]:row[2] for row in self.conn.execute("PRAGMA table_info(articles)")}
+        if columns.get("pub_date", "").upper() == "INTEGER":
+            return
+        logger.warning(f"Migrating {self.fp} pub_dates to UTC epoch seconds")
+        rows = self.conn.execute("SELECT id, source, category, record FROM articles").fetchall()
+        with self.conn:
+            self.conn.execute("DROP TABLE articles")
+            self.conn.executescript(self.SCHEMA)
+            migrated = {}
+            for idx, source, category, record in rows:
+                record = json.loads(record)
+                record["pub_date"] = migrate_date(record.get("pub_date"))
+                migrated[idx] = record
+            self.conn.executemany("INSERT INTO articles (id, pub_date, source, category, record) VALUES (?, ?, ?, ?, ?)", self.rows(migrated))
+
+    def __len__(self)->int:
+        count = self.conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+        return count + sum(1 for idx in self.pending if not self.in_db(idx))
+
+    def __contains__(self, idx:str)->bool:
+        return idx in self.pending or self.in_db(idx)
+
+    def __getitem__(self, idx:str)->dict:
+        if idx in self.pending:
+            return self.pending[idx]
+        row = self.conn.execute("SELECT record FROM articles WHERE id = ?", (idx,)).fetchone()
+        if row is None:
+            raise KeyError(idx)
+        return json.loads(row[0])
+
+    def in_db(self, idx:str)->bool:
+        return self.conn.execute("SELECT 1 FROM articles WHERE id = ?", (idx,)).fetchone() is not None
+
+    def get(self, idx:str, default=None):
+        try:
+            return self[idx]
+        except KeyError:
+            return default
+
+    def keys(self)->set:
+        ids = {row[0] for row in self.conn.execute("SELECT id FROM articles")}
+        ids.update(self.pending.keys())
+        return ids
+
+    def update(self, records:dict):
+        self.pending.update(records)
+
+    def prefetch(self, ids:list):
+        """Records are read straight from the db per id"""
+        pass
+
+    def feed_history(self, since:int=0)->dict:
+        """pub_dates per feed, off the source / category / pub_date columns"""
+        rows = self.conn.execute("SELECT source, category, pub_date FROM articles WHERE pub_date >= ?", (since,))
+        pending = ((r.get("source"), r.get("category"), r.get("pub_date")) for r in self.pending.values())
+        return group_history(list(rows) + list(pending), since)
+
+    def rows(self, records:dict)->list:
+        rows = []
+        for idx, record in records.items():
+            rows.append((idx, record.get("pub_date"), record.get("source"), record.get("category"), json.dumps(record, cls=NumpyArrayEncoder)))
+        return rows
+
+    def insert(self, records:dict):
+        """Writes records in one transaction
+
+        Args:
+            records (dict): id -> record
+        """
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO articles (id, pub_date, source, category, record) VALUES (?, ?, ?, ?, ?)", self.rows(records))
+
+    def save(self, new_ids:list):
+        """Writes everything added this run in a single transaction
+
+        Args:
+            new_ids (list): ids added or altered this run
+        """
+        self.insert({idx:self.pending[idx] for idx in dict.fromkeys(new_ids) if idx in self.pending})
+        self.pending = {}
+        if self.retention is not None:
+            self.prune(self.retention)
+
+    def prune(self, months:int):
+        """Drops description bodies from records published more than months ago
+
+        Args:
+            months (int): months of descriptions to keep
+        """
+        cutoff = int(time.time()) - int(months * 30.44 * 86400)
+        with self.conn:
+            pruned = self.conn.execute(
+                "UPDATE articles SET record = json_remove(record, '$.description') WHERE pub_date < ? AND json_extract(record, '$.description') IS NOT NULL",
+                (cutoff,)
+            ).rowcount
+        if pruned:
+            logger.info(f"Pruned descriptions from {pruned} records in {self.fp}")
+
+    def close(self):
+        self.conn.close()
+
+#FUNCTION Group History
+def group_history(triples:iter, since:int=0)->dict:
+    """Groups (source, category, pub_date) into sorted pub_dates per feed.
+    Used to learn how often each feed publishes.
+
+    Args:
+        triples (iter): (source, category, pub_date) per record
+        since (int, optional): ignore anything published before this. Defaults to 0.
+
+    Returns:
+        history (dict): (source, category) -> sorted list of pub_dates
+    """
+    history = {}
+    for source, category, pub_date in triples:
+        if pub_date is None or pub_date < since:
+            continue
+        history.setdefault((source, category), []).append(pub_date)
+    for dates in history.values():
+        dates.sort()
+    return history
+
+#FUNCTION Migrate to SQLite
+def migrate_sqlite(store:SqliteStore):
+    """One shot import of the existing article archive into an empty database.
+
+    Args:
+        store (SqliteStore): freshly opened database
+    """
+    if len(store) or not LOG.exists():
+        return
+    jsondata = load_json()
+    logger.warning(f"Migrating {len(jsondata)} articles into {store.fp}")
+    store.insert(jsondata)
+
+################################# Date/Load/Save Funcs ####################################
+
+#FUNCTION Migrate Date
+def migrate_date(value)->int:
+    """Stored pub_dates are UTC epoch seconds.  Records written before that
+    hold a "%m-%d-%Y_%H-%M-%S" string, with any zone the feed sent already
+    dropped, so those (and naive datetimes) are read as UTC.
+
+    Args:
+        value (int | str | datetime): stored pub_date
+
+    Returns:
+        epoch (int): UTC epoch seconds
+    """
+    if isinstance(value, int) or value is None:
+        return value
+    if isinstance(value, datetime.datetime):
+        return to_epoch(value)
+    return to_epoch(datetime.datetime.strptime(value, '%m-%d-%Y_%H-%M-%S'))
+
+#FUNCTION Load JSON
+def load_json(log:PartitionedLog=LOG)->JsonStore:
+    """Loads every saved article into memory
+
+    Args:
+        log (PartitionedLog | ArticleLog, optional): log to read. Defaults to LOG.
+
+    Returns:
+        jsondata (JsonStore): dictionary version of saved articles
+    """
+    records = log.load() if log.exists() else {}
+    #Anything still carrying a date string comes back as UTC epoch seconds
+    for record in records.values():
+        if not isinstance(record.get("pub_date"), int):
+            record["pub_date"] = migrate_date(record.get("pub_date"))
+    return JsonStore(records, log)
+
+#FUNCTION Load Lazy
+def load_lazy(log:PartitionedLog=LOG)->LazyJsonStore:
+    """Opens the article archive reading only its id indexes
+
+    Args:
+        log (PartitionedLog | ArticleLog, optional): log to read. Defaults to LOG.
+
+    Returns:
+        jsondata (LazyJsonStore): store with just the ids loaded
+    """
+    return LazyJsonStore(log)
+
+#FUNCTION Load Historical
+def load_historical(backend:str="json", lazy:bool=False, retention:int=RETENTION_MONTHS):
+    """Opens the article store for the run.  The single file archives from
+    before partitioning are migrated the first time through.
+
+    Args:
+        backend (str, optional): "json" for the article log or "sqlite". Defaults to "json".
+        lazy (bool, optional): json backend only, start with just the id index. Defaults to False.
+        retention (int, optional): months of descriptions to keep. Defaults to RETENTION_MONTHS.
+
+    Returns:
+        jsondata (JsonStore | LazyJsonStore | SqliteStore): dict like store of saved articles
+    """
+    LOG.retention = retention
+    LOG.migrate()
+    if backend == "sqlite":
+        store = SqliteStore(DB_FP, retention)
+        migrate_sqlite(store)
+        return store
+    if lazy:
+        return load_lazy()
+    return load_json()
+
+#FUNCTION Save Data
+def save_data(jsond, new_ids:list):
+    """Persists the articles added or altered this run
+
+    Args:
+        jsond (JsonStore | LazyJsonStore | SqliteStore): Main data container
+        new_ids (list): ids added or altered this run
+    """
+    jsond.save(new_ids)
@@ -2,24 +2,15 @@ import os
 import time
 import json
 import shutil
+import sys
+import random
 import datetime
-import numpy as np
 import json
 from os.path import exists
 import logging
-
-#Progress bar fun
-from rich.progress import (
-    Progress,
-    BarColumn,
-    SpinnerColumn,
-    TextColumn,
-    TimeRemainingColumn,
-    TimeElapsedColumn
-)
-from rich.logging import RichHandler
-from rich.console import Console
+import threading
 from pathlib import Path, PurePath
+from urllib.parse import urlparse
 
 ################################# Emailing Funcs ####################################
 
@@ -31,7 +22,9 @@ def urlformat(urls: list) -> str:
 
     Args:
         urls (list): List of new listings found, where each item is a tuple:
-                     (link, site, category, title).
+                     (link, site, category, title, ...).  A 7th element of
+                     [(link, site), ...] (see neardup.collapse) is listed after
+                     the title as the other sources of the same story.
 
     Returns:
         str: HTML formatted string for emailing.
@@ -43,92 +36,51 @@ def urlformat(urls: list) -> str:
     links_html = ""
     prev_site_cat = None
 
-    for link, site, cat, title in urls:
+    for link, site, cat, title, *rest in urls:
         current_site_cat = (site, cat)
         if current_site_cat != prev_site_cat:
             if prev_site_cat is not None:
                 links_html += "</ol>\n" + "-" * 45 + "\n" 
             links_html += f"<br><i><b>{site} - {cat}</b></i>\n<ol>"
             prev_site_cat = current_site_cat
-        links_html += f"<li><a href='{link}'>{title}</a></li>"
+        also = ""
+        if len(rest) > 2 and rest[2]:
+            also = " <small>(also: " + ", ".join(f"<a href='{alt}'>{alt_site}</a>" for alt, alt_site in rest[2]) + ")</small>"
+        links_html += f"<li><a href='{link}'>{title}</a>{also}</li>"
 
     links_html += "</ol>" # close the final list.
     return links_html
 
-#FUNCTION Send email update
-def send_email_update(urls:str):
-    """[Function for sending an email.  Formats the url list into a basic email with said list]
+################################# URL Funcs ####################################
+#FUNCTION Host Key
+def host_key(url:str)->str:
+    """Reduces an address down to the host we'll be hitting so that
+    www.ice.gov and ice.gov are treated as the same server.
 
     Args:
-        url (str): [url of the news story]
+        url (str): site or feed address
 
     Returns:
-        [None]: [Just sends the email.  Doesn't return anything]
-    """	
-    import smtplib, ssl
-    from email.mime.text import MIMEText
-    from email.mime.multipart import MIMEMultipart
-    
-    def inputdatlink(urls:str):
-        html = """
-        <html>
-            <body>
-                <p>Helloooooooooooo,<br>
-                Rob wanted you to look at these new articles!<br>
-                """ + urls + """
-                </p>
-            </body>
-        </html>
-        """
-        return html
-
-    with open('./secret/login.txt') as login_file:
-        login = login_file.read().splitlines()
-        sender_email = login[0].split(':')[1]
-        password = login[1].split(':')[1]
-        receiver_email = login[2].split(':')[1].split(",")
-        
-    # Establish a secure session with gmail's outgoing SMTP server using your gmail account
-    smtp_server = "smtp.gmail.com"
-    port = 465 #used for a secure connection with SSL encryption#  #587 is the newer ver with TLS
-    html = inputdatlink(urls)
-
-    message = MIMEMultipart("alternative")
-    if "Forms Updates" in urls:
-        message["Subject"] = "FORMS FORMS FORMS!!! -> Immigration updates from Rob!"
-    else:
-        message["Subject"] = "Immigration Updates ala Rob!"
-    message["From"] = sender_email
-    message["To"] = ", ".join(receiver_email)   #multiple emails need to be comma separated strings
-    attachment = MIMEText(html, "html")
-    message.attach(attachment)
-    context = ssl.create_default_context()
-
-    with smtplib.SMTP_SSL(smtp_server, port, context=context) as server:
-        server.login(sender_email, password)		
-        server.sendmail(sender_email, receiver_email, message.as_string())
-
-################################# Timing Func ####################################
-def log_time(fn):
-    """Decorator timing function.  Accepts any function and returns a logging
-    statement with the amount of time it took to run. DJ, I use this code everywhere still.  Thank you bud!
+        host (str): bare hostname
+    """
+    host = urlparse(url).netloc.lower()
+    return host.removeprefix("www.")
+
+################################# Date Funcs ####################################
+#FUNCTION To Epoch
+def to_epoch(dt:datetime.datetime)->int:
+    """Canonical form for every stored date.  Integer seconds since the epoch
+    in UTC.  Naive datetimes (feeds that don't send a zone) are taken as UTC.
 
     Args:
-        fn (function): Input function you want to time
-    """	
-    def inner(*args, **kwargs):
-        tnow = time.time()
-        out = fn(*args, **kwargs)
-        te = time.time()
-        took = round(te - tnow, 2)
-        if took <= 60:
-            logging.warning(f"{fn.__name__} ran in {took:.2f}s")
-        elif took <= 3600:
-            logging.warning(f"{fn.__name__} ran in {(took)/60:.2f}m")		
-        else:
-            logging.warning(f"{fn.__name__} ran in {(took)/3600:.2f}h")
-        return out
-    return inner
+        dt (datetime): aware or naive datetime
+
+    Returns:
+        epoch (int): UTC epoch seconds
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return int(dt.timestamp())
 
 ################################# Logger functions ####################################
 #FUNCTION Logging Futures
@@ -146,7 +98,7 @@ def get_file_handler(log_dir:Path)->logging.FileHandler:
     file_handler.setFormatter(logging.Formatter(log_format, "%m-%d-%Y %H:%M:%S"))
     return file_handler
 
-def get_rich_handler(console:Console)-> RichHandler:
+def get_rich_handler(console)->logging.Handler:
     """Assigns the rich format that prints out to your terminal
 
     Args:
@@ -155,17 +107,46 @@ def get_rich_handler(console:Console)-> RichHandler:
     Returns:
         rh(RichHandler): This will format your terminal output
     """
+    from rich.logging import RichHandler
     rich_format = "|%(funcName)-14s|%(message)s "
     rh = RichHandler(console=console)
     rh.setFormatter(logging.Formatter(rich_format))
     return rh
 
-def get_logger(console:Console, log_dir:Path)->logging.Logger:
-    """Loads logger instance.  When given a path and access to the terminal output.  The logger will save a log of all records, as well as print it out to your terminal. Propogate set to False assigns all captured log messages to both handlers.
+#CLASS Lazy Handler
+class LazyHandler(logging.Handler):
+    """Stands in for the file and rich handlers until the first record is
+    logged.  Importing support (which every module does for the logger) then
+    costs nothing, rich and the log file only come in once something is said.
+    """
+    def __init__(self, log_dir:Path):
+        super().__init__(logging.INFO)
+        self.log_dir = log_dir
+
+    def emit(self, record:logging.LogRecord):
+        #handle() holds this handler's lock, so only the first record swaps the handlers in
+        root = logging.getLogger()
+        if self in root.handlers:
+            #A new list, the one the logger is looping over right now is left alone
+            root.handlers = [h for h in root.handlers if h is not self] + build_handlers(self.log_dir)
+        for handler in root.handlers:
+            if handler is not self and record.levelno >= handler.level:
+                handler.handle(record)
+
+#FUNCTION Build Handlers
+def build_handlers(log_dir:Path)->list:
+    """The file handler and the rich terminal handler, both at INFO"""
+    file_handler = get_file_handler(log_dir)
+    file_handler.setLevel(logging.INFO)
+    rich_handler = get_rich_handler(get_console())
+    rich_handler.setLevel(logging.INFO)
+    return [file_handler, rich_handler]
+
+def get_logger(log_dir:Path)->logging.Logger:
+    """Loads logger instance.  When given a path the logger will save a log of all records, as well as print it out to your terminal.  The handlers are only built when the first record comes in (see LazyHandler).
 
     Args:
         log_dir (Path): Path you want the logs saved
-        console (Console): Reference to your terminal
 
     Returns:
         logger: Returns custom logger object.  Info level reporting with a file handler and rich handler to properly terminal print
@@ -173,16 +154,22 @@ def get_logger(console:Console, log_dir:Path)->logging.Logger:
     #Load logger and set basic level
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
-    #Load file handler for how to format the log file.
-    file_handler = get_file_handler(log_dir)
-    file_handler.setLevel(logging.INFO)
-    logger.addHandler(file_handler)
-    rich_handler = get_rich_handler(console)
-    rich_handler.setLevel(logging.INFO)
-    logger.addHandler(rich_handler)
+    logger.addHandler(LazyHandler(log_dir))
     logger.propagate = False
     return logger
 
+#FUNCTION Get Console
+def get_console():
+    """The terminal console shared by the logger and the progress bars,
+    made (and rich imported) on first use
+    """
+    global console
+    with console_lock:
+        if console is None:
+            from rich.console import Console
+            console = Console(color_system="auto", stderr=True, width=200)
+    return console
+
 #FUNCTION get time
 def get_time():
     """Function for getting current time
@@ -205,15 +192,24 @@ def move_log():
     )
     if not exists(destination_path):
         os.makedirs(destination_path)
-    shutil.move(log_dir, destination_path)
+    #The file handler is only made when something is logged
+    if exists(log_dir):
+        shutil.move(log_dir, destination_path)
+    #The run's trace summary and metrics travel with its log
+    for suffix in (".trace.json", ".prom"):
+        companion = os.path.splitext(str(log_dir))[0] + suffix
+        if exists(companion):
+            shutil.move(companion, destination_path)
 
 
 ################################# Global Vars ####################################
 start_time = get_time().strftime("%m-%d-%Y_%H-%M-%S")
-console = Console(color_system="auto", stderr=True, width=200)
+#Made by get_console
+console = None
+console_lock = threading.Lock()
 log_dir = PurePath(Path.cwd(), Path(f'./data/logs/{start_time}.log'))
-logger = get_logger(log_dir=log_dir, console=console)
-chrome_version = np.random.randint(130, 142)
+logger = get_logger(log_dir=log_dir)
+chrome_version = random.randint(130, 141)
 
 #Additional USER agents
 USER_AGENTS = [
@@ -241,11 +237,13 @@ class NumpyArrayEncoder(json.JSONEncoder):
         json (object): Json serialized format
     """	
     def default(self, obj):
-        if isinstance(obj, np.integer):
+        #Only look for numpy types if something already imported numpy
+        np = sys.modules.get("numpy")
+        if np is not None and isinstance(obj, np.integer):
             return int(obj)
-        elif isinstance(obj, np.floating):
+        elif np is not None and isinstance(obj, np.floating):
             return float(obj)
-        elif isinstance(obj, np.ndarray):
+        elif np is not None and isinstance(obj, np.ndarray):
             return obj.tolist()
         elif isinstance(obj, str):
             return str(obj)
@@ -257,7 +255,7 @@ class NumpyArrayEncoder(json.JSONEncoder):
 ################################# Rich Spinner Control ####################################
 
 #FUNCTION sleep progbar
-def mainspinner(console:Console, totalstops:int):
+def mainspinner(console, totalstops:int):
     """Load a rich Progress bar for however many categories that will be searched
 
     Args:
@@ -268,6 +266,14 @@ def mainspinner(console:Console, totalstops:int):
         my_progress_bar (Progress): Progress bar for tracking overall progress
         jobtask (int): Job id for the main scraping job
     """    
+    #Progress bar fun
+    from rich.progress import (
+        Progress,
+        BarColumn,
+        SpinnerColumn,
+        TextColumn,
+        TimeElapsedColumn
+    )
     my_progress_bar = Progress(
         TextColumn("{task.description}"),
         SpinnerColumn("pong"),
@@ -285,71 +291,23 @@ def mainspinner(console:Console, totalstops:int):
     jobtask = my_progress_bar.add_task("[green]Checking RSS Feeds", total=totalstops + 1)
     return my_progress_bar, jobtask
 
-def add_spin_subt(prog:Progress, msg:str, howmanysleeps:int):
+def add_spin_subt(prog, msg:str, howmanysleeps:int):
     """Adds a secondary job to the main progress bar that will take a nap at each of the servers that are visited
 
     Args:
         prog (Progress): Main progress bar
         msg (str): Message to update secondary progress bar
-        howmanysleeps (int): How long to let the timer sleep
+        howmanysleeps (float): How long to let the timer sleep
     """
     #Add secondary task to progbar
     liljob = prog.add_task(f"[magenta]{msg}", total = howmanysleeps)
-    #Run job for random sleeps
-    for _ in range(howmanysleeps):
+    #Run job for random sleeps.  Whole seconds first then whatever is left over
+    whole, rest = divmod(howmanysleeps, 1)
+    for _ in range(int(whole)):
         time.sleep(1)
         prog.update(liljob, advance=1)
+    if rest:
+        time.sleep(rest)
+        prog.update(liljob, advance=rest)
     #Hide secondary progress bar
     prog.update(liljob, visible=False)
-
-################################# Date/Load/Save Funcs ####################################
-
-#FUNCTION Save Data
-def save_data(jsond:dict):
-    """This function saves the dictionary to a JSON file. 
-
-    Args:
-        jsond (dict): Main dictionary container
-    """    
-    # Sort by published date. U Have to sort it by string because some of the
-    # datetimes stored are timezone aware, some are not therefore you have to
-    # turn it into a Y-M-D string then split it on the ("-") so you can first 
-    # sort by year, then month, then day.
-    sorted_dict = dict(sorted(jsond.items(), key=lambda x:datetime.datetime.strftime(x[1]["pub_date"], "%Y-%m-%d").split("-"), reverse=True))
-    out_json = json.dumps(sorted_dict, indent=2, cls=NumpyArrayEncoder)
-    with open("./data/im_updates.json", "w") as out_f:
-        out_f.write(out_json)
-
-#FUNCTION Convert Date
-def date_convert(str_time:str)->datetime:
-    """When Loading the historical data.  Turn all the published dates into datetime objects so they can be sorted in the save routine. 
-
-    Args:
-        str_time (str): Converts a string to a datetime object 
-
-    Returns:
-        dateOb (datetime): str_time as a datetime object
-    """    
-    dateOb = datetime.datetime.strptime(str_time,'%m-%d-%Y_%H-%M-%S')
-    return dateOb
-
-#FUNCTION Load Historical
-def load_historical(fp:str)->json:
-    """Loads the saved JSON of previously scraped data.
-
-    Args:
-        fp (str): File path for saving
-
-    Returns:
-        jsondata (JSON): dictionary version of saved JSON
-    """    
-    if exists(fp):
-        with open(fp, "r") as f:
-            jsondata = json.loads(f.read())
-            #Quick format the pub date strings back to dates. 
-            #We need them as dates to sort them on the save above.
-            for key in jsondata.keys():
-                jsondata[key]["pub_date"] = date_convert(jsondata[key]["pub_date"])
-            return jsondata	
-
-
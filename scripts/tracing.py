@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from support import logger
+
+################################# Run Tracing ####################################
+#Lightweight hierarchical spans.  A run is broken into site / category spans
+#and the stages under them (fetch, wait, parse, dedupe, store, email).  Each
+#span keeps its wall time along with the bytes downloaded and items handled
+#inside it.  The current span rides in a contextvar so nested calls (client.get
+#inside ingest_xml inside a fetch worker) attach to the right parent.
+METRIC_PREFIX = "newsbyrob"
+CURRENT = contextvars.ContextVar("span", default=None)
+
+#CLASS Span
+class Span():
+    """One timed section of the run
+
+    Args:
+        name (str): stage name (run, site, category, fetch, parse...)
+        labels (dict): identifying labels (site, cat, host)
+        parent (Span, optional): enclosing span. Defaults to None.
+    """
+    def __init__(self, name:str, labels:dict, parent=None):
+        self.name = name
+        self.labels = labels
+        self.parent = parent
+        self.children = []
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.bytes = 0
+        self.items = 0
+        if parent is not None:
+            with parent.lock:
+                parent.children.append(self)
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.start
+
+    def all_labels(self)->dict:
+        """Labels from this span and every span above it"""
+        labels = self.parent.all_labels() if self.parent is not None else {}
+        labels.update(self.labels)
+        return labels
+
+    def walk(self)->iter:
+        yield self
+        for child in list(self.children):
+            yield from child.walk()
+
+    def find(self, name:str, **labels):
+        """First span under this one with that name and labels (its own or inherited)"""
+        for span in self.walk():
+            if span.name == name:
+                inherited = span.all_labels()
+                if all(inherited.get(k) == v for k, v in labels.items()):
+                    return span
+
+    def totals(self)->tuple:
+        """(bytes, items) counted here plus everything underneath"""
+        nbytes, items = self.bytes, self.items
+        for child in list(self.children):
+            cbytes, citems = child.totals()
+            nbytes += cbytes
+            items += citems
+        return nbytes, items
+
+    def to_dict(self)->dict:
+        nbytes, items = self.totals()
+        return {
+            "name"    :self.name,
+            "labels"  :self.labels,
+            "seconds" :round(self.seconds if self.seconds is not None else time.perf_counter() - self.start, 4),
+            "bytes"   :nbytes,
+            "items"   :items,
+            "children":[child.to_dict() for child in list(self.children)],
+        }
+
+################################# Span Helpers ####################################
+#FUNCTION Span
+@contextmanager
+def span(name:str, parent:Span=None, **labels):
+    """Times the enclosed block as a child of the current span (or parent)
+
+    Args:
+        name (str): stage name
+        parent (Span, optional): attach here instead of the current span. Defaults to None.
+
+    Yields:
+        span (Span): the open span, for add_bytes / add_items
+    """
+    current = Span(name, labels, parent if parent is not None else CURRENT.get())
+    token = CURRENT.set(current)
+    try:
+        yield current
+    finally:
+        current.finish()
+        CURRENT.reset(token)
+
+def current()->Span:
+    return CURRENT.get()
+
+def add_bytes(nbytes:int):
+    """Counts downloaded bytes against the current span"""
+    active = CURRENT.get()
+    if active is not None:
+        with active.lock:
+            active.bytes += nbytes
+
+def add_items(count:int):
+    """Counts items handled against the current span"""
+    active = CURRENT.get()
+    if active is not None:
+        with active.lock:
+            active.items += count
+
+def find(name:str, **labels)->Span:
+    """Looks up a span anywhere in the current run"""
+    active = CURRENT.get()
+    while active is not None and active.parent is not None:
+        active = active.parent
+    return active.find(name, **labels) if active is not None else None
+
+################################# Run Summary ####################################
+#FUNCTION Summarize
+def summarize(root:Span)->dict:
+    """Flattens the tree into one row per (stage, labels) so repeated spans
+    (retries, several categories on a site) add up.
+
+    Returns:
+        rows (dict): (name, labels) -> {seconds, bytes, items, count}
+    """
+    rows = {}
+    for node in root.walk():
+        key = (node.name, tuple(sorted(node.all_labels().items())))
+        row = rows.setdefault(key, {"seconds":0.0, "bytes":0, "items":0, "count":0})
+        row["seconds"] += node.seconds or 0.0
+        row["bytes"] += node.bytes
+        row["items"] += node.items
+        row["count"] += 1
+    return rows
+
+#FUNCTION Prometheus Text
+def prometheus_text(root:Span)->str:
+    """Renders the run as a Prometheus textfile collector file"""
+    def escape(value)->str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+    def fmt(labels:tuple)->str:
+        return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+    rows = summarize(root)
+    lines = []
+    metrics = (
+        ("span_seconds", "seconds", "Wall time spent in each stage of the last run"),
+        ("span_bytes", "bytes", "Bytes downloaded inside each stage of the last run"),
+        ("span_items", "items", "Items handled by each stage of the last run"),
+        ("span_count", "count", "How many times each stage ran in the last run"),
+    )
+    for metric, field, help_text in metrics:
+        lines.append(f"# HELP {METRIC_PREFIX}_{metric} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{metric} gauge")
+        for (name, labels), row in rows.items():
+            value = round(row[field], 4) if field == "seconds" else row[field]
+            lines.append(f"{METRIC_PREFIX}_{metric}{fmt((('span', name),) + labels)} {value}")
+    lines.append(f"# HELP {METRIC_PREFIX}_last_run_timestamp_seconds When the last run finished")
+    lines.append(f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge")
+    lines.append(f"{METRIC_PREFIX}_last_run_timestamp_seconds {int(time.time())}")
+    return "\n".join(lines) + "\n"
+
+#FUNCTION Write Summary
+def write_summary(root:Span, log_fp:str):
+    """Writes the span tree as JSON and a Prometheus textfile next to the run
+    log (same name, .trace.json and .prom)
+
+    Args:
+        root (Span): the finished run span
+        log_fp (str): path of the run log
+    """
+    base = os.path.splitext(str(log_fp))[0]
+    with open(base + ".trace.json", "w") as out_f:
+        out_f.write(json.dumps(root.to_dict(), indent=2))
+    tmp = base + ".prom.tmp"
+    with open(tmp, "w") as out_f:
+        out_f.write(prometheus_text(root))
+    os.replace(tmp, base + ".prom")
+    logger.info(f"Run took {root.seconds:.2f}s")
+    for stage in root.children:
+        nbytes, items = stage.totals()
+        logger.info(f"{stage.name:<9}{' '.join(f'{v}' for v in stage.labels.values()):<12} {stage.seconds:7.2f}s {nbytes / 1e3:9.1f}KB {items:>5} items")
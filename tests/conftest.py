@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+################################# Test Setup ####################################
+#The modules live in scripts/ and are imported flat, the way main.py imports
+#them.  Everything relative (./data/logs for the logger, the module level
+#stores) is pointed at a scratch directory before any of them is imported.
+#The move happens in pytest_configure, once pytest has found the tests.
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS)
+
+def pytest_configure(config):
+    workdir = tempfile.mkdtemp(prefix="newsbyrob-tests-")
+    os.makedirs(os.path.join(workdir, "data", "logs"))
+    os.chdir(workdir)
@@ -0,0 +1,34 @@
+import filters
+
+def route(rules:dict, title:str, recipients:list=("a", "b"))->list:
+    """Recipients that get a story with this title"""
+    mask = filters.FilterEngine(list(recipients), rules).route_one({"title":title})
+    return [recipient for bit, recipient in enumerate(recipients) if mask >> bit & 1]
+
+################################# Overlapping Terms ####################################
+def test_longer_term_matches_first():
+    rules = {"a":{"include":["removal proceedings"]}, "b":{"include":["removal"]}}
+    #One match on the longer term still counts for the shorter one inside it
+    assert route(rules, "New guidance on removal proceedings") == ["a", "b"]
+    assert route(rules, "Removal numbers rise") == ["b"]
+
+def test_exclude_inside_a_longer_include():
+    rules = {"a":{"include":["removal proceedings"], "exclude":["removal"]}, "b":{}}
+    #a's exclude of "removal" still applies when the match was "removal proceedings"
+    assert route(rules, "New guidance on removal proceedings") == ["b"]
+
+def test_include_inside_a_longer_exclude():
+    rules = {"a":{"include":["asylum"]}, "b":{"exclude":["asylum seekers"]}}
+    assert route(rules, "Asylum seekers at the border") == ["a"]
+    assert route(rules, "Asylum office backlog") == ["a", "b"]
+
+def test_whole_words_only():
+    rules = {"a":{"include":["visa"]}, "b":{"exclude":["visa"]}}
+    #"visas" isn't "visa", so a doesn't get it and b isn't blocked
+    assert route(rules, "Visas on hold") == ["b"]
+    assert route(rules, "Visa bulletin") == ["a"]
+
+def test_field_terms_only_match_their_field():
+    engine = filters.FilterEngine(["a"], {"a":{"exclude":["title:removal"]}})
+    assert engine.route_one({"title":"Removal update"}) == 0
+    assert engine.route_one({"title":"Update", "description":"removal"}) == 1
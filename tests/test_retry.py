@@ -0,0 +1,89 @@
+import pytest
+import retry
+
+def board(tmp_path)->retry.BreakerBoard:
+    return retry.BreakerBoard(str(tmp_path / "breakers.json"))
+
+def trip(breakers:retry.BreakerBoard, host:str):
+    for _ in range(retry.FAILURE_THRESHOLD):
+        breakers.allow(host)
+        breakers.failure(host)
+
+################################# Circuit Breaker ####################################
+def test_opens_after_threshold(tmp_path):
+    breakers = board(tmp_path)
+    for _ in range(retry.FAILURE_THRESHOLD - 1):
+        breakers.failure("uscis.gov")
+    breakers.allow("uscis.gov")
+    breakers.failure("uscis.gov")
+    with pytest.raises(retry.CircuitOpen):
+        breakers.allow("uscis.gov")
+    #Other hosts are unaffected
+    breakers.allow("ice.gov")
+
+def test_success_resets_failure_count(tmp_path):
+    breakers = board(tmp_path)
+    for _ in range(retry.FAILURE_THRESHOLD - 1):
+        breakers.failure("uscis.gov")
+    breakers.success("uscis.gov")
+    breakers.failure("uscis.gov")
+    breakers.allow("uscis.gov")
+
+def test_half_open_trial_closes_on_success(tmp_path, monkeypatch):
+    breakers = board(tmp_path)
+    trip(breakers, "uscis.gov")
+    now = retry.time.time()
+    monkeypatch.setattr(retry.time, "time", lambda: now + retry.COOLDOWN + 1)
+    #One trial goes through, anything else waits on it
+    breakers.allow("uscis.gov")
+    assert breakers.state("uscis.gov")["state"] == "half_open"
+    with pytest.raises(retry.CircuitOpen):
+        breakers.allow("uscis.gov")
+    breakers.success("uscis.gov")
+    assert breakers.state("uscis.gov")["state"] == "closed"
+    breakers.allow("uscis.gov")
+
+def test_half_open_trial_failure_doubles_cooldown(tmp_path, monkeypatch):
+    breakers = board(tmp_path)
+    trip(breakers, "uscis.gov")
+    now = retry.time.time() + retry.COOLDOWN + 1
+    monkeypatch.setattr(retry.time, "time", lambda: now)
+    breakers.allow("uscis.gov")
+    breakers.failure("uscis.gov")
+    state = breakers.state("uscis.gov")
+    assert state["state"] == "open" and state["cooldown"] == 2 * retry.COOLDOWN
+    #Still open after the first cooldown, half open after the doubled one
+    monkeypatch.setattr(retry.time, "time", lambda: now + retry.COOLDOWN + 1)
+    with pytest.raises(retry.CircuitOpen):
+        breakers.allow("uscis.gov")
+    monkeypatch.setattr(retry.time, "time", lambda: now + 2 * retry.COOLDOWN + 1)
+    breakers.allow("uscis.gov")
+
+def test_state_survives_a_restart(tmp_path):
+    breakers = board(tmp_path)
+    trip(breakers, "uscis.gov")
+    breakers.save()
+    with pytest.raises(retry.CircuitOpen):
+        board(tmp_path).allow("uscis.gov")
+
+def test_trial_left_half_open_by_a_dead_run_reopens(tmp_path, monkeypatch):
+    breakers = board(tmp_path)
+    trip(breakers, "uscis.gov")
+    monkeypatch.setattr(retry.time, "time", lambda: breakers.state("uscis.gov")["opened_at"] + retry.COOLDOWN + 1)
+    breakers.allow("uscis.gov")
+    breakers.save()
+    assert board(tmp_path).state("uscis.gov")["state"] == "open"
+
+def test_call_skips_an_open_host(tmp_path, monkeypatch):
+    monkeypatch.setattr(retry, "BREAKERS", board(tmp_path))
+    monkeypatch.setattr(retry.time, "sleep", lambda seconds: None)
+    sent = []
+    def send():
+        sent.append(1)
+        return 503, {}, None
+    for _ in range(retry.FAILURE_THRESHOLD):
+        retry.call("https://www.uscis.gov/feed", send)
+    assert len(sent) == retry.FAILURE_THRESHOLD * retry.ATTEMPTS
+    with pytest.raises(retry.CircuitOpen):
+        retry.call("https://www.uscis.gov/feed", send)
+    assert len(sent) == retry.FAILURE_THRESHOLD * retry.ATTEMPTS
@@ -0,0 +1,93 @@
+import os
+import time
+import storage
+
+def records(*ids:str)->dict:
+    return {idx:{"title":f"Story {idx}", "pub_date":1700000000 + n, "source":"https://www.uscis.gov"} for n, idx in enumerate(ids)}
+
+################################# Article Log ####################################
+def test_scan_trims_torn_last_line(tmp_path):
+    log = storage.ArticleLog(str(tmp_path / "log.jsonl"))
+    log.append(records("a", "b"))
+    size = os.path.getsize(log.fp)
+    #A crash mid append leaves half a record with no newline
+    with open(log.fp, "a") as f:
+        f.write('{"id": "c", "title": "Sto')
+
+    assert [idx for idx, _ in log.scan()] == ["a", "b"]
+    assert os.path.getsize(log.fp) == size
+
+    #The next append starts on a clean line
+    log.append(records("d"))
+    assert list(log.load()) == ["a", "b", "d"]
+
+def test_stale_index_is_rebuilt(tmp_path):
+    log = storage.ArticleLog(str(tmp_path / "log.jsonl"))
+    log.append(records("a", "b"))
+    #A crash between the log append and the index append: the log has a line the index doesn't
+    with open(log.fp, "a") as f:
+        f.write('{"id": "c", "title": "Story c"}\n')
+    past = time.time() - 60
+    os.utime(log.index_fp, (past, past))
+
+    assert log.load_ids() == ["a", "b", "c"]
+    with open(log.index_fp) as f:
+        assert f.read().split() == ['"a"', '"b"', '"c"']
+
+def test_fresh_index_is_trusted(tmp_path):
+    log = storage.ArticleLog(str(tmp_path / "log.jsonl"))
+    log.append(records("a", "b"))
+    #Index newer than the log, so it's read as is rather than rebuilt from the log
+    with open(log.index_fp, "a") as f:
+        f.write('"only-in-index"\n')
+    assert log.load_ids() == ["a", "b", "only-in-index"]
+
+################################# Partitioned Log ####################################
+def archive_files(root)->list:
+    return sorted(str(fp.relative_to(root)) for fp in root.rglob("*") if fp.is_file())
+
+def test_finished_month_rolls_over(tmp_path):
+    log = storage.PartitionedLog(str(tmp_path))
+    #Stored in a month that's since ended
+    os.makedirs(tmp_path / "2024")
+    log.partition(2024, 1).append(records("a", "b"))
+    log.append(records("c"))
+    log.maintain()
+
+    year, month = log.month_key()
+    assert archive_files(tmp_path) == sorted([
+        "2024/01.ids", "2024/01.jsonl.gz",
+        f"{year}/{month:02d}.ids", f"{year}/{month:02d}.jsonl",
+    ])
+    #The closed month's index isn't mistaken for stale and everything still reads back
+    assert sorted(log.load_ids()) == ["a", "b", "c"]
+    assert sorted(log.load()) == ["a", "b", "c"]
+
+def test_restored_record_wins_over_closed_month(tmp_path):
+    log = storage.PartitionedLog(str(tmp_path))
+    os.makedirs(tmp_path / "2024")
+    log.partition(2024, 1).append(records("a"))
+    log.maintain()
+    log.append({"a":{"title":"Story a, updated", "pub_date":1700000000}})
+    assert log.load()["a"]["title"] == "Story a, updated"
+
+def test_retention_prunes_descriptions_of_old_closed_months(tmp_path):
+    log = storage.PartitionedLog(str(tmp_path), retention=6)
+    os.makedirs(tmp_path / "2024")
+    old = {idx:dict(record, description="Long body") for idx, record in records("a", "b").items()}
+    log.partition(2024, 1).append(old)
+    log.append({"c":{"title":"Story c", "description":"Current body", "pub_date":1700000000}})
+    log.maintain()
+
+    assert "2024/01.pruned.jsonl.gz" in archive_files(tmp_path)
+    assert "2024/01.jsonl.gz" not in archive_files(tmp_path)
+    loaded = log.load()
+    #Ids and the rest of the record stay, only the old descriptions go
+    assert sorted(loaded) == ["a", "b", "c"]
+    assert "description" not in loaded["a"] and loaded["a"]["title"] == "Story a"
+    assert loaded["c"]["description"] == "Current body"
+
+    #Pruned once, a second pass leaves it alone
+    before = os.path.getmtime(tmp_path / "2024" / "01.pruned.jsonl.gz")
+    log.maintain()
+    assert os.path.getmtime(tmp_path / "2024" / "01.pruned.jsonl.gz") == before